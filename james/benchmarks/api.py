@@ -0,0 +1,234 @@
+"""
+Benchmark of the HTTP API, driven in-process through the WSGI application.
+
+Seeds a database with ``--loans`` loans and ``--payments`` payments per loan,
+then times ``--requests`` requests to each of the ``add_loan``,
+``add_payment`` and ``balance`` routes and reports their throughput,
+latency percentiles and queries per request as JSON, e.g.::
+
+    python -m benchmarks.api --loans 10000 --payments 24 --output before.json
+    python -m benchmarks.compare before.json after.json
+
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import event, select
+import webtest
+
+from benchmarks.seed import seed
+from james import main as make_app
+from james.models import Loan
+
+API_KEY = 'benchmark'
+
+
+class QueryCounter(object):
+    """ Counts the statements executed by an engine. """
+
+    def __init__(self, engine):
+        self.count = 0
+        self.lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self.before_execute)
+
+    def before_execute(self, *args):
+        with self.lock:
+            self.count += 1
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def latency_percentiles(latencies):
+    """
+    Return the p50, p95 and p99 of ``latencies``, in milliseconds, or
+    ``None`` for each of them without any latency.
+
+    """
+    result = {}
+    for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+        value = percentile(latencies, fraction)
+        result[name] = None if value is None else round(value, 3)
+    return result
+
+
+def measure(name, requests, counter, threads=1):
+    """
+    Run every callable of ``requests``, spread over ``threads`` threads, and
+    return the statistics of their latencies, of their errors and of the
+    queries they executed.
+
+    """
+    latencies = []
+    errors = []
+    pending = iter(requests)
+    lock = threading.Lock()
+    queries = counter.count
+
+    def work():
+        while True:
+            with lock:
+                request = next(pending, None)
+            if request is None:
+                return
+            start = time.time()
+            try:
+                request()
+            except Exception as e:
+                errors.append(e)
+            latencies.append((time.time() - start) * 1000)
+
+    started = time.time()
+    workers = [threading.Thread(target=work) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    elapsed = time.time() - started
+    count = len(latencies)
+
+    return {
+        'route': name,
+        'requests': count,
+        'errors': len(errors),
+        'seconds': round(elapsed, 4),
+        'throughput': round(count / elapsed, 2) if elapsed else None,
+        'latency_ms': latency_percentiles(latencies),
+        'queries_per_request': round(
+            float(counter.count - queries) / count, 2) if count else None,
+    }
+
+
+def run(loans, payments, requests, settings=None, url=None, threads=1):
+    directory = None
+    if url is None:
+        directory = tempfile.mkdtemp()
+        url = 'sqlite:///{}'.format(os.path.join(directory, 'james.sqlite'))
+
+    app_settings = {
+        'sqlalchemy.url': url,
+        'auth.secret': 'benchmark',
+        'api.key': API_KEY,
+    }
+    app_settings.update(settings or {})
+
+    try:
+        app = make_app({}, **app_settings)
+        engine = app.registry['dbsession_factory'].kw['bind']
+
+        seeding = time.time()
+        loan_ids = seed(engine, loans, payments)
+        seeding = time.time() - seeding
+
+        counter = QueryCounter(engine)
+        testapp = webtest.TestApp(app)
+        headers = {'authorization': hashlib.sha256(
+            API_KEY.encode('utf-8')).hexdigest()}
+        rng = random.Random(1)
+
+        def post(url, data):
+            return lambda: testapp.post(url, json.dumps(data),
+                                        headers=headers)
+
+        add_loan = [post('/loans', {'amount': 1000, 'term': 12, 'rate': 0.05,
+                                    'date': '2017-08-05 02:18Z'})
+                    for i in range(requests)]
+
+        # one payment on the month after the last seeded one of each loan
+        paid = rng.sample(loan_ids, min(requests, len(loan_ids)))
+        add_payment = []
+        for loan_id in paid:
+            date, value = engine.execute(select(
+                [Loan.date, Loan.installment]).where(
+                Loan.loan_id == loan_id)).first()
+            month = date.month - 1 + payments
+            date = date.replace(year=date.year + month // 12,
+                                month=month % 12 + 1, day=min(date.day, 28))
+            add_payment.append(post(
+                '/loans/{}/payments'.format(loan_id),
+                {'payment': 'made', 'date': date.isoformat(),
+                 'amount': value}))
+
+        balance = [post('/loans/{}/balance'.format(rng.choice(loan_ids)),
+                        {'date': '2030-01-01'})
+                   for i in range(requests)]
+
+        results = [measure('add_loan', add_loan, counter, threads),
+                   measure('add_payment', add_payment, counter, threads),
+                   measure('balance', balance, counter, threads)]
+    finally:
+        if directory:
+            shutil.rmtree(directory)
+
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'database': url.split(':', 1)[0],
+        'settings': settings or {},
+        'threads': threads,
+        'loans': loans,
+        'payments_per_loan': payments,
+        'seconds_to_seed': round(seeding, 2),
+        'results': results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--loans', type=int, default=1000)
+    parser.add_argument('--payments', type=int, default=12,
+                        help='payments per loan')
+    parser.add_argument('--requests', type=int, default=500,
+                        help='requests per route')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='threads sending the requests concurrently')
+    parser.add_argument('--url', help='database URL, a temporary SQLite '
+                                      'database by default')
+    parser.add_argument('--setting', action='append', default=[],
+                        metavar='KEY=VALUE',
+                        help='application setting, may be repeated')
+    parser.add_argument('--output', help='file to write the JSON report to')
+    return parser.parse_args(argv)
+
+
+def main(argv=sys.argv[1:]):
+    args = parse_args(argv)
+    settings = dict(setting.split('=', 1) for setting in args.setting)
+
+    report = run(args.loans, args.payments, args.requests, settings, args.url,
+                 args.threads)
+    output = json.dumps(report, indent=2, sort_keys=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
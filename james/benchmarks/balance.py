@@ -0,0 +1,168 @@
+"""
+Benchmark of the balance-as-of query on a large payment table.
+
+Seeds a SQLite database with ``--loans`` loans of ``--payments`` payments
+each, then times ``--queries`` counts of the made payments of a random loan
+up to a random date of its history, as ``calculate_balance`` runs them:
+
+- ``before``: with the single column indexes on ``payment.loan_id``,
+  ``payment.payment`` and ``payment.date`` and ``func.date(date) <= day``;
+- ``after``: with the ``(loan_id, payment, date)`` index and
+  ``date < end_of(day)``.
+
+and reports their latency percentiles and query plans as JSON, e.g.::
+
+    python -m benchmarks.balance --loans 27778 --payments 360
+
+"""
+import argparse
+from datetime import timedelta
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from sqlalchemy import and_, create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.api import git_commit, latency_percentiles
+from benchmarks.seed import seed
+from james.models import Loan, Payment
+from james.models.loan import end_of
+
+INDEX = 'ix_payment_loan_id_payment_date'
+REDUNDANT = (('ix_payment_loan_id', 'loan_id'),
+             ('ix_payment_payment', 'payment'))
+
+
+def single_column_indexes(engine):
+    engine.execute('DROP INDEX IF EXISTS {}'.format(INDEX))
+    for index, column in REDUNDANT:
+        engine.execute('CREATE INDEX IF NOT EXISTS {} ON payment ({})'.format(
+            index, column))
+    engine.execute('ANALYZE')
+
+
+def composite_index(engine):
+    engine.execute('CREATE INDEX IF NOT EXISTS {} ON payment '
+                   '(loan_id, payment, date)'.format(INDEX))
+    for index, _ in REDUNDANT:
+        engine.execute('DROP INDEX IF EXISTS {}'.format(index))
+    engine.execute('ANALYZE')
+
+
+def function_filter(day):
+    return func.date(Payment.date) <= day
+
+
+def sargable_filter(day):
+    return Payment.date < end_of(day)
+
+
+LAYOUTS = (
+    ('before', single_column_indexes, function_filter),
+    ('after', composite_index, sargable_filter),
+)
+
+
+def count_made(loan_id, day, date_filter):
+    return select([func.count(Payment.id)]).where(and_(
+        Payment.loan_id == loan_id, Payment.payment == 'made',
+        date_filter(day)))
+
+
+def measure(connection, name, samples, date_filter):
+    latencies = []
+    for loan_id, day in samples:
+        start = time.time()
+        connection.execute(count_made(loan_id, day, date_filter)).scalar()
+        latencies.append((time.time() - start) * 1000)
+
+    plan = []
+    if samples:
+        loan_id, day = samples[0]
+        statement = count_made(loan_id, day, date_filter).compile(
+            connection, compile_kwargs={'literal_binds': True})
+        plan = [str(row[-1]) for row in connection.execute(
+            'EXPLAIN QUERY PLAN {}'.format(statement))]
+
+    return {
+        'layout': name,
+        'queries': len(latencies),
+        'latency_ms': latency_percentiles(latencies),
+        'plan': plan,
+    }
+
+
+def run(loans, payments, queries):
+    directory = tempfile.mkdtemp()
+    url = 'sqlite:///{}'.format(os.path.join(directory, 'james.sqlite'))
+
+    try:
+        engine = create_engine(url)
+        seeding = time.time()
+        seed(engine, loans, payments)
+        seeding = time.time() - seeding
+
+        session = sessionmaker(bind=engine)()
+        rng = random.Random(1)
+        samples = []
+        for i in range(queries):
+            id, date = session.query(Loan.id, Loan.date).filter(
+                Loan.id == rng.randint(1, loans)).one()
+            samples.append((id, date.date() + timedelta(
+                days=rng.randint(0, payments * 30))))
+        session.close()
+
+        results = []
+        for name, layout, date_filter in LAYOUTS:
+            layout(engine)
+            with engine.connect() as connection:
+                # once to warm the page cache, then timed
+                measure(connection, name, samples, date_filter)
+                results.append(measure(connection, name, samples,
+                                       date_filter))
+
+        rows = engine.execute('SELECT count(*) FROM payment').scalar()
+        engine.dispose()
+    finally:
+        shutil.rmtree(directory)
+
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'loans': loans,
+        'payments_per_loan': payments,
+        'payment_rows': rows,
+        'seconds_to_seed': round(seeding, 2),
+        'results': results,
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--loans', type=int, default=10000)
+    parser.add_argument('--payments', type=int, default=120,
+                        help='payments per loan')
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--output', help='file to write the JSON report to')
+    return parser.parse_args(argv)
+
+
+def main(argv=sys.argv[1:]):
+    args = parse_args(argv)
+    report = run(args.loans, args.payments, args.queries)
+    output = json.dumps(report, indent=2, sort_keys=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Compare two reports of ``benchmarks.api``, printing the change of every
+metric of every route from the first report to the second.
+
+"""
+import json
+import sys
+
+
+def metrics(report):
+    result = {}
+    for route in report['results']:
+        result[route['route']] = {
+            'throughput': route['throughput'],
+            'p50': route['latency_ms']['p50'],
+            'p95': route['latency_ms']['p95'],
+            'p99': route['latency_ms']['p99'],
+            'queries': route['queries_per_request'],
+        }
+    return result
+
+
+def main(argv=sys.argv[1:]):
+    if len(argv) != 2:
+        print('usage: python -m benchmarks.compare <before.json> '
+              '<after.json>')
+        sys.exit(1)
+
+    with open(argv[0]) as f:
+        before = metrics(json.load(f))
+    with open(argv[1]) as f:
+        after = metrics(json.load(f))
+
+    print('{:<14}{:<12}{:>12}{:>12}{:>10}'.format(
+        'route', 'metric', 'before', 'after', 'change'))
+    for route in sorted(set(before) & set(after)):
+        for name in ('throughput', 'p50', 'p95', 'p99', 'queries'):
+            old, new = before[route][name], after[route][name]
+            # None where a run had no sample to measure
+            change = ('{:+.1%}'.format((new - old) / old)
+                      if old and new is not None else '-')
+            print('{:<14}{:<12}{:>12}{:>12}{:>10}'.format(
+                route, name, 'n/a' if old is None else old,
+                'n/a' if new is None else new, change))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Benchmark of the throughput of ``serve_james`` by number of worker processes.
+
+For every count of ``--workers``, seeds a SQLite database, starts the server
+on it and sends ``--requests`` requests to each of the ``balance`` and
+``add_payment`` routes from ``--clients`` client processes over HTTP, then
+reports the throughput and latency percentiles of each as JSON, e.g.::
+
+    python -m benchmarks.workers --workers 1,2,4 --output workers.json
+
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, select
+
+from benchmarks.api import API_KEY, git_commit, latency_percentiles
+from benchmarks.seed import seed
+from james.models import Loan
+
+try:
+    from httplib import HTTPConnection
+except ImportError:  # Python 3
+    from http.client import HTTPConnection
+
+CONFIG = """\
+[app:main]
+use = call:james:main
+sqlalchemy.url = {url}
+auth.secret = benchmark
+api.key = {key}
+server.workers = {workers}
+{settings}
+
+[server:main]
+use = egg:waitress#main
+listen = 127.0.0.1:{port}
+threads = {threads}
+"""
+
+SERVER = 'import sys; from james.scripts.serve import main; main(sys.argv)'
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_for(port, timeout=30):
+    """ Wait until a worker of the server on ``port`` answers requests. """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/')
+            connection.getresponse().read()
+            connection.close()
+            return
+        except (socket.error, socket.timeout):
+            time.sleep(0.1)
+    raise RuntimeError('The server did not start on port {}.'.format(port))
+
+
+def client(args):
+    """ Send the ``(path, data)`` requests, returning their latencies. """
+    port, requests = args
+    headers = {'authorization': hashlib.sha256(
+                   API_KEY.encode('utf-8')).hexdigest(),
+               'content-type': 'application/json'}
+    connection = HTTPConnection('127.0.0.1', port)
+    latencies = []
+    errors = 0
+
+    for path, data in requests:
+        start = time.time()
+        connection.request('POST', path, json.dumps(data), headers)
+        response = connection.getresponse()
+        response.read()
+        latencies.append((time.time() - start) * 1000)
+        if response.status != 200:
+            errors += 1
+
+    connection.close()
+    return latencies, errors
+
+
+def measure(name, requests, port, clients):
+    """ Spread ``requests`` over ``clients`` processes and time them. """
+    shares = [(port, requests[i::clients]) for i in range(clients)]
+    pool = multiprocessing.Pool(clients)
+    try:
+        started = time.time()
+        results = pool.map(client, shares)
+        elapsed = time.time() - started
+    finally:
+        pool.close()
+        pool.join()
+
+    latencies = [latency for share, _ in results for latency in share]
+    count = len(latencies)
+
+    return {
+        'route': name,
+        'requests': count,
+        'errors': sum(errors for _, errors in results),
+        'seconds': round(elapsed, 4),
+        'throughput': round(count / elapsed, 2) if elapsed else None,
+        'latency_ms': latency_percentiles(latencies),
+    }
+
+
+def payments(engine, loan_ids, months):
+    """ One payment on the month after the last seeded one of each loan. """
+    requests = []
+    for loan_id in loan_ids:
+        date, value = engine.execute(select(
+            [Loan.date, Loan.installment]).where(
+            Loan.loan_id == loan_id)).first()
+        month = date.month - 1 + months
+        date = date.replace(year=date.year + month // 12,
+                            month=month % 12 + 1, day=min(date.day, 28))
+        requests.append(('/loans/{}/payments'.format(loan_id),
+                         {'payment': 'made', 'date': date.isoformat(),
+                          'amount': value}))
+    return requests
+
+
+def run_workers(workers, loans, months, requests, clients, threads,
+                settings):
+    directory = tempfile.mkdtemp()
+    url = 'sqlite:///{}'.format(os.path.join(directory, 'james.sqlite'))
+    port = free_port()
+    server = None
+
+    try:
+        engine = create_engine(url)
+        loan_ids = seed(engine, loans, months)
+        rng = random.Random(1)
+
+        balance = [('/loans/{}/balance'.format(rng.choice(loan_ids)),
+                    {'date': '2030-01-01'}) for i in range(requests)]
+        add_payment = payments(
+            engine, rng.sample(loan_ids, min(requests, len(loan_ids))), months)
+        engine.dispose()
+
+        config = os.path.join(directory, 'benchmark.ini')
+        with open(config, 'w') as f:
+            f.write(CONFIG.format(
+                url=url, key=API_KEY, workers=workers, port=port,
+                threads=threads, settings='\n'.join(
+                    '{} = {}'.format(*item) for item in settings.items())))
+
+        server = subprocess.Popen([sys.executable, '-c', SERVER, config],
+                                  stdout=subprocess.PIPE)
+        wait_for(port)
+
+        return {
+            'workers': workers,
+            'results': [measure('balance', balance, port, clients),
+                        measure('add_payment', add_payment, port, clients)],
+        }
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(directory)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--workers', default='1,2,4',
+                        help='comma separated counts of worker processes')
+    parser.add_argument('--loans', type=int, default=1000)
+    parser.add_argument('--payments', type=int, default=12,
+                        help='payments per loan')
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='requests per route')
+    parser.add_argument('--clients', type=int, default=8,
+                        help='client processes sending the requests')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='waitress threads per worker')
+    parser.add_argument('--setting', action='append', default=[],
+                        metavar='KEY=VALUE',
+                        help='application setting, may be repeated')
+    parser.add_argument('--output', help='file to write the JSON report to')
+    return parser.parse_args(argv)
+
+
+def main(argv=sys.argv[1:]):
+    args = parse_args(argv)
+    settings = dict(setting.split('=', 1) for setting in args.setting)
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'cpus': multiprocessing.cpu_count(),
+        'clients': args.clients,
+        'threads': args.threads,
+        'loans': args.loans,
+        'payments_per_loan': args.payments,
+        'settings': settings,
+        'runs': [run_workers(int(workers), args.loans, args.payments,
+                             args.requests, args.clients, args.threads,
+                             settings)
+                 for workers in args.workers.split(',')],
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+import sys
+
+# Alembic's environment and revisions only run through alembic
+collect_ignore = ['james/alembic']
+
+# the ASGI application is written for Python 3 only
+if sys.version_info < (3, 6):
+    collect_ignore.append('james/asgi.py')
@@ -22,7 +22,10 @@ def main(global_config, **settings):
     config = Configurator(settings=settings)
     config.include('pyramid_jinja2')
     config.include('.models')
+    config.include('.writes')
+    config.include('.cache')
     config.include('.routes')
     config.include('.security')
-    config.scan()
+    # james.asgi is a separate entry point, for Python 3 only
+    config.scan(ignore=['.asgi'])
     return config.make_wsgi_app()
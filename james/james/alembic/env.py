@@ -0,0 +1,61 @@
+"""Pyramid bootstrap environment. """
+from alembic import context
+from pyramid.paster import get_appsettings, setup_logging
+from sqlalchemy import engine_from_config, pool
+
+from james import get_from_env_or_settings
+from james.backfill import progress
+from james.models.meta import Base
+
+config = context.config
+
+# initialize_james_db hands over the settings it already read
+settings = config.attributes.get('settings')
+if settings is None:
+    setup_logging(config.config_file_name)
+    settings = get_appsettings(config.config_file_name)
+settings = dict(settings)
+settings['sqlalchemy.url'] = get_from_env_or_settings('sqlalchemy.url',
+                                                      settings)
+
+target_metadata = Base.metadata
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # the progress of backfills is not part of the application's schema
+    return not (type_ == 'table' and name == progress.name)
+
+
+def run_migrations_offline():
+    context.configure(url=settings['sqlalchemy.url'],
+                      target_metadata=target_metadata,
+                      include_object=include_object,
+                      transaction_per_migration=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    engine = engine_from_config(settings, prefix='sqlalchemy.',
+                                poolclass=pool.NullPool)
+
+    connection = engine.connect()
+    # every revision commits on its own, so that backfills can run between
+    # their schema changes in transactions of their own
+    context.configure(connection=connection,
+                      target_metadata=target_metadata,
+                      include_object=include_object,
+                      transaction_per_migration=True,
+                      render_as_batch=True)
+
+    try:
+        with context.begin_transaction():
+            context.run_migrations()
+    finally:
+        connection.close()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,67 @@
+"""Store money as integer cents
+
+Revision ID: 8213055b5b43
+Revises: e56607ccd782
+Create Date: 2026-10-18 16:20:03.771458
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from james.backfill import backfill, reset, shadow_column, swap_column
+
+
+# revision identifiers, used by Alembic.
+revision = '8213055b5b43'
+down_revision = 'e56607ccd782'
+branch_labels = None
+depends_on = None
+
+# money columns, by table, converted from decimal units to integer cents
+COLUMNS = (
+    ('loan', ('amount', 'installment')),
+    ('payment', ('amount',)),
+)
+
+
+def scale(table, columns, expression):
+    """ Return a backfill setting every column to ``expression``. """
+    def apply(connection, first_id, last_id):
+        connection.execute(
+            'UPDATE {} SET {} WHERE id BETWEEN {:d} AND {:d}'.format(
+                table, ', '.join('{} = {}'.format(
+                    column, expression.format(column))
+                    for column in columns), first_id, last_id))
+    return apply
+
+
+def migrate(expression, type_):
+    if op.get_bind().dialect.name == 'postgresql':
+        # new columns, backfilled and then swapped in, as changing the type
+        # of the existing ones would rewrite the tables under a lock
+        for table, columns in COLUMNS:
+            for column in columns:
+                name = '{}_{}_{}'.format(revision, table, column)
+                shadow_column(name, table, column, type_, expression)
+                swap_column(table, column)
+                reset(op.get_bind(), name)
+        return
+
+    # SQLite keeps the columns' declared type and stores the values as they
+    # are; every chunk is converted exactly once, as the backfill records it
+    with op.get_context().autocommit_block():
+        for table, columns in COLUMNS:
+            backfill(op.get_bind().engine, '{}_{}'.format(revision, table),
+                     table, scale(table, columns, expression))
+
+
+def upgrade():
+    migrate('CAST(ROUND({} * 100) AS BIGINT)', sa.BigInteger())
+
+
+def downgrade():
+    for table, _ in COLUMNS:
+        reset(op.get_bind(), '{}_{}'.format(revision, table))
+    migrate('{} / 100.0', sa.Numeric(precision=19, scale=10))
+    for table, _ in COLUMNS:
+        reset(op.get_bind(), '{}_{}'.format(revision, table))
@@ -0,0 +1,39 @@
+"""Index made payments by loan and date
+
+Revision ID: 8cb8d58952a8
+Revises: 8213055b5b43
+Create Date: 2026-10-18 16:24:36.905127
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8cb8d58952a8'
+down_revision = '8213055b5b43'
+branch_labels = None
+depends_on = None
+
+# single column indexes made redundant by the new one
+REDUNDANT = (('ix_payment_loan_id', 'loan_id'),
+             ('ix_payment_payment', 'payment'))
+
+
+def upgrade():
+    # built without blocking writes on PostgreSQL, before the indexes it
+    # replaces are dropped, so that balances are served by an index throughout
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_payment_loan_id_payment_date'), 'payment',
+                        ['loan_id', 'payment', 'date'],
+                        postgresql_concurrently=True)
+        for name, _ in REDUNDANT:
+            op.drop_index(name, table_name='payment')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, column in REDUNDANT:
+            op.create_index(name, 'payment', [column],
+                            postgresql_concurrently=True)
+        op.drop_index(op.f('ix_payment_loan_id_payment_date'),
+                      table_name='payment')
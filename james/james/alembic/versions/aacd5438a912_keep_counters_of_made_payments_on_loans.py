@@ -0,0 +1,51 @@
+"""Keep counters of made payments on loans
+
+Revision ID: aacd5438a912
+Revises: d3a66b81fef7
+Create Date: 2026-10-18 16:05:40.118324
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from james.backfill import backfill, reset
+
+
+# revision identifiers, used by Alembic.
+revision = 'aacd5438a912'
+down_revision = 'd3a66b81fef7'
+branch_labels = None
+depends_on = None
+
+loan = sa.table('loan', sa.column('id'), sa.column('paid_installments'),
+                sa.column('last_payment_date'))
+payment = sa.table('payment', sa.column('id'), sa.column('loan_id'),
+                   sa.column('payment'), sa.column('date'))
+
+
+def count_payments(connection, first_id, last_id):
+    made = (payment.c.loan_id == loan.c.id) & (payment.c.payment == 'made')
+    connection.execute(loan.update().where(
+        loan.c.id.between(first_id, last_id)).values(
+        paid_installments=sa.select([sa.func.count(payment.c.id)]).where(
+            made).as_scalar(),
+        last_payment_date=sa.select([sa.func.max(payment.c.date)]).where(
+            made).as_scalar()))
+
+
+def upgrade():
+    with op.batch_alter_table('loan') as batch_op:
+        batch_op.add_column(sa.Column('paid_installments', sa.Integer(),
+                                      nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('last_payment_date', sa.DateTime(),
+                                      nullable=True))
+
+    with op.get_context().autocommit_block():
+        backfill(op.get_bind().engine, revision, 'loan', count_payments)
+
+
+def downgrade():
+    with op.batch_alter_table('loan') as batch_op:
+        batch_op.drop_column('last_payment_date')
+        batch_op.drop_column('paid_installments')
+    reset(op.get_bind(), revision)
@@ -0,0 +1,61 @@
+"""Index payments by month
+
+Revision ID: ca7e5abf92bf
+Revises: aacd5438a912
+Create Date: 2026-10-18 16:09:27.530771
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from james.backfill import backfill, reset
+
+
+# revision identifiers, used by Alembic.
+revision = 'ca7e5abf92bf'
+down_revision = 'aacd5438a912'
+branch_labels = None
+depends_on = None
+
+loan = sa.table('loan', sa.column('id'), sa.column('date', sa.DateTime))
+payment = sa.table('payment', sa.column('id'), sa.column('loan_id'),
+                   sa.column('date', sa.DateTime), sa.column('month_index'))
+
+
+def index_months(connection, first_id, last_id):
+    rows = connection.execute(sa.select(
+        [payment.c.id, payment.c.date, loan.c.date]).where(
+        (payment.c.loan_id == loan.c.id) &
+        payment.c.id.between(first_id, last_id))).fetchall()
+    if not rows:
+        return
+
+    connection.execute(payment.update().where(
+        payment.c.id == sa.bindparam('payment_id')).values(
+        month_index=sa.bindparam('value')), [
+        {'payment_id': id,
+         'value': (date.year - loan_date.year) * 12 +
+                  date.month - loan_date.month}
+        for id, date, loan_date in rows])
+
+
+def upgrade():
+    op.add_column('payment', sa.Column('month_index', sa.Integer(),
+                                       nullable=True))
+
+    with op.get_context().autocommit_block():
+        backfill(op.get_bind().engine, revision, 'payment', index_months)
+
+    # SQLite copies the table to change it, PostgreSQL alters it in place
+    with op.batch_alter_table('payment') as batch_op:
+        batch_op.alter_column('month_index', existing_type=sa.Integer(),
+                              nullable=False)
+        batch_op.create_unique_constraint(
+            op.f('uq_payment_loan_id'), ['loan_id', 'month_index'])
+
+
+def downgrade():
+    with op.batch_alter_table('payment') as batch_op:
+        batch_op.drop_constraint(op.f('uq_payment_loan_id'), type_='unique')
+        batch_op.drop_column('month_index')
+    reset(op.get_bind(), revision)
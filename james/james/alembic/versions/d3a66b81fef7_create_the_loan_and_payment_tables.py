@@ -0,0 +1,55 @@
+"""Create the loan and payment tables
+
+Revision ID: d3a66b81fef7
+Revises: 
+Create Date: 2026-10-18 16:02:11.408215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a66b81fef7'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'loan',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('loan_id', sa.String(length=32), nullable=False),
+        sa.Column('amount', sa.Numeric(precision=19, scale=10),
+                  nullable=False),
+        sa.Column('term', sa.Integer(), nullable=False),
+        sa.Column('rate', sa.Numeric(precision=19, scale=10), nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=False),
+        sa.Column('installment', sa.Numeric(precision=19, scale=10),
+                  nullable=False),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_loan')),
+    )
+    op.create_index(op.f('ix_loan_date'), 'loan', ['date'])
+    op.create_index(op.f('ix_loan_loan_id'), 'loan', ['loan_id'])
+
+    op.create_table(
+        'payment',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('loan_id', sa.Integer(), nullable=False),
+        sa.Column('payment', sa.String(length=6), nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=False),
+        sa.Column('amount', sa.Numeric(precision=19, scale=10),
+                  nullable=False),
+        sa.ForeignKeyConstraint(['loan_id'], ['loan.id'],
+                                name=op.f('fk_payment_loan_id_loan')),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_payment')),
+    )
+    op.create_index(op.f('ix_payment_date'), 'payment', ['date'])
+    op.create_index(op.f('ix_payment_loan_id'), 'payment', ['loan_id'])
+    op.create_index(op.f('ix_payment_payment'), 'payment', ['payment'])
+
+
+def downgrade():
+    op.drop_table('payment')
+    op.drop_table('loan')
@@ -0,0 +1,116 @@
+"""Store loan ids in 16 bytes
+
+Revision ID: e56607ccd782
+Revises: ca7e5abf92bf
+Create Date: 2026-10-18 16:14:52.206593
+
+"""
+import binascii
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+
+from james.backfill import backfill, reset, shadow_column, swap_column
+
+
+# revision identifiers, used by Alembic.
+revision = 'e56607ccd782'
+down_revision = 'ca7e5abf92bf'
+branch_labels = None
+depends_on = None
+
+loan = sa.table('loan', sa.column('id'), sa.column('loan_id'))
+
+
+def convert(to_value, type_):
+    """ Return a backfill replacing every loan id by its ``to_value``. """
+    def apply(connection, first_id, last_id):
+        rows = connection.execute(sa.select([loan.c.id, loan.c.loan_id]).where(
+            loan.c.id.between(first_id, last_id))).fetchall()
+        connection.execute(
+            loan.update().where(loan.c.id == sa.bindparam('loan')).values(
+                loan_id=sa.bindparam('value', type_=type_)),
+            [{'loan': id, 'value': to_value(loan_id)} for id, loan_id in rows])
+    return apply
+
+
+def renew_duplicates(connection, first_id, last_id):
+    """
+    Give a new id to every loan whose id an earlier loan already has: the
+    original ``Loan.loan_id`` default was computed once per process, so
+    every loan created by a process shared the same one.
+
+    """
+    earlier = loan.alias('earlier')
+    duplicates = [id for id, in connection.execute(
+        sa.select([loan.c.id]).where(
+            loan.c.id.between(first_id, last_id) &
+            sa.exists().where((earlier.c.loan_id == loan.c.loan_id) &
+                              (earlier.c.id < loan.c.id))))]
+    if duplicates:
+        connection.execute(
+            loan.update().where(loan.c.id == sa.bindparam('loan')).values(
+                loan_id=sa.bindparam('value')),
+            [{'loan': id, 'value': uuid.uuid4().hex} for id in duplicates])
+
+
+def to_bytes(loan_id):
+    return uuid.UUID(hex=loan_id).bytes
+
+
+def to_hex(loan_id):
+    return binascii.hexlify(loan_id).decode('ascii')
+
+
+def replace_on_postgresql(type_, expression, unique):
+    """
+    Replace the loan id column by one of ``type_`` holding ``expression``
+    of it, with its index, without rewriting the table under a lock.
+
+    """
+    shadow_column(revision, 'loan', 'loan_id', type_, expression)
+    with op.get_context().autocommit_block():
+        op.create_index('ix_loan_loan_id_new', 'loan', ['loan_id_new'],
+                        unique=unique, postgresql_concurrently=True)
+    # drops the column's index along with it
+    swap_column('loan', 'loan_id')
+    op.execute('ALTER INDEX ix_loan_loan_id_new RENAME TO ix_loan_loan_id')
+    reset(op.get_bind(), revision)
+
+
+def upgrade():
+    # looked up through the existing index on loan_id
+    with op.get_context().autocommit_block():
+        backfill(op.get_bind().engine, revision + '_duplicates', 'loan',
+                 renew_duplicates)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        replace_on_postgresql(sa.LargeBinary(length=16),
+                              "decode({}, 'hex')", unique=True)
+        return
+
+    # SQLite stores the bytes in the existing column as they are
+    op.drop_index('ix_loan_loan_id', table_name='loan')
+    with op.get_context().autocommit_block():
+        backfill(op.get_bind().engine, revision, 'loan',
+                 convert(to_bytes, sa.LargeBinary()))
+    op.create_index(op.f('ix_loan_loan_id'), 'loan', ['loan_id'],
+                    unique=True)
+
+
+def downgrade():
+    reset(op.get_bind(), revision + '_duplicates')
+    reset(op.get_bind(), revision)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        replace_on_postgresql(sa.String(length=32), "encode({}, 'hex')",
+                              unique=False)
+        return
+
+    op.drop_index('ix_loan_loan_id', table_name='loan')
+    with op.get_context().autocommit_block():
+        backfill(op.get_bind().engine, revision, 'loan',
+                 convert(to_hex, sa.String()))
+    reset(op.get_bind(), revision)
+    op.create_index(op.f('ix_loan_loan_id'), 'loan', ['loan_id'])
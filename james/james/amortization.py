@@ -0,0 +1,163 @@
+"""
+Amortization schedules of fixed-installment loans.
+
+Every function works on arrays of loans at once, so that schedules for the
+whole book are generated with a handful of NumPy operations instead of one
+Python iteration per loan and period. The periodic rate of a loan is its
+``rate`` divided by its ``term``, as in ``Loan.set_installment_value``.
+
+"""
+import math
+
+import numpy as np
+
+# Loans are split in chunks of this size by ``iter_schedules`` so that the
+# ``loans x periods`` arrays stay within a few hundred megabytes.
+CHUNK_SIZE = 10000
+
+
+def installment(amount, term, rate):
+    """
+    Return the installment of a loan of ``amount`` over ``term`` periods at
+    ``rate``, rounded down to the cent.
+
+    """
+    value = ((rate / term) + (rate / term) /
+             ((1 + (rate / term)) ** term - 1)) * amount
+    return math.floor(value * 100) / 100
+
+
+def installments(amounts, terms, rates):
+    """
+    Return the installments of loans with the given ``amounts``, ``terms``
+    and ``rates``, rounded down to the cent: the vectorized counterpart of
+    ``installment``, with the same operations in the same order so that both
+    give the same cents.
+
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    terms = np.asarray(terms, dtype=np.float64)
+    rates = np.asarray(rates, dtype=np.float64)
+
+    installment = ((rates / terms) + (rates / terms) /
+                   ((1 + (rates / terms)) ** terms - 1)) * amounts
+    return np.floor(installment * 100) / 100
+
+
+def schedules(amounts, terms, rates, installment_values=None):
+    """
+    Return the amortization schedules of loans with the given ``amounts``,
+    ``terms`` and ``rates`` as a dict of ``loans x periods`` arrays:
+
+    - ``payment``: amount paid in the period;
+    - ``interest``: interest accrued in the period;
+    - ``principal``: principal repaid in the period;
+    - ``balance``: principal outstanding at the end of the period.
+
+    Every period pays the loan's installment, except the last one, which also
+    repays the few cents left over by rounding the installment down. Periods
+    after a loan's term are zero. ``installment_values`` defaults to the
+    values computed by ``installments``.
+
+    """
+    amounts, terms, rates, installment_values = _as_arrays(
+        amounts, terms, rates, installment_values)
+    if installment_values is None:
+        installment_values = installments(amounts, terms, rates)
+
+    periods = np.arange(terms.max() if terms.size else 0)
+    rate = (rates / terms)[:, None]
+    amount = amounts[:, None]
+    installment = installment_values[:, None]
+
+    # closed form of the principal outstanding at the start of each period
+    growth = (1 + rate) ** periods[None, :]
+    opening = amount * growth - installment * (growth - 1) / rate
+
+    interest = opening * rate
+    principal = installment - interest
+
+    rows = np.arange(terms.size)
+    last = terms - 1
+    principal[rows, last] = opening[rows, last]
+
+    active = periods[None, :] < terms[:, None]
+    principal = np.where(active, principal, 0)
+    interest = np.where(active, interest, 0)
+
+    return {
+        'payment': principal + interest,
+        'interest': interest,
+        'principal': principal,
+        'balance': np.where(active, opening - principal, 0),
+    }
+
+
+def iter_schedules(amounts, terms, rates, installment_values=None,
+                   chunk_size=CHUNK_SIZE):
+    """
+    Yield ``(start, schedules)`` for consecutive chunks of at most
+    ``chunk_size`` loans, where ``start`` is the index of the chunk's first
+    loan.
+
+    """
+    amounts, terms, rates, installment_values = _as_arrays(
+        amounts, terms, rates, installment_values)
+
+    for start in range(0, terms.size, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        yield start, schedules(
+            amounts[chunk], terms[chunk], rates[chunk],
+            None if installment_values is None else installment_values[chunk])
+
+
+def schedule(amount, term, rate, installment=None):
+    """
+    Return the amortization schedule of a single loan as a list of periods.
+
+    """
+    result = schedules([amount], [term], [rate],
+                       None if installment is None else [installment])
+    columns = [np.round(result[key][0, :term], 2).tolist()
+               for key in ('payment', 'interest', 'principal', 'balance')]
+
+    return [{'period': period, 'payment': payment, 'interest': interest,
+             'principal': principal, 'balance': balance}
+            for period, (payment, interest, principal, balance)
+            in enumerate(zip(*columns), 1)]
+
+
+def _as_arrays(amounts, terms, rates, installment_values):
+    amounts = np.asarray(amounts, dtype=np.float64).reshape(-1)
+    terms = np.asarray(terms, dtype=np.int64).reshape(-1)
+    rates = np.asarray(rates, dtype=np.float64).reshape(-1)
+    if installment_values is not None:
+        installment_values = np.asarray(installment_values,
+                                        dtype=np.float64).reshape(-1)
+    return amounts, terms, rates, installment_values
+
+
+def quotes(amounts, terms, rates, grid=False):
+    """
+    Return ``(amounts, terms, rates, installments)`` arrays for the given
+    combinations of loan parameters.
+
+    The parameters are broadcast against each other, so scalars are repeated
+    for every quote. With ``grid`` every combination of the given amounts,
+    terms and rates is quoted instead. Raises ``ValueError`` if the arrays
+    cannot be broadcast together.
+
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    terms = np.asarray(terms, dtype=np.int64)
+    rates = np.asarray(rates, dtype=np.float64)
+
+    if grid:
+        amounts, terms, rates = np.meshgrid(
+            amounts.reshape(-1), terms.reshape(-1), rates.reshape(-1),
+            indexing='ij')
+    else:
+        amounts, terms, rates = np.broadcast_arrays(amounts, terms, rates)
+
+    amounts, terms, rates = [a.reshape(-1) for a in (amounts, terms, rates)]
+    return amounts, terms, rates, installments(amounts, terms, rates)
@@ -0,0 +1,232 @@
+"""
+ASGI entry point serving the ``add_loan``, ``add_payment`` and ``balance``
+routes of ``james:main`` with asynchronous SQLAlchemy sessions, so that a
+request waiting for the database holds no thread and one process can keep
+thousands of them in flight.
+
+The handlers run the synchronous model code of ``james.models`` through
+``AsyncSession.run_sync``, whose queries are still sent through the async
+driver. Requires Python 3.6+ and the ``asgi`` extra (SQLAlchemy 1.4+ and
+aiosqlite), e.g.::
+
+    JAMES_CONFIG=production.ini uvicorn --factory james.asgi:create_app
+
+"""
+import json
+import os
+import re
+
+import colander
+from pyramid.paster import get_appsettings
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from james import get_from_env_or_settings
+from james.models import Loan, Payment
+from james.models.engine import set_pragmas, sqlite_pragmas
+from james.models.loan import InvalidDate
+from james.money import to_cents
+from james.security import authentication_policy
+from james.views.schemas import (
+    balance_schema,
+    create_loan_schema,
+    create_payment_schema,
+    )
+
+# asynchronous drivers of the databases of ``sqlalchemy.url``
+DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg'}
+
+
+def add_loan(dbsession, loan_id, data):
+    try:
+        items = create_loan_schema.deserialize(data)
+    except colander.Invalid as e:
+        return 400, e.asdict()
+
+    loan = Loan(amount=items['amount'], term=items['term'], rate=items['rate'],
+                date=items['date'])
+    loan.set_installment_value()
+
+    dbsession.add(loan)
+    dbsession.flush()
+
+    return 200, {'loan_id': loan.loan_id, 'installment': loan.installment}
+
+
+def add_payment(dbsession, loan_id, data):
+    loan = dbsession.query(Loan).filter_by(loan_id=loan_id).first()
+    if not loan:
+        return 404, {}
+
+    try:
+        items = create_payment_schema.deserialize(data)
+    except colander.Invalid as e:
+        return 400, e.asdict()
+
+    if items['date'].date() < loan.date.date():
+        return 400, {'error': 'Invalid payment date, must be later than or '
+                     'equal to {}.'.format(loan.date.date())}
+
+    if to_cents(items['amount']) != to_cents(loan.installment):
+        return 400, {'error': 'Invalid amount, must be ${}.'.format(
+            loan.installment)}
+
+    month_index = loan.month_index(items['date'])
+
+    if dbsession.query(Payment.id).filter_by(
+            loan_id=loan.id, month_index=month_index).first():
+        return 409, {'error': 'Duplicated payment.'}
+
+    dbsession.add(Payment(loan=loan, payment=items['payment'],
+                          date=items['date'], amount=items['amount'],
+                          month_index=month_index))
+    try:
+        dbsession.flush()
+    except IntegrityError:
+        # a concurrent request added a payment for the same month
+        return 409, {'error': 'Duplicated payment.'}
+
+    return 200, {'success': 'Payment added.'}
+
+
+def balance(dbsession, loan_id, data):
+    loan = dbsession.query(Loan).filter_by(loan_id=loan_id).first()
+    if not loan:
+        return 404, {}
+
+    try:
+        items = balance_schema.deserialize(data)
+    except colander.Invalid as e:
+        return 400, e.asdict()
+
+    try:
+        return 200, {'balance': loan.calculate_balance(items['date'].date())}
+    except InvalidDate:
+        return 400, {'error': 'Invalid date, must be later than or equal '
+                     'to {}.'.format(loan.date.date())}
+
+
+ROUTES = (
+    (re.compile(r'^/loans/?$'), add_loan),
+    (re.compile(r'^/loans/(?P<loan_id>[^/]+)/payments/?$'), add_payment),
+    (re.compile(r'^/loans/(?P<loan_id>[^/]+)/balance/?$'), balance),
+)
+
+
+def async_url(settings):
+    """
+    Return the URL of the database for the asynchronous engine: the
+    ``sqlalchemy.async_url`` setting or ``sqlalchemy.url`` with the
+    asynchronous driver of its database.
+
+    """
+    url = get_from_env_or_settings('sqlalchemy.async_url', settings)
+    if url:
+        return url
+
+    url = make_url(settings['sqlalchemy.url'])
+    backend = url.get_backend_name()
+    if backend not in DRIVERS:
+        raise ValueError('No asynchronous driver for {}.'.format(backend))
+    return url.set(drivername='{}+{}'.format(backend, DRIVERS[backend]))
+
+
+class Application(object):
+    """ ASGI application of the routes of ``ROUTES``. """
+
+    def __init__(self, engine, policy):
+        self.engine = engine
+        self.policy = policy
+        self.session_factory = sessionmaker(engine, class_=AsyncSession,
+                                            expire_on_commit=False)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        for pattern, handler in ROUTES:
+            match = pattern.match(scope['path'])
+            if match:
+                break
+        else:
+            return await self.respond(send, 404, {})
+
+        if scope['method'] != 'POST':
+            return await self.respond(send, 404, {})
+
+        headers = dict(scope['headers'])
+        header = headers.get(b'authorization')
+        if header is None or self.policy.verify(header) is None:
+            return await self.respond(send, 403, {})
+
+        body = await self.read_body(receive)
+        try:
+            data = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return await self.respond(send, 400, {'error': 'Invalid JSON.'})
+
+        async with self.session_factory() as dbsession:
+            status, result = await dbsession.run_sync(
+                handler, match.groupdict().get('loan_id'), data)
+            if status < 400:
+                await dbsession.commit()
+            else:
+                await dbsession.rollback()
+
+        await self.respond(send, status, result)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def respond(self, send, status, body):
+        body = json.dumps(body).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode('ascii'))],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def main(global_config, **settings):
+    """ Return the ASGI application of ``settings``. """
+    settings['sqlalchemy.url'] = get_from_env_or_settings('sqlalchemy.url',
+                                                          settings)
+    settings['auth.secret'] = get_from_env_or_settings('auth.secret',
+                                                       settings)
+    settings['api.key'] = get_from_env_or_settings('api.key', settings)
+
+    url = async_url(settings)
+    engine = create_async_engine(url)
+    if make_url(str(url)).get_backend_name() == 'sqlite':
+        set_pragmas(engine.sync_engine, sqlite_pragmas(settings))
+
+    return Application(engine, authentication_policy(settings))
+
+
+def create_app():
+    """
+    Return the ASGI application of the ``[app:main]`` section of the
+    ``JAMES_CONFIG`` file, ``production.ini`` by default.
+
+    """
+    config_uri = os.environ.get('JAMES_CONFIG', 'production.ini')
+    return main({}, **get_appsettings(config_uri))
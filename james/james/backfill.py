@@ -0,0 +1,160 @@
+"""
+Online data migrations: a backfill applies a change to the rows of a table
+in chunks of consecutive primary keys, each chunk in a short transaction of
+its own, so that the application keeps reading and writing the table while
+it runs and only the rows of one chunk are ever locked.
+
+The progress of every backfill is recorded in the ``backfill`` table in the
+same transaction as its chunk, so a chunk is applied exactly once: an
+interrupted backfill resumes after its last chunk, and one that completed
+does nothing when run again. A backfill covers the rows that existed when it
+started; rows inserted afterwards are expected to be written in the new form
+by the application.
+
+On PostgreSQL, ``shadow_column`` and ``swap_column`` change the type of a
+column the same way, instead of an ``ALTER COLUMN ... TYPE`` that rewrites
+the table under an exclusive lock.
+
+Used by the Alembic revisions of ``james/alembic/versions``, e.g.::
+
+    def upgrade():
+        with op.get_context().autocommit_block():
+            backfill(op.get_bind().engine, 'loan_counters', 'loan',
+                     count_payments)
+
+"""
+import time
+
+from alembic import op
+from sqlalchemy import (
+    Column,
+    func,
+    Integer,
+    MetaData,
+    select,
+    String,
+    Table,
+    )
+from sqlalchemy.sql import column, table
+
+CHUNK_SIZE = 1000
+
+progress = Table(
+    'backfill', MetaData(),
+    Column('name', String(100), primary_key=True),
+    # the last id of the table when the backfill started, and of its chunks
+    Column('end_id', Integer, nullable=False),
+    Column('last_id', Integer, nullable=False),
+)
+
+
+def backfill(engine, name, table_name, apply, chunk_size=CHUNK_SIZE,
+             delay=0):
+    """
+    Call ``apply(connection, first_id, last_id)`` for every chunk of at most
+    ``chunk_size`` rows of ``table_name``, by ascending ``id``, within the
+    chunk's transaction, sleeping ``delay`` seconds between chunks to leave
+    room to the application's writes. Returns the number of rows processed
+    by this call.
+
+    """
+    progress.create(engine, checkfirst=True)
+    ids = table(table_name, column('id'))
+
+    with engine.begin() as connection:
+        state = connection.execute(select(
+            [progress.c.end_id, progress.c.last_id]).where(
+            progress.c.name == name)).first()
+        if state is None:
+            end_id = connection.execute(
+                select([func.coalesce(func.max(ids.c.id), 0)])).scalar()
+            state = (end_id, 0)
+            connection.execute(progress.insert(), name=name, end_id=end_id,
+                               last_id=0)
+    end_id, last_id = state
+
+    count = 0
+    while last_id < end_id:
+        with engine.begin() as connection:
+            chunk = [id for id, in connection.execute(
+                select([ids.c.id]).where(
+                    (ids.c.id > last_id) & (ids.c.id <= end_id)
+                ).order_by(ids.c.id).limit(chunk_size))]
+            if not chunk:
+                last_id = end_id
+            else:
+                apply(connection, chunk[0], chunk[-1])
+                last_id = chunk[-1]
+                count += len(chunk)
+            connection.execute(progress.update().where(
+                progress.c.name == name).values(last_id=last_id))
+        if delay:
+            time.sleep(delay)
+
+    return count
+
+
+def shadow(column_name):
+    return column_name + '_new'
+
+
+def shadow_column(name, table_name, column_name, type_, expression):
+    """
+    Add a nullable column of ``type_`` next to ``column_name`` of
+    ``table_name`` on PostgreSQL, holding ``expression`` of it (SQL in
+    which ``{}`` stands for the column, e.g. ``round({} * 100)``): a trigger
+    sets it on every write and backfill ``name`` on the existing rows, then
+    a ``NOT NULL`` check is validated without blocking writes. Must be
+    called within a revision, before ``swap_column``.
+
+    """
+    new = shadow(column_name)
+    trigger = '{}_{}'.format(table_name, new)
+
+    op.add_column(table_name, Column(new, type_, nullable=True))
+    op.execute(
+        'CREATE FUNCTION {0}() RETURNS trigger AS $$ BEGIN '
+        'NEW.{1} := {2}; RETURN NEW; END $$ LANGUAGE plpgsql'.format(
+            trigger, new, expression.format('NEW.' + column_name)))
+    op.execute('CREATE TRIGGER {0} BEFORE INSERT OR UPDATE ON {1} '
+               'FOR EACH ROW EXECUTE PROCEDURE {0}()'.format(
+                   trigger, table_name))
+
+    def apply(connection, first_id, last_id):
+        connection.execute(
+            'UPDATE {} SET {} = {} WHERE id BETWEEN {:d} AND {:d}'.format(
+                table_name, new, expression.format(column_name), first_id,
+                last_id))
+
+    with op.get_context().autocommit_block():
+        backfill(op.get_bind().engine, name, table_name, apply)
+        op.execute('ALTER TABLE {0} ADD CONSTRAINT ck_{1} CHECK ({2} IS NOT '
+                   'NULL) NOT VALID'.format(table_name, trigger, new))
+        op.execute('ALTER TABLE {} VALIDATE CONSTRAINT ck_{}'.format(
+            table_name, trigger))
+
+
+def swap_column(table_name, column_name):
+    """
+    Replace ``column_name`` of ``table_name`` by its ``shadow_column``, which
+    only takes the table's lock for as long as it takes to change its
+    definition: the validated check lets ``SET NOT NULL`` skip its scan.
+
+    """
+    new = shadow(column_name)
+    trigger = '{}_{}'.format(table_name, new)
+
+    op.execute('ALTER TABLE {} ALTER COLUMN {} SET NOT NULL'.format(
+        table_name, new))
+    op.execute('ALTER TABLE {} DROP CONSTRAINT ck_{}'.format(
+        table_name, trigger))
+    op.execute('DROP TRIGGER {} ON {}'.format(trigger, table_name))
+    op.execute('DROP FUNCTION {}()'.format(trigger))
+    op.drop_column(table_name, column_name)
+    op.alter_column(table_name, new, new_column_name=column_name)
+
+
+def reset(bind, name):
+    """ Forget the progress of backfill ``name``, e.g. in a downgrade. """
+    if bind.dialect.has_table(bind, progress.name):
+        bind.execute(progress.delete().where(progress.c.name == name))
@@ -0,0 +1,224 @@
+import json
+import uuid
+
+import zope.sqlalchemy
+
+from james.amortization import installment
+from james.models import Loan, Payment
+from james.models.types import canonical_id
+from james.money import to_cents
+from james.views.schemas import (
+    create_loan_schema,
+    create_payments_schema,
+    validate_many,
+    )
+
+# Keeps ``IN`` clauses below SQLite's default limit of 999 bound parameters.
+CHUNK_SIZE = 500
+
+
+def chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def parse_records(body):
+    """
+    Parse a batch request body, either a JSON array or an NDJSON stream (one
+    JSON object per line), into a list of records.
+
+    Lines of an NDJSON stream that are not valid JSON are returned as ``None``
+    so that they can be reported in their position. Raises ``ValueError`` if
+    the body is empty or is neither an array nor an NDJSON stream.
+
+    """
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+
+    try:
+        records = json.loads(body)
+    except ValueError:
+        records = None
+    else:
+        if isinstance(records, list):
+            return records
+        if isinstance(records, dict):
+            return [records]
+
+    lines = [line for line in body.splitlines() if line.strip()]
+    if not lines or records is not None:
+        raise ValueError('Invalid JSON.')
+
+    records = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        records.append(record if isinstance(record, dict) else None)
+
+    return records
+
+
+def create_loans(dbsession, records):
+    """
+    Validate ``records`` and insert the valid ones with a single bulk insert.
+
+    Returns one result per record, in input order: either the ``loan_id`` and
+    ``installment`` of the new loan or the ``error`` that prevented it.
+
+    """
+    results = []
+    valid = []
+
+    for items, errors in validate_many(create_loan_schema, records):
+        if errors:
+            results.append({'error': errors})
+        else:
+            valid.append((len(results), items))
+            results.append(None)
+
+    inserted = insert_loans(dbsession, [items for _, items in valid])
+    for (i, _), result in zip(valid, inserted):
+        results[i] = result
+
+    return results
+
+
+def insert_loans(dbsession, loans):
+    """
+    Insert the validated ``loans`` with a single bulk insert, returning the
+    ``loan_id`` and ``installment`` of each of them.
+
+    """
+    results = []
+    rows = []
+
+    for items in loans:
+        row = {'loan_id': uuid.uuid4().hex, 'amount': items['amount'],
+               'term': items['term'], 'rate': items['rate'],
+               'date': items['date'],
+               'installment': installment(items['amount'], items['term'],
+                                          items['rate'])}
+        rows.append(row)
+        results.append({'loan_id': row['loan_id'],
+                        'installment': row['installment']})
+
+    if rows:
+        dbsession.bulk_insert_mappings(Loan, rows)
+        zope.sqlalchemy.mark_changed(dbsession)
+
+    return results
+
+
+def create_payments(dbsession, records):
+    """
+    Validate ``records`` and insert the valid ones with a single bulk insert.
+
+    Every referenced loan is resolved with one ``IN`` query per chunk of loan
+    ids, and duplicated months are detected against the existing payments
+    and against the other records of the batch with a set of
+    ``(loan, month_index)`` keys instead of one query per payment.
+
+    Returns one result per record, in input order: either ``success`` or the
+    ``error`` that prevented the payment from being added, and the set of
+    the canonical ``loan_id`` of the loans that were paid.
+
+    """
+    results = [None] * len(records)
+    valid = []
+
+    for i, (items, errors) in enumerate(
+            validate_many(create_payments_schema, records)):
+        if errors:
+            results[i] = {'error': errors}
+        else:
+            valid.append((i, items))
+
+    inserted, loan_ids = insert_payments(dbsession,
+                                         [items for _, items in valid])
+    for (i, _), result in zip(valid, inserted):
+        results[i] = result
+
+    return results, loan_ids
+
+
+def insert_payments(dbsession, payments):
+    """
+    Insert the validated ``payments``, each with the ``loan_id`` of its loan,
+    with a single bulk insert, returning the result of each of them and the
+    paid loans' ``loan_id`` as ``create_payments`` does.
+
+    """
+    results = [None] * len(payments)
+    valid = list(enumerate(payments))
+    paid = set()
+
+    loans = {}
+    for loan_ids in chunks(set(canonical_id(items['loan_id'])
+                               for _, items in valid)):
+        for loan in dbsession.query(Loan).filter(Loan.loan_id.in_(loan_ids)):
+            loans.setdefault(loan.loan_id, loan)
+
+    months = set()
+    for ids in chunks(set(loan.id for loan in loans.values())):
+        months.update(dbsession.query(
+            Payment.loan_id, Payment.month_index).filter(
+            Payment.loan_id.in_(ids)))
+
+    rows = []
+    for i, items in valid:
+        loan = loans.get(canonical_id(items['loan_id']))
+
+        if not loan:
+            results[i] = {'error': 'Loan not found.'}
+            continue
+
+        if items['date'].date() < loan.date.date():
+            results[i] = {'error': 'Invalid payment date, must be later '
+                'than or equal to {}.'.format(loan.date.date())}
+            continue
+
+        if to_cents(items['amount']) != to_cents(loan.installment):
+            results[i] = {'error': 'Invalid amount, must be ${}.'.format(
+                loan.installment)}
+            continue
+
+        month = (loan.id, loan.month_index(items['date']))
+        if month in months:
+            results[i] = {'error': 'Duplicated payment.'}
+            continue
+        months.add(month)
+
+        rows.append({'loan_id': loan.id, 'payment': items['payment'],
+                     'date': items['date'], 'amount': items['amount'],
+                     'month_index': month[1]})
+        paid.add(loan.loan_id)
+        results[i] = {'success': 'Payment added.'}
+
+    if rows:
+        dbsession.bulk_insert_mappings(Payment, rows)
+        update_counters(dbsession, rows)
+        zope.sqlalchemy.mark_changed(dbsession)
+
+    return results, paid
+
+
+def update_counters(dbsession, rows):
+    """
+    Register the made payments among the bulk inserted ``rows`` in their
+    loans' counters with a single ``executemany`` update.
+
+    """
+    payments = {}
+    for row in rows:
+        if row['payment'] != 'made':
+            continue
+        count, date = payments.get(row['loan_id'], (0, row['date']))
+        payments[row['loan_id']] = (count + 1, max(date, row['date']))
+
+    if payments:
+        dbsession.execute(Loan.payments_update(), [
+            {'loan': loan_id, 'count': count, 'payment_date': date}
+            for loan_id, (count, date) in payments.items()])
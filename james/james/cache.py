@@ -0,0 +1,200 @@
+from collections import OrderedDict
+import threading
+import time
+import uuid
+
+from pyramid.path import DottedNameResolver
+from pyramid.settings import asbool
+
+from james import get_from_env_or_settings
+
+
+class Backend(object):
+    """
+    Interface of the key-value stores behind a ``Cache``.
+
+    Backends only need to be safe to share between the threads of a process;
+    one that stores its entries outside of the process (a local key-value
+    server, for example) is shared by every worker using it as well. Values
+    are dicts of plain types (strings, numbers and ``None``, dates as ISO 8601
+    strings), that serialize to JSON as they are.
+
+    """
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+
+    def get(self, key):
+        """ Return the value stored for ``key`` or ``None``. """
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class MemoryBackend(Backend):
+    """
+    Process-local store keeping at most ``max_size`` entries, evicting the
+    least recently used, each of them for at most ``ttl`` seconds.
+
+    """
+
+    def __init__(self, max_size, ttl=None):
+        super(MemoryBackend, self).__init__(max_size, ttl)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+
+            value, expires = entry
+            if expires is not None and expires < time.time():
+                return None
+
+            self.entries[key] = entry
+            return value
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl else None
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, expires)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class Cache(object):
+    """
+    Read-through cache over a ``Backend``, counting its hits and misses.
+
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        value = self.backend.get(key)
+
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.backend)}
+
+
+class BalanceCache(Cache):
+    """
+    Cache of loan balances by ``(loan_id, date)``.
+
+    Every loan has a generation token stored along with its balances, which
+    are keyed by it. ``invalidate`` gives a loan a new token, so that all of
+    its cached balances become unreachable at once and are left for the LRU
+    to evict, without touching any other loan's.
+
+    """
+
+    def generation(self, loan_id, create=True):
+        key = ('generation', loan_id)
+        generation = self.backend.get(key)
+        if generation is None and create:
+            generation = uuid.uuid4().hex
+            self.backend.set(key, generation)
+        return generation
+
+    def get_balance(self, loan_id, date):
+        generation = self.generation(loan_id, create=False)
+        if generation is None:
+            with self.lock:
+                self.misses += 1
+            return None
+        return self.get(('balance', loan_id, generation, date.isoformat()))
+
+    def set_balance(self, loan_id, date, balance, generation):
+        """
+        Store ``balance``, computed after reading the loan's ``generation``,
+        unless the loan was invalidated since.
+
+        """
+        if self.generation(loan_id) == generation:
+            self.set(('balance', loan_id, generation, date.isoformat()),
+                     balance)
+
+    def invalidate(self, loan_id):
+        self.backend.set(('generation', loan_id), uuid.uuid4().hex)
+
+
+def make_cache(settings, prefix, cls=Cache, enabled=True):
+    """
+    Return a ``cls`` instance configured by the ``<prefix>enabled``,
+    ``<prefix>max_size``, ``<prefix>ttl`` and ``<prefix>backend`` (dotted name
+    of a ``Backend`` class) settings, or ``None`` if it is disabled.
+
+    """
+    def setting(name, default):
+        value = get_from_env_or_settings(prefix + name, settings)
+        return default if value is None else value
+
+    if not asbool(setting('enabled', enabled)):
+        return None
+
+    backend = DottedNameResolver().maybe_resolve(
+        setting('backend', MemoryBackend))
+    ttl = float(setting('ttl', 3600)) or None
+
+    return cls(backend(int(setting('max_size', 10000)), ttl))
+
+
+def includeme(config):
+    """
+    Set up the cache of loans by ``loan_id``, configured by the
+    ``loans.cache.*`` settings, and the cache of balances, configured by the
+    ``balances.cache.*`` settings and disabled by default.
+
+    """
+    settings = config.get_settings()
+    config.registry['loan_cache'] = make_cache(settings, 'loans.cache.')
+    config.registry['balance_cache'] = make_cache(
+        settings, 'balances.cache.', BalanceCache, enabled=False)
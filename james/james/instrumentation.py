@@ -0,0 +1,213 @@
+"""
+Per-request instrumentation: the number of SQL queries, the time spent in
+the database and the total time of every request, reported in its
+``Server-Timing`` header and aggregated in histograms per route, along with
+the number of responses by status and of errors by the reason views record
+in ``request.environ['james.error']``.
+
+"""
+import threading
+import time
+
+from pyramid.tweens import INGRESS
+from sqlalchemy import event
+
+# upper bounds of the histogram buckets
+TIME_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000,
+                float('inf'))
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, float('inf'))
+
+# the timings of the request being handled by the current thread
+current = threading.local()
+
+
+class Timings(object):
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+
+    def cumulative(self):
+        """ Yield every bucket bound with its cumulative count. """
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+    def as_dict(self):
+        """
+        Return the cumulative count of every bucket, as Prometheus does, and
+        the count and sum of the observed values.
+
+        """
+        buckets = dict(('+Inf' if bound == float('inf') else str(bound), total)
+                       for bound, total in self.cumulative())
+        return {'buckets': buckets, 'count': self.count,
+                'sum': round(self.sum, 3)}
+
+
+class RouteMetrics(object):
+
+    def __init__(self):
+        self.request_time = Histogram(TIME_BUCKETS)
+        self.db_time = Histogram(TIME_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        # responses by status, and errors by (status, reason)
+        self.responses = {}
+        self.errors = {}
+
+    def observe(self, request_time, timings, status, error):
+        self.request_time.observe(request_time)
+        self.db_time.observe(timings.db_time)
+        self.queries.observe(timings.queries)
+        self.responses[status] = self.responses.get(status, 0) + 1
+        if error is not None:
+            key = (status, error)
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def merge(self, other):
+        self.request_time.merge(other.request_time)
+        self.db_time.merge(other.db_time)
+        self.queries.merge(other.queries)
+        for status, count in list(other.responses.items()):
+            self.responses[status] = self.responses.get(status, 0) + count
+        for key, count in list(other.errors.items()):
+            self.errors[key] = self.errors.get(key, 0) + count
+
+    def as_dict(self):
+        errors = {}
+        for (status, reason), count in self.errors.items():
+            errors.setdefault(str(status), {})[reason] = count
+        return {'count': self.request_time.count,
+                'responses': dict((str(status), count) for status, count
+                                  in self.responses.items()),
+                'errors': errors,
+                'request_time_ms': self.request_time.as_dict(),
+                'db_time_ms': self.db_time.as_dict(),
+                'queries': self.queries.as_dict()}
+
+
+class Metrics(object):
+    """
+    Request metrics of the application, by route name.
+
+    Every thread records its requests in a shard of its own, so that
+    observing a request takes no lock; the shards are merged when the metrics
+    are read.
+
+    """
+
+    def __init__(self):
+        self.shards = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def shard(self):
+        routes = getattr(self.local, 'routes', None)
+        if routes is None:
+            routes = self.local.routes = {}
+            with self.lock:
+                self.shards.append(routes)
+        return routes
+
+    def observe(self, route, request_time, timings, status=200, error=None):
+        routes = self.shard()
+        metrics = routes.get(route)
+        if metrics is None:
+            metrics = routes[route] = RouteMetrics()
+        metrics.observe(request_time, timings, status, error)
+
+    def routes(self):
+        """ Return the ``RouteMetrics`` of every thread merged by route. """
+        with self.lock:
+            shards = list(self.shards)
+
+        routes = {}
+        for shard in shards:
+            for route, metrics in list(shard.items()):
+                routes.setdefault(route, RouteMetrics()).merge(metrics)
+        return routes
+
+    def as_dict(self):
+        return dict((route, metrics.as_dict())
+                    for route, metrics in self.routes().items())
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    # on the statement's own context, which a failed statement leaves
+    # behind with it
+    if context is not None:
+        context.james_query_start = time.time()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    timings = getattr(current, 'timings', None)
+    if timings is not None:
+        timings.queries += 1
+        start = getattr(context, 'james_query_start', None)
+        if start is not None:
+            timings.db_time += (time.time() - start) * 1000
+
+
+def instrument_engine(engine):
+    """ Count and time the queries ``engine`` executes for each request. """
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+
+def timing_tween_factory(handler, registry):
+    metrics = registry['metrics']
+
+    def timing_tween(request):
+        start = time.time()
+        current.timings = timings = Timings()
+        status = 500
+        try:
+            response = handler(request)
+            status = response.status_int
+        finally:
+            current.timings = None
+
+            request_time = (time.time() - start) * 1000
+            route = request.matched_route.name if request.matched_route \
+                else 'notfound'
+            error = request.environ.get('james.error', 'unhandled') \
+                if status >= 400 else None
+            metrics.observe(route, request_time, timings, status, error)
+
+        response.headers['Server-Timing'] = \
+            'db;desc="{} queries";dur={:.3f}, total;dur={:.3f}'.format(
+                timings.queries, timings.db_time, request_time)
+        return response
+
+    return timing_tween
+
+
+def includeme(config):
+    config.registry['metrics'] = Metrics()
+    config.add_tween('james.instrumentation.timing_tween_factory',
+                     under=INGRESS)
@@ -1,8 +1,10 @@
-from sqlalchemy import engine_from_config
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import configure_mappers
 import zope.sqlalchemy
 
+from ..instrumentation import instrument_engine
+from .engine import create_engine
+
 # import or define all models here to ensure they are attached to the
 # Base.metadata prior to any initialization routines
 from .loan import Loan  # noqa
@@ -14,7 +16,8 @@ configure_mappers()
 
 
 def get_engine(settings, prefix='sqlalchemy.'):
-    return engine_from_config(settings, prefix)
+    """ Return the engine of ``settings``, see ``james.models.engine``. """
+    return create_engine(settings, prefix)
 
 
 def get_session_factory(engine):
@@ -66,7 +69,12 @@ def includeme(config):
     # use pyramid_retry to retry a request when transient exceptions occur
     config.include('pyramid_retry')
 
-    session_factory = get_session_factory(get_engine(settings))
+    # count and time the queries and requests, see james.instrumentation
+    engine = get_engine(settings)
+    instrument_engine(engine)
+    config.include('..instrumentation')
+
+    session_factory = get_session_factory(engine)
     config.registry['dbsession_factory'] = session_factory
 
     # make request.dbsession available for use in Pyramid
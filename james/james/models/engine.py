@@ -0,0 +1,232 @@
+"""
+Engine profiles, chosen by the ``engine.profile`` setting:
+
+- ``sqlite``: every connection is set up with ``PRAGMA`` statements for
+  concurrent use (write-ahead log, ``synchronous = NORMAL``, memory-mapped
+  reads and a busy timeout), and the connections of the process take turns
+  to write, so that waitress threads queue up for the database's single
+  writer instead of failing with "database is locked";
+- ``server``: a pool of connections of bounded size, checked before use and
+  recycled periodically;
+- ``none``: the engine as configured by the ``sqlalchemy.*`` settings alone.
+
+The default, ``auto``, picks ``sqlite`` or ``server`` by the database URL.
+Every setting may also be given as an environment variable, such as
+``ENGINE_SQLITE_BUSY_TIMEOUT``.
+
+"""
+import os
+import threading
+
+from pyramid.settings import asbool, aslist
+from sqlalchemy import engine_from_config, event, exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+from james import get_from_env_or_settings
+
+try:
+    from thread import get_ident
+except ImportError:  # Python 3
+    from threading import get_ident
+
+SQLITE_DEFAULTS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': '268435456',
+    'busy_timeout': '30000',
+    'single_writer': 'true',
+}
+
+SERVER_DEFAULTS = {
+    'pool_size': '10',
+    'max_overflow': '20',
+    'pool_timeout': '30',
+    'pool_pre_ping': 'true',
+    'pool_recycle': '3600',
+}
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class WriteLock(object):
+    """
+    Lets the connections of a single thread at a time write to the database.
+
+    A connection takes the lock before its first write statement and gives
+    it back when its transaction ends, so that a transaction never waits for
+    the database's write lock once it started writing. The thread holding
+    the lock may take it again for any of its connections.
+
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.owner = None
+        self.count = 0
+
+    def acquire(self):
+        thread = get_ident()
+        with self.condition:
+            while self.owner not in (None, thread):
+                self.condition.wait()
+            self.owner = thread
+            self.count += 1
+
+    def release(self):
+        with self.condition:
+            self.count -= 1
+            if not self.count:
+                self.owner = None
+                self.condition.notify()
+
+
+def setting(settings, name, defaults):
+    value = get_from_env_or_settings('engine.' + name, settings)
+    return defaults.get(name.split('.')[-1]) if value is None else value
+
+
+def parse_pragmas(lines):
+    """ Parse ``name = value`` lines into a list of ``(name, value)``. """
+    pragmas = []
+    for line in aslist(lines or '', flatten=False):
+        name, _, value = line.partition('=')
+        pragmas.append((name.strip(), value.strip()))
+    return pragmas
+
+
+def sqlite_pragmas(settings):
+    """
+    Return the ``(name, value)`` pragmas to run on every SQLite connection,
+    the ones of ``engine.sqlite.pragmas`` (``name = value`` lines) last.
+
+    """
+    pragmas = []
+    for name in ('busy_timeout', 'journal_mode', 'synchronous', 'mmap_size'):
+        value = setting(settings, 'sqlite.' + name, SQLITE_DEFAULTS)
+        if value:
+            pragmas.append((name, value))
+    return pragmas + parse_pragmas(
+        get_from_env_or_settings('engine.sqlite.pragmas', settings))
+
+
+def set_pragmas(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+        cursor.close()
+
+
+def serialize_writes(engine, lock):
+    """ Make the connections of ``engine`` take ``lock`` to write. """
+
+    def release(info):
+        if info.pop('write_lock', False):
+            lock.release()
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        if 'write_lock' not in conn.info and \
+                statement.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+            lock.acquire()
+            conn.info['write_lock'] = True
+
+    @event.listens_for(engine, 'commit')
+    def commit(conn):
+        release(conn.info)
+
+    @event.listens_for(engine, 'rollback')
+    def rollback(conn):
+        release(conn.info)
+
+    # connections returned to the pool without ending their transaction
+    @event.listens_for(engine.pool, 'reset')
+    def reset(dbapi_connection, connection_record):
+        release(connection_record.info)
+
+
+def discard_after_fork(engine):
+    """
+    Make a process forked after ``engine`` opened connections open its own
+    instead of sharing those of its parent, which are left untouched.
+
+    """
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        connection_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        pid = os.getpid()
+        if connection_record.info['pid'] != pid:
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError(
+                'Connection of process {} checked out in process {}.'.format(
+                    connection_record.info['pid'], pid))
+
+
+def sqlite_engine(settings, prefix):
+    url = make_url(settings[prefix + 'url'])
+    memory = url.database in (None, '', ':memory:')
+    options = {}
+
+    if not memory:
+        # connections are shared by the threads through a pool of them
+        options['poolclass'] = QueuePool
+        options['connect_args'] = {'check_same_thread': False}
+        for name in ('pool_size', 'max_overflow', 'pool_timeout'):
+            value = get_from_env_or_settings('engine.' + name, settings)
+            if value is not None:
+                options[name] = int(value)
+
+    engine = engine_from_config(settings, prefix, **options)
+    set_pragmas(engine, sqlite_pragmas(settings))
+
+    if not memory and asbool(setting(settings, 'sqlite.single_writer',
+                                     SQLITE_DEFAULTS)):
+        engine.write_lock = WriteLock()
+        serialize_writes(engine, engine.write_lock)
+
+    return engine
+
+
+def server_engine(settings, prefix):
+    def option(name):
+        return setting(settings, name, SERVER_DEFAULTS)
+
+    return engine_from_config(
+        settings, prefix,
+        pool_size=int(option('pool_size')),
+        max_overflow=int(option('max_overflow')),
+        pool_timeout=float(option('pool_timeout')),
+        pool_pre_ping=asbool(option('pool_pre_ping')),
+        pool_recycle=int(option('pool_recycle')),
+    )
+
+
+def create_engine(settings, prefix='sqlalchemy.'):
+    """
+    Return the engine of the ``<prefix>*`` settings, set up by the profile
+    of the ``engine.profile`` setting.
+
+    """
+    profile = get_from_env_or_settings('engine.profile', settings) or 'auto'
+
+    if profile == 'auto':
+        backend = make_url(settings[prefix + 'url']).get_backend_name()
+        profile = 'sqlite' if backend == 'sqlite' else 'server'
+
+    if profile == 'sqlite':
+        engine = sqlite_engine(settings, prefix)
+    elif profile == 'server':
+        engine = server_engine(settings, prefix)
+    elif profile == 'none':
+        engine = engine_from_config(settings, prefix)
+    else:
+        raise ValueError('Unknown engine profile {!r}.'.format(profile))
+
+    discard_after_fork(engine)
+    return engine
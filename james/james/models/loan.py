@@ -1,54 +1,360 @@
-from datetime import datetime
-import math
+from datetime import datetime, time, timedelta
 import uuid
 
 from sqlalchemy import (
+    and_,
+    bindparam,
+    case,
     Column,
     DateTime,
+    event,
     func,
+    inspect,
     Integer,
     Numeric,
-    String
+    or_,
+    select,
 )
+from sqlalchemy.orm import make_transient_to_detached, Session
+from sqlalchemy.sql.expression import type_coerce
 
+from ..amortization import installment
+from ..money import from_cents, to_cents
 from .meta import Base
 from .payment import Payment
+from .types import CompactId, Money
+
+
+# ``datetime.isoformat`` of a naive datetime, without its microseconds
+ISO_FORMAT = '%Y-%m-%dT%H:%M:%S'
 
 
 class InvalidDate(Exception):
     pass
 
 
+def end_of(date):
+    """
+    Return the first instant after the day ``date``, so that a column is
+    compared to a day as ``column < end_of(date)``, which its index serves,
+    instead of ``func.date(column) <= date``, which it does not.
+
+    """
+    return datetime.combine(date + timedelta(days=1), time())
+
+
 class Loan(Base):
     __tablename__ = 'loan'
     
     id = Column(Integer, primary_key=True)
-    loan_id = Column(String(32), index=True, nullable=False,
-                     default=uuid.uuid4().hex)
-    amount = Column(Numeric(19, 10, asdecimal=False), nullable=False)
+    # public id, a hexadecimal UUID stored in 16 bytes
+    loan_id = Column(CompactId, index=True, unique=True, nullable=False,
+                     default=lambda: uuid.uuid4().hex)
+    amount = Column(Money, nullable=False)
     term = Column(Integer, nullable=False)
     rate = Column(Numeric(19, 10, asdecimal=False), nullable=False)
     date = Column(DateTime, nullable=False, index=True)
-    installment = Column(Numeric(19, 10, asdecimal=False), nullable=False)
+    installment = Column(Money, nullable=False)
+    # running count of made payments and date of the latest one, kept up to
+    # date by ``count_made_payments`` and rebuilt by ``reconcile_counters``
+    paid_installments = Column(Integer, nullable=False, default=0)
+    last_payment_date = Column(DateTime)
+
+    # columns that never change once the loan is created, safe to cache
+    immutable_columns = ('id', 'loan_id', 'amount', 'term', 'rate', 'date',
+                         'installment')
     
+    def immutable_attributes(self):
+        """
+        Return the immutable columns of the loan as plain types, its naive
+        ``date`` in ISO 8601, as a cache ``Backend`` stores them.
+
+        """
+        attributes = dict((name, getattr(self, name))
+                          for name in self.immutable_columns)
+        attributes['date'] = attributes['date'].isoformat()
+        return attributes
+
+    @classmethod
+    def from_immutable_attributes(cls, session, attributes):
+        """
+        Return the persistent loan with the given ``immutable_attributes``
+        without querying the database; its other attributes are loaded by
+        primary key if they are ever accessed.
+
+        """
+        date = attributes['date']
+        loan = cls(**dict(attributes, date=datetime.strptime(
+            date, ISO_FORMAT + ('.%f' if '.' in date else ''))))
+        make_transient_to_detached(loan)
+        return session.merge(loan, load=False)
+
     def set_installment_value(self):
-        installment = ((self.rate / self.term) + (self.rate / self.term) / \
-                       ((1 + (self.rate / self.term)) ** self.term - 1)) \
-                      * self.amount
-        self.installment = math.floor(installment * 100) / 100
+        self.installment = installment(self.amount, self.term, self.rate)
+
+    def balance_after(self, paid_installments):
+        """
+        Return the balance left once ``paid_installments`` are paid, computed
+        in cents.
+
+        """
+        return from_cents(to_cents(self.installment) *
+                          (self.term - paid_installments))
 
     def calculate_balance(self, date):
         if date < self.date.date():
             raise InvalidDate
         
-        total = self.installment * self.term
-        
-        if not self.payments.first():
-            return round(total, 2)
+        # every made payment happened on or before ``date``, so the counter
+        # already holds the answer and ``payment`` need not be queried
+        if self.last_payment_date is None or \
+                date >= self.last_payment_date.date():
+            return self.balance_after(self.paid_installments)
         
         query = self.payments
-        query = query.filter(func.date(Payment.date) <= date,
-                             Payment.payment == 'made')
-        paid_installments = query.count() * self.installment
+        query = query.filter(Payment.payment == 'made',
+                             Payment.date < end_of(date))
+
+        return self.balance_after(query.count())
+
+    def balance_series(self, dates):
+        """
+        Return the balance at each of the ascending ``dates``.
+
+        The loan's made payments are loaded once and swept along with the
+        dates, instead of querying them again for every date.
+
+        """
+        if dates and dates[0] < self.date.date():
+            raise InvalidDate
+
+        paid = [date.date() for date, in self.payments.filter(
+            Payment.payment == 'made').with_entities(
+            Payment.date).order_by(Payment.date)]
+
+        balances = []
+        count = 0
+        for date in dates:
+            while count < len(paid) and paid[count] <= date:
+                count += 1
+            balances.append(self.balance_after(count))
+
+        return balances
+
+    def month_index(self, date):
+        """
+        Return the number of calendar months between the loan's date and
+        ``date``, the month a payment on ``date`` is due for.
+
+        """
+        return (date.year - self.date.year) * 12 + \
+            date.month - self.date.month
+
+    def register_payments(self, count, date):
+        """
+        Add ``count`` made payments, the latest of them on ``date``, to the
+        loan's counters.
+
+        Persistent loans are updated with SQL expressions so that concurrent
+        payments are counted by the database instead of overwriting each
+        other.
+
+        """
+        if not inspect(self).persistent:
+            self.paid_installments = (self.paid_installments or 0) + count
+            if self.last_payment_date is None or \
+                    date > self.last_payment_date:
+                self.last_payment_date = date
+            return
+
+        self.paid_installments = Loan.paid_installments + count
+        self.last_payment_date = case(
+            [(or_(Loan.last_payment_date == None,
+                  Loan.last_payment_date < date), date)],
+            else_=Loan.last_payment_date)
+
+    @classmethod
+    def payments_update(cls):
+        """
+        Return an ``UPDATE`` adding ``count`` made payments, the latest of
+        them on ``payment_date``, to the counters of the loan with primary key
+        ``loan``, meant to be executed with many sets of parameters at once.
+
+        """
+        table = cls.__table__
+        date = bindparam('payment_date', type_=DateTime())
+
+        return table.update().where(
+            table.c.id == bindparam('loan')
+        ).values(
+            paid_installments=table.c.paid_installments + bindparam('count'),
+            last_payment_date=case(
+                [(or_(table.c.last_payment_date == None,
+                      table.c.last_payment_date < date), date)],
+                else_=table.c.last_payment_date))
+
+    @classmethod
+    def counters_update(cls):
+        """
+        Return an ``UPDATE`` of the counters of every loan, recomputed from
+        its payments.
+
+        """
+        table = cls.__table__
+        payment = Payment.__table__
+        made = (payment.c.loan_id == table.c.id) & \
+            (payment.c.payment == 'made')
+
+        return table.update().values(
+            paid_installments=select([func.count(payment.c.id)]).where(
+                made).as_scalar(),
+            last_payment_date=select([func.max(payment.c.date)]).where(
+                made).as_scalar())
+
+    @classmethod
+    def reconcile_counters(cls, session):
+        """
+        Rebuild the counters of every loan from its payments.
+
+        """
+        return session.execute(cls.counters_update()).rowcount
+
+    @classmethod
+    def balances_query(cls, session, date):
+        """
+        Return a query of ``(id, balance)`` rows, one per loan issued on or
+        before ``date``, with the balance computed by the database.
+
+        Made payments are counted in a single grouped subquery, so the whole
+        book is priced in one statement instead of one ``calculate_balance``
+        call per loan, and balances are multiplied out in integer cents.
+
+        """
+        paid = session.query(
+            Payment.loan_id.label('loan_id'),
+            func.count(Payment.id).label('paid')
+        ).filter(
+            Payment.payment == 'made',
+            Payment.date < end_of(date)
+        ).group_by(Payment.loan_id).subquery()
+
+        balance = type_coerce(
+            cls.installment * (cls.term - func.coalesce(paid.c.paid, 0)),
+            Money)
+
+        return session.query(
+            cls.id.label('id'),
+            balance.label('balance')
+        ).outerjoin(
+            paid, paid.c.loan_id == cls.id
+        ).filter(cls.date < end_of(date))
+
+    @classmethod
+    def outstanding_debt(cls, session, date):
+        """
+        Return the ``(value, volume)`` of the debt outstanding on ``date``:
+        the sum of every loan balance and the number of loans whose balance is
+        not zero.
+
+        """
+        balances = cls.balances_query(session, date).subquery()
+
+        value, volume = session.query(
+            func.coalesce(func.sum(balances.c.balance), 0),
+            func.coalesce(func.sum(
+                case([(balances.c.balance > 0, 1)], else_=0)), 0)
+        ).one()
+
+        return value, int(volume)
+
+    @classmethod
+    def page_query(cls, session, after=None, start=None, end=None,
+                   term=None, rate=None):
+        """
+        Return a query of the immutable columns of the loans issued from
+        ``start`` to before ``end``, with the given ``term`` and ``rate``,
+        ordered by ``(date, id)``.
+
+        ``after``, the ``(date, id)`` of the last loan of the previous page,
+        seeks to the loans after it through the index on ``date`` instead of
+        counting past the previous pages with an offset.
+
+        """
+        query = session.query(*[getattr(cls, name)
+                                for name in cls.immutable_columns])
+
+        if start is not None:
+            query = query.filter(cls.date >= start)
+        if end is not None:
+            query = query.filter(cls.date < end)
+        if term is not None:
+            query = query.filter(cls.term == term)
+        if rate is not None:
+            query = query.filter(cls.rate == rate)
+        if after is not None:
+            date, id = after
+            query = query.filter(cls.date >= date, or_(
+                cls.date > date, and_(cls.date == date, cls.id > id)))
+
+        return query.order_by(cls.date, cls.id)
+
+    @classmethod
+    def export_query(cls, session, date):
+        """
+        Return a query of ``balances_query`` rows with the ``loan_id``,
+        ``amount``, ``term``, ``rate``, ``date`` and ``installment`` of each
+        loan as well, in the order the loans were created.
+
+        """
+        return cls.balances_query(session, date).add_columns(
+            cls.loan_id, cls.amount, cls.term, cls.rate, cls.date,
+            cls.installment
+        ).order_by(cls.id)
+
+
+def payment_loan(session, payment):
+    if payment.loan is None and payment.loan_id is not None:
+        return session.query(Loan).get(payment.loan_id)
+    return payment.loan
+
+
+@event.listens_for(Session, 'before_flush')
+def index_payment_months(session, flush_context, instances):
+    """
+    Set the ``month_index`` of the payments about to be inserted without one.
+
+    """
+    for obj in session.new:
+        if not isinstance(obj, Payment) or obj.month_index is not None or \
+                obj.date is None:
+            continue
+
+        loan = payment_loan(session, obj)
+        if loan is not None and loan.date is not None:
+            obj.month_index = loan.month_index(obj.date)
+
+
+@event.listens_for(Session, 'before_flush')
+def count_made_payments(session, flush_context, instances):
+    """
+    Register the made payments about to be inserted in their loans' counters,
+    so that the counters are updated in the same flush and transaction as the
+    payments themselves.
+
+    """
+    payments = {}
+
+    for obj in session.new:
+        if not isinstance(obj, Payment) or obj.payment != 'made' or \
+                obj.date is None:
+            continue
+
+        loan = payment_loan(session, obj)
+        if loan is None:
+            continue
+
+        count, date = payments.get(loan, (0, obj.date))
+        payments[loan] = (count + 1, max(date, obj.date))
 
-        return round(total - paid_installments, 2)
+    for loan, (count, date) in payments.items():
+        loan.register_payments(count, date)
@@ -7,22 +7,31 @@ from sqlalchemy import (
     ForeignKey,
     Index,
     Integer,
-    Numeric,
     String,
     UniqueConstraint
 )
 from sqlalchemy.orm import backref, relationship
 
 from .meta import Base
+from .types import Money
 
 
 class Payment(Base):
     __tablename__ = 'payment'
     
     id = Column(Integer, primary_key=True)
-    loan_id = Column(Integer, ForeignKey('loan.id'), nullable=False, index=True)
+    loan_id = Column(Integer, ForeignKey('loan.id'), nullable=False)
     loan = relationship('Loan', backref=backref('payments', lazy='dynamic'),
                         foreign_keys=[loan_id])
-    payment = Column(String(6), index=True, nullable=False)
+    payment = Column(String(6), nullable=False)
     date = Column(DateTime, nullable=False, index=True)
-    amount = Column(Numeric(19, 10, asdecimal=False), nullable=False)
+    amount = Column(Money, nullable=False)
+    # months since the loan's date, only one payment is allowed per month
+    month_index = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('loan_id', 'month_index'),
+        # covers the made payments of a loan up to a date, in date order,
+        # without reading the table
+        Index('ix_payment_loan_id_payment_date', 'loan_id', 'payment', 'date'),
+    )
@@ -0,0 +1,66 @@
+import uuid
+
+from sqlalchemy.types import BigInteger, LargeBinary, TypeDecorator
+
+from ..money import from_cents, to_cents
+
+
+def canonical_id(value):
+    """
+    Return the hexadecimal form of the UUID ``value`` (in any form accepted
+    by ``uuid.UUID``), the form ``CompactId`` values are read back in, or
+    ``value`` itself if it is not a UUID.
+
+    """
+    try:
+        return uuid.UUID(hex=value).hex
+    except (AttributeError, TypeError, ValueError):
+        return value
+
+
+class CompactId(TypeDecorator):
+    """
+    Hexadecimal UUID, such as ``Loan.loan_id``, stored as its 16 bytes.
+
+    Values are hexadecimal strings in Python. A string that is not a UUID is
+    bound unchanged, so that looking it up finds nothing instead of failing.
+
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self):
+        super(CompactId, self).__init__(length=16)
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return uuid.UUID(hex=value).bytes
+        except (AttributeError, TypeError, ValueError):
+            return value if isinstance(value, bytes) else value.encode('utf-8')
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return uuid.UUID(bytes=bytes(value)).hex
+
+
+class Money(TypeDecorator):
+    """
+    Amount of money stored as an integer number of cents.
+
+    Values are floats of currency units in Python, rounded to the cent when
+    stored; in SQL they are cents, so sums and products stay exact integers.
+
+    """
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_cents(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_cents(value)
@@ -0,0 +1,19 @@
+"""
+Amounts of money are stored and added up as integer cents, so that sums and
+balances are exact, and exposed as floats of currency units.
+
+"""
+
+
+def to_cents(value):
+    """ Return the integer number of cents of ``value`` units. """
+    return int(round(value * 100))
+
+
+def from_cents(cents):
+    """
+    Return ``cents`` as a float of currency units. ``cents`` may be a
+    ``Decimal``, as PostgreSQL returns the ``SUM`` of a ``BIGINT`` column.
+
+    """
+    return int(cents) / 100.0
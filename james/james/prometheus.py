@@ -0,0 +1,136 @@
+"""
+Exposition of the application's metrics in the Prometheus text format:
+requests by route and status, errors by reason, latency histograms, the
+usage of the database connection pool and the hit ratio of the caches.
+
+"""
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# caches of the registry, by the name they are exported with
+CACHES = (('loans', 'loan_cache'), ('balances', 'balance_cache'))
+
+# methods of the SQLAlchemy pools exported as gauges
+POOL_GAUGES = (
+    ('size', 'Number of connections the pool keeps open.'),
+    ('checkedout', 'Number of connections in use.'),
+    ('checkedin', 'Number of idle connections in the pool.'),
+    ('overflow', 'Number of connections open beyond the pool size.'),
+)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+class Exposition(object):
+    """ Lines of a text exposition, written one metric family at a time. """
+
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name, kind, help):
+        self.lines.append('# HELP {} {}'.format(name, help))
+        self.lines.append('# TYPE {} {}'.format(name, kind))
+
+    def sample(self, name, labels, value):
+        if labels:
+            name += '{' + ','.join('{}="{}"'.format(key, escape(label))
+                                   for key, label in labels) + '}'
+        self.lines.append('{} {}'.format(name, format_value(value)))
+
+    def histogram(self, name, labels, histogram, scale=1):
+        for bound, total in histogram.cumulative():
+            self.sample(name + '_bucket',
+                        labels + (('le', format_value(bound * scale)),),
+                        total)
+        self.sample(name + '_sum', labels, histogram.sum * scale)
+        self.sample(name + '_count', labels, histogram.count)
+
+    def text(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+def request_metrics(exposition, metrics):
+    routes = sorted(metrics.routes().items())
+
+    exposition.family('james_http_requests_total', 'counter',
+                      'Requests handled, by route and status.')
+    for route, values in routes:
+        for status, count in sorted(values.responses.items()):
+            exposition.sample('james_http_requests_total',
+                              (('route', route), ('status', status)), count)
+
+    exposition.family('james_http_errors_total', 'counter',
+                      'Error responses, by route, status and reason.')
+    for route, values in routes:
+        for (status, reason), count in sorted(values.errors.items()):
+            exposition.sample(
+                'james_http_errors_total',
+                (('route', route), ('status', status), ('reason', reason)),
+                count)
+
+    for name, attribute, help, scale in (
+            ('james_http_request_duration_seconds', 'request_time',
+             'Time taken to handle requests.', 0.001),
+            ('james_http_request_db_duration_seconds', 'db_time',
+             'Time requests spent in the database.', 0.001),
+            ('james_http_request_queries', 'queries',
+             'SQL queries executed by requests.', 1)):
+        exposition.family(name, 'histogram', help)
+        for route, values in routes:
+            exposition.histogram(name, (('route', route),),
+                                 getattr(values, attribute), scale)
+
+
+def pool_metrics(exposition, pool):
+    for method, help in POOL_GAUGES:
+        # not every pool class keeps track of all of them
+        if not callable(getattr(pool, method, None)):
+            continue
+        name = 'james_db_pool_' + method
+        exposition.family(name, 'gauge', help)
+        exposition.sample(name, (), getattr(pool, method)())
+
+
+def cache_metrics(exposition, caches):
+    for name, kind, help, value in (
+            ('james_cache_hits_total', 'counter', 'Cache hits.',
+             lambda stats: stats['hits']),
+            ('james_cache_misses_total', 'counter', 'Cache misses.',
+             lambda stats: stats['misses']),
+            ('james_cache_entries', 'gauge', 'Entries in the cache.',
+             lambda stats: stats['size']),
+            ('james_cache_hit_ratio', 'gauge',
+             'Ratio of cache lookups that were hits.',
+             lambda stats: float(stats['hits']) /
+             ((stats['hits'] + stats['misses']) or 1))):
+        exposition.family(name, kind, help)
+        for cache, stats in caches:
+            exposition.sample(name, (('cache', cache),), value(stats))
+
+
+def render(registry):
+    """ Return the metrics of the application of ``registry`` as text. """
+    exposition = Exposition()
+
+    request_metrics(exposition, registry['metrics'])
+
+    factory = registry.get('dbsession_factory')
+    if factory is not None and factory.kw.get('bind') is not None:
+        pool_metrics(exposition, factory.kw['bind'].pool)
+
+    cache_metrics(exposition, [(name, registry[key].stats())
+                               for name, key in CACHES
+                               if registry.get(key) is not None])
+
+    return exposition.text()
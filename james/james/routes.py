@@ -3,11 +3,26 @@ from pyramid.security import Allow
 
 def includeme(config):
     config.add_static_view('static', 'static', cache_max_age=3600)
+    config.add_route('list_loans', '/loans', request_method='GET',
+                     factory=LoanResource)
     config.add_route('add_loan', '/loans', factory=LoanResource)
+    config.add_route('add_loans', '/loans/batch', factory=LoanResource)
+    config.add_route('export_loans', '/loans/export', factory=LoanResource)
     config.add_route('add_payment', '/loans/{loan_id}/payments',
                      factory=LoanResource)
     config.add_route('balance', '/loans/{loan_id}/balance',
                      factory=LoanResource)
+    config.add_route('balance_series', '/loans/{loan_id}/balance/series',
+                     factory=LoanResource)
+    config.add_route('schedule', '/loans/{loan_id}/schedule',
+                     factory=LoanResource)
+    config.add_route('add_payments', '/payments/batch', factory=LoanResource)
+    config.add_route('quotes', '/quotes', factory=LoanResource)
+    config.add_route('portfolio_balance', '/portfolio/balance',
+                     factory=LoanResource)
+    config.add_route('metrics', '/metrics', factory=LoanResource)
+    config.add_route('request_metrics', '/metrics/requests',
+                     factory=LoanResource)
 
 
 class LoanResource(object):
@@ -0,0 +1,56 @@
+import io
+import json
+import os
+import sys
+import transaction
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from pyramid.scripts.common import parse_vars
+
+from ..batch import create_payments, parse_records
+from ..models import (
+    get_engine,
+    get_session_factory,
+    get_tm_session,
+    )
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> <payments_file> [var=value]\n'
+          '(example: "%s development.ini payments.ndjson")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) < 3:
+        usage(argv)
+    config_uri = argv[1]
+    payments_file = argv[2]
+    options = parse_vars(argv[3:])
+    setup_logging(config_uri)
+    settings = get_appsettings(config_uri, options=options)
+
+    with io.open(payments_file, encoding='utf-8') as f:
+        records = parse_records(f.read())
+
+    engine = get_engine(settings)
+    session_factory = get_session_factory(engine)
+
+    with transaction.manager:
+        dbsession = get_tm_session(session_factory, transaction.manager)
+        results, _ = create_payments(dbsession, records)
+
+    errors = 0
+    for row, result in enumerate(results, 1):
+        if 'error' in result:
+            errors += 1
+            print(json.dumps({'row': row, 'error': result['error']},
+                             sort_keys=True))
+
+    print('{} payments added, {} rejected.'.format(len(results) - errors,
+                                                   errors))
@@ -2,12 +2,18 @@ import os
 import sys
 import transaction
 
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
 from pyramid.paster import (
     get_appsettings,
     setup_logging,
     )
 
 from pyramid.scripts.common import parse_vars
+from sqlalchemy import inspect
 
 from ..models.meta import Base
 from ..models import (
@@ -24,6 +30,44 @@ def usage(argv):
     sys.exit(1)
 
 
+def alembic_config(config_uri, settings):
+    """ Return the Alembic configuration of ``config_uri``. """
+    config = Config(config_uri.split('#')[0])
+    config.attributes['settings'] = settings
+    return config
+
+
+def up_to_date(engine):
+    """ Return whether the tables of ``engine`` match the models. """
+    with engine.connect() as connection:
+        differences = compare_metadata(MigrationContext.configure(connection),
+                                       Base.metadata)
+    return not [difference for difference in differences
+                if difference[0] != 'remove_table']
+
+
+def initialize(engine, config):
+    """
+    Create the tables of an empty database and mark it as up to date, or
+    bring an existing one up to date with its pending migrations.
+
+    A database created before migrations existed is first marked with the
+    first revision, the original schema, unless it already matches the
+    models.
+
+    """
+    tables = inspect(engine).get_table_names()
+    if not tables:
+        Base.metadata.create_all(engine)
+        command.stamp(config, 'head')
+        return
+
+    if 'alembic_version' not in tables:
+        command.stamp(config, 'head' if up_to_date(engine) else
+                      ScriptDirectory.from_config(config).get_base())
+    command.upgrade(config, 'head')
+
+
 def main(argv=sys.argv):
     if len(argv) < 2:
         usage(argv)
@@ -33,7 +77,6 @@ def main(argv=sys.argv):
     settings = get_appsettings(config_uri, options=options)
 
     engine = get_engine(settings)
-    Base.metadata.drop_all(engine)
-    Base.metadata.create_all(engine)
+    initialize(engine, alembic_config(config_uri, settings))
 
     session_factory = get_session_factory(engine)
@@ -0,0 +1,216 @@
+"""
+Serve the application from several processes sharing one listening socket.
+
+The parent process binds the addresses of ``listen`` in ``[server:main]``
+then forks ``server.workers`` workers (one per CPU by default), each of which
+loads the application, and so creates its engine and pool of connections,
+only after the fork, before serving the socket with waitress and the other
+settings of ``[server:main]``. Workers that die are replaced, after a delay
+that doubles with every worker in a row exiting within ``MIN_UPTIME``
+seconds, and it gives up after ``MAX_FAILURES`` of them; ``SIGINT`` and
+``SIGTERM`` stop them all.
+
+Caches in process memory are not shared by the workers, so it refuses to
+start several with ``balances.cache.enabled`` unless ``balances.cache.backend``
+names a shared one.
+
+"""
+import errno
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+import plaster
+import waitress
+from pyramid.paster import (
+    get_app,
+    get_appsettings,
+    setup_logging,
+    )
+
+from pyramid.scripts.common import parse_vars
+from pyramid.settings import asbool
+
+from .. import get_from_env_or_settings
+
+BACKLOG = 1024
+
+# workers exiting sooner than MIN_UPTIME seconds after their start are
+# replaced after BACKOFF seconds, doubled for each such exit in a row up to
+# MAX_BACKOFF, until MAX_FAILURES of them in a row stop the server
+MIN_UPTIME = 5
+BACKOFF = 0.5
+MAX_BACKOFF = 10
+MAX_FAILURES = 5
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> [var=value]\n'
+          '(example: "%s production.ini")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def bind(listen):
+    """ Return listening sockets bound to the ``host:port`` of ``listen``. """
+    sockets = []
+    for address in listen.split():
+        host, _, port = address.rpartition(':')
+        host = host.strip('[]')
+        if host in ('', '*'):
+            host = '0.0.0.0'
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, int(port)))
+        sock.listen(BACKLOG)
+        sockets.append(sock)
+    return sockets
+
+
+def private_balance_cache(settings):
+    """
+    Whether the balances cache is enabled in the memory of each process,
+    where a worker adding a payment cannot invalidate the others' balances.
+
+    """
+    def setting(name):
+        return get_from_env_or_settings('balances.cache.' + name, settings)
+
+    return asbool(setting('enabled')) and setting('backend') in (
+        None, 'james.cache.MemoryBackend', 'james.cache:MemoryBackend')
+
+
+def serve(config_uri, options, sockets, server_settings):
+    """ Load the application and serve ``sockets`` until stopped. """
+    app = get_app(config_uri, options=options)
+    waitress.serve(app, sockets=sockets, **server_settings)
+
+
+class Arbiter(object):
+    """ Forks ``workers`` processes running ``target`` and keeps them up. """
+
+    def __init__(self, target, workers, min_uptime=MIN_UPTIME,
+                 backoff=BACKOFF, max_backoff=MAX_BACKOFF,
+                 max_failures=MAX_FAILURES):
+        self.target = target
+        self.workers = workers
+        self.min_uptime = min_uptime
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_failures = max_failures
+        # start time of every worker by pid
+        self.pids = {}
+        self.failures = 0
+        self.stopping = False
+        self.status = 0
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.pids[pid] = time.time()
+            return pid
+
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        status = 0
+        try:
+            self.target()
+        except KeyboardInterrupt:
+            pass
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            os._exit(status)
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    def exited(self, started):
+        """
+        Count a worker started at ``started`` that just exited, returning
+        how long to wait before replacing it, or ``None`` to give up.
+
+        """
+        if time.time() - started >= self.min_uptime:
+            self.failures = 0
+            return 0
+        self.failures += 1
+        if self.failures >= self.max_failures:
+            return None
+        return min(self.backoff * 2 ** (self.failures - 1), self.max_backoff)
+
+    def run(self):
+        """ Serve until stopped, returning the exit status of the server. """
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        for _ in range(self.workers):
+            self.spawn()
+
+        while self.pids:
+            try:
+                pid, _ = os.wait()
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            started = self.pids.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+
+            delay = self.exited(started)
+            if delay is None:
+                sys.stderr.write(
+                    '{} workers in a row exited within {} seconds of their '
+                    'start, stopping.\n'.format(self.failures,
+                                                self.min_uptime))
+                self.status = 1
+                self.stop()
+                continue
+            if delay:
+                time.sleep(delay)
+            if not self.stopping:
+                self.spawn()
+
+        return self.status
+
+
+def main(argv=sys.argv):
+    if len(argv) < 2:
+        usage(argv)
+    config_uri = argv[1]
+    options = parse_vars(argv[2:])
+    setup_logging(config_uri)
+    settings = get_appsettings(config_uri, options=options)
+
+    workers = int(get_from_env_or_settings('server.workers', settings) or
+                  multiprocessing.cpu_count())
+
+    if workers > 1 and private_balance_cache(settings):
+        sys.exit('balances.cache.enabled needs a shared balances.cache.backend '
+                 'with {} workers: disable it or set server.workers = 1.'
+                 .format(workers))
+
+    server_settings = dict(plaster.get_settings(config_uri, 'server:main'))
+    server_settings.pop('use', None)
+    sockets = bind(server_settings.pop('listen', '*:6543'))
+
+    print('Serving on {} with {} workers.'.format(
+        ', '.join('{}:{}'.format(*sock.getsockname()[:2])
+                  for sock in sockets), workers))
+    sys.stdout.flush()
+
+    sys.exit(Arbiter(
+        lambda: serve(config_uri, options, sockets, server_settings),
+        workers).run())
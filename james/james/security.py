@@ -1,22 +1,177 @@
 import hashlib
+import hmac
+import io
+import os
+import threading
+import time
 
 from pyramid.authentication import AuthTktAuthenticationPolicy
 from pyramid.authorization import ACLAuthorizationPolicy
+from pyramid.settings import aslist
 
+from james import get_from_env_or_settings
+
+
+def digest(key):
+    if not isinstance(key, bytes):
+        key = key.encode('utf-8')
+    return hashlib.sha256(key).hexdigest()
+
+
+def parse_keys(lines):
+    """
+    Parse ``name = key`` lines into a list of ``(name, key)`` pairs. A name
+    may appear more than once, so that a key being rotated out is accepted
+    along with its replacement.
+
+    """
+    keys = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        name, _, key = line.partition('=')
+        keys.append((name.strip(), key.strip()))
+    return keys
+
+
+class ApiKeyAuthenticationPolicy(AuthTktAuthenticationPolicy):
+    """
+    Authenticate API clients by the ``authorization`` header, which must hold
+    the hexadecimal SHA256 digest of one of the named API ``keys``.
+
+    The digests are computed once, when the keys are set, and the header is
+    compared with every one of them in constant time. Requests with the
+    header are never looked up in the auth ticket cookie.
+
+    Keys can also be read from ``keys_file`` (``name = key`` lines), which is
+    read again whenever it changes, checked at most every
+    ``check_interval`` seconds, to rotate keys without a restart.
+
+    """
+
+    def __init__(self, secret, keys=(), keys_file=None, check_interval=5,
+                 **kwargs):
+        super(ApiKeyAuthenticationPolicy, self).__init__(secret, **kwargs)
+        self.keys = {}
+        self.file_keys = {}
+        self.digests = ()
+        self.keys_file = keys_file
+        self.check_interval = check_interval
+        self.keys_file_mtime = None
+        self.next_check = 0
+        self.lock = threading.Lock()
+
+        for name, key in keys:
+            self.keys.setdefault(name, []).append(key)
+        self.load_keys_file()
+        self.update_digests()
+
+    def rotate(self, name, *keys):
+        """
+        Replace the keys named ``name`` with ``keys``, or remove them if there
+        are none.
+
+        """
+        with self.lock:
+            if keys:
+                self.keys[name] = list(keys)
+            else:
+                self.keys.pop(name, None)
+            self.update_digests()
+
+    def update_digests(self):
+        digests = []
+        for keys in (self.keys, self.file_keys):
+            for name, values in keys.items():
+                digests.extend((digest(value).encode('ascii'), name)
+                               for value in values)
+        self.digests = tuple(digests)
+
+    def load_keys_file(self):
+        """
+        Read the keys of ``keys_file`` again if it changed, returning whether
+        it did.
+
+        """
+        if not self.keys_file:
+            return False
+
+        try:
+            mtime = os.path.getmtime(self.keys_file)
+        except OSError:
+            mtime = None
+        if mtime == self.keys_file_mtime:
+            return False
+
+        file_keys = {}
+        if mtime is not None:
+            with io.open(self.keys_file, encoding='utf-8') as f:
+                for name, key in parse_keys(f):
+                    file_keys.setdefault(name, []).append(key)
+
+        self.file_keys = file_keys
+        self.keys_file_mtime = mtime
+        return True
+
+    def check_keys_file(self):
+        now = time.time()
+        if not self.keys_file or now < self.next_check:
+            return
+
+        with self.lock:
+            self.next_check = now + self.check_interval
+            if self.load_keys_file():
+                self.update_digests()
+
+    def verify(self, header):
+        """
+        Return the name of the key whose digest is ``header``, or ``None``.
+
+        """
+        self.check_keys_file()
+
+        if not isinstance(header, bytes):
+            header = header.encode('utf-8')
+
+        match = None
+        for value, name in self.digests:
+            if hmac.compare_digest(value, header):
+                match = name
+        return match
 
-class AuthenticationPolicy(AuthTktAuthenticationPolicy):
     def unauthenticated_userid(self, request):
-        if request.headers.get('authorization') == hashlib.sha256(request.registry.settings.get('api.key', '')).hexdigest():
-            return 'API'
+        header = request.headers.get('authorization')
 
-        return super(AuthenticationPolicy, self).unauthenticated_userid(request)
+        if header is None:
+            return super(ApiKeyAuthenticationPolicy,
+                         self).unauthenticated_userid(request)
 
+        name = self.verify(header)
+        if name is None:
+            return None
 
-def includeme(config):
-    settings = config.get_settings()
-    authn_policy = AuthenticationPolicy(
+        request.environ['james.api_key'] = name
+        return 'API'
+
+
+def authentication_policy(settings):
+    """ Return the API key authentication policy of ``settings``. """
+    keys = parse_keys(aslist(
+        get_from_env_or_settings('api.keys', settings) or '', flatten=False))
+    if settings.get('api.key'):
+        keys.insert(0, ('default', settings['api.key']))
+
+    return ApiKeyAuthenticationPolicy(
         settings['auth.secret'],
+        keys=keys,
+        keys_file=get_from_env_or_settings('api.keys_file', settings),
+        check_interval=float(settings.get('api.keys_file.check_interval', 5)),
         hashalg='sha512',
     )
-    config.set_authentication_policy(authn_policy)
+
+
+def includeme(config):
+    config.set_authentication_policy(
+        authentication_policy(config.get_settings()))
     config.set_authorization_policy(ACLAuthorizationPolicy())
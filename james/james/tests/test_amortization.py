@@ -0,0 +1,99 @@
+from datetime import datetime
+import unittest
+
+import numpy as np
+
+from james import amortization
+from james.models import Loan
+
+
+class TestInstallments(unittest.TestCase):
+
+    def test_same_as_loan(self):
+        amounts = [100.10, 1000.0, 2500.55, 150000.0]
+        terms = [1, 12, 36, 360]
+        rates = [0.05, 0.87, 0.1234, 1.5]
+
+        grid = np.array(np.meshgrid(amounts, terms, rates)).reshape(3, -1)
+        values = amortization.installments(*grid)
+
+        for amount, term, rate, installment in zip(grid[0], grid[1], grid[2],
+                                                   values):
+            loan = Loan(amount=float(amount), term=int(term),
+                        rate=float(rate), date=datetime.now())
+            loan.set_installment_value()
+            self.assertEquals(installment, loan.installment)
+
+            self.assertEquals(installment, amortization.installment(
+                float(amount), int(term), float(rate)))
+
+    def test_quotes(self):
+        amounts, terms, rates, installments = amortization.quotes(
+            [1000, 2000], 12, [0.05, 0.1])
+
+        self.assertEquals(amounts.tolist(), [1000, 2000])
+        self.assertEquals(terms.tolist(), [12, 12])
+        self.assertEquals(rates.tolist(), [0.05, 0.1])
+        self.assertEquals(installments[0], 85.6)
+
+        amounts, terms, rates, installments = amortization.quotes(
+            [1000, 2000], [12, 24, 36], [0.05, 0.1], grid=True)
+
+        self.assertEquals(len(installments), 12)
+        self.assertEquals((amounts[0], terms[0], rates[0], installments[0]),
+                          (1000, 12, 0.05, 85.6))
+        self.assertEquals((amounts[-1], terms[-1], rates[-1]), (2000, 36, 0.1))
+
+        with self.assertRaises(ValueError):
+            amortization.quotes([1000, 2000], [12, 24, 36], 0.05)
+
+
+class TestSchedules(unittest.TestCase):
+
+    def test_schedule(self):
+        schedule = amortization.schedule(1000, 12, 0.05)
+
+        self.assertEquals(len(schedule), 12)
+        self.assertEquals(schedule[0], {'period': 1, 'payment': 85.6,
+                                        'interest': 4.17, 'principal': 81.43,
+                                        'balance': 918.57})
+        self.assertEquals(schedule[-1]['period'], 12)
+        self.assertEquals(schedule[-1]['balance'], 0)
+        self.assertAlmostEquals(sum(p['principal'] for p in schedule), 1000,
+                                places=1)
+
+    def test_schedules(self):
+        result = amortization.schedules([1000, 500, 2000], [12, 3, 24],
+                                        [0.05, 0.1, 0.2])
+
+        for key in ('payment', 'interest', 'principal', 'balance'):
+            self.assertEquals(result[key].shape, (3, 24))
+
+        np.testing.assert_allclose(result['principal'].sum(axis=1),
+                                   [1000, 500, 2000])
+        np.testing.assert_allclose(result['payment'][:, 1],
+                                   amortization.installments(
+                                       [1000, 500, 2000], [12, 3, 24],
+                                       [0.05, 0.1, 0.2]))
+        np.testing.assert_allclose(
+            result['payment'] - result['interest'], result['principal'])
+        self.assertEquals(result['payment'][1, 3:].tolist(), [0] * 21)
+        self.assertEquals(result['balance'][:, -1].tolist(), [0, 0, 0])
+
+    def test_iter_schedules(self):
+        amounts = np.linspace(1000, 5000, 25)
+        terms = np.arange(1, 26)
+        rates = np.full(25, 0.1)
+
+        whole = amortization.schedules(amounts, terms, rates)
+        starts = []
+        for start, chunk in amortization.iter_schedules(
+                amounts, terms, rates, chunk_size=10):
+            starts.append(start)
+            size = chunk['balance'].shape[0]
+            np.testing.assert_allclose(
+                chunk['balance'],
+                whole['balance'][start:start + size,
+                                 :chunk['balance'].shape[1]])
+
+        self.assertEquals(starts, [0, 10, 20])
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+
+from james.models.meta import Base
+
+try:
+    import asyncio
+    import aiosqlite  # noqa
+    from james.asgi import main
+except (ImportError, SyntaxError):
+    main = None
+
+
+@unittest.skipIf(main is None, 'requires Python 3.6+ and the asgi extra')
+class TestApplication(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        url = 'sqlite:///{}'.format(os.path.join(self.directory,
+                                                 'james.sqlite'))
+        Base.metadata.create_all(create_engine(url))
+
+        self.app = main({}, **{'sqlalchemy.url': url,
+                               'auth.secret': 'seekrit', 'api.key': 'key'})
+        self.loop = asyncio.new_event_loop()
+        self.headers = [(b'authorization',
+                         hashlib.sha256(b'key').hexdigest().encode('ascii'))]
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.app.engine.dispose())
+        self.loop.close()
+        shutil.rmtree(self.directory)
+
+    def completed(self, value=None):
+        future = self.loop.create_future()
+        future.set_result(value)
+        return future
+
+    def post(self, path, data, headers=None):
+        body = data if isinstance(data, bytes) else \
+            json.dumps(data).encode('utf-8')
+        scope = {'type': 'http', 'method': 'POST', 'path': path,
+                 'headers': self.headers if headers is None else headers}
+        messages = []
+
+        def receive():
+            return self.completed({'type': 'http.request', 'body': body})
+
+        def send(message):
+            messages.append(message)
+            return self.completed()
+
+        self.loop.run_until_complete(self.app(scope, receive, send))
+
+        return messages[0]['status'], json.loads(messages[1]['body'])
+
+    def add_loan(self):
+        status, body = self.post('/loans', {
+            'amount': 1000, 'term': 12, 'rate': 0.05,
+            'date': '2017-08-05 02:18Z'})
+        self.assertEqual(status, 200)
+        return body
+
+    def test_add_loan(self):
+        body = self.add_loan()
+
+        self.assertEqual(len(body['loan_id']), 32)
+        self.assertEqual(body['installment'], 85.6)
+
+    def test_add_payment_and_balance(self):
+        loan_id = self.add_loan()['loan_id']
+        payment = {'payment': 'made', 'date': '2017-09-05 02:18Z',
+                   'amount': 85.6}
+
+        status, body = self.post('/loans/{}/payments'.format(loan_id),
+                                 payment)
+        self.assertEqual((status, body), (200, {'success': 'Payment added.'}))
+
+        status, body = self.post('/loans/{}/payments'.format(loan_id),
+                                 payment)
+        self.assertEqual((status, body),
+                         (409, {'error': 'Duplicated payment.'}))
+
+        status, body = self.post('/loans/{}/balance'.format(loan_id),
+                                 {'date': '2017-10-01'})
+        self.assertEqual((status, body), (200, {'balance': 941.6}))
+
+    def test_fraction_of_cent(self):
+        loan_id = self.add_loan()['loan_id']
+        payment = {'payment': 'made', 'date': '2017-09-05 02:18Z',
+                   'amount': 85.604}
+
+        status, body = self.post('/loans/{}/payments'.format(loan_id),
+                                 payment)
+        self.assertEqual((status, body), (400, {
+            'amount': 'Value must be a whole number of cents'}))
+
+    def test_errors(self):
+        self.assertEqual(self.post('/loans', {'amount': 1000})[0], 400)
+        self.assertEqual(self.post('/loans', b'not json'),
+                         (400, {'error': 'Invalid JSON.'}))
+        self.assertEqual(self.post('/loans/unknown/balance',
+                                   {'date': '2017-10-01'}), (404, {}))
+        self.assertEqual(self.post('/loans', {}, headers=[]), (403, {}))
+        self.assertEqual(self.post('/quotes', {}), (404, {}))
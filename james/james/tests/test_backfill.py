@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+
+from james.backfill import backfill, progress, reset
+
+
+class TestBackfill(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = create_engine('sqlite:///{}'.format(
+            os.path.join(self.directory, 'james.sqlite')))
+        self.engine.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, '
+                            'x INTEGER)')
+        for id in range(1, 11):
+            self.engine.execute('INSERT INTO t VALUES (?, ?)', id, id)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def values(self):
+        return [x for x, in self.engine.execute('SELECT x FROM t ORDER BY id')]
+
+    def double(self, connection, first_id, last_id):
+        self.chunks.append((first_id, last_id))
+        connection.execute('UPDATE t SET x = x * 2 WHERE id BETWEEN ? AND ?',
+                           first_id, last_id)
+
+    def test_chunks(self):
+        self.chunks = []
+
+        self.assertEquals(backfill(self.engine, 'double', 't', self.double,
+                                   chunk_size=4), 10)
+
+        self.assertEquals(self.chunks, [(1, 4), (5, 8), (9, 10)])
+        self.assertEquals(self.values(), [id * 2 for id in range(1, 11)])
+
+        # a completed backfill does nothing
+        self.assertEquals(backfill(self.engine, 'double', 't', self.double),
+                          0)
+        self.assertEquals(self.chunks, [(1, 4), (5, 8), (9, 10)])
+
+        # unless it is reset
+        reset(self.engine, 'double')
+        self.assertEquals(backfill(self.engine, 'double', 't', self.double),
+                          10)
+
+    def test_resume(self):
+        self.chunks = []
+
+        def fail(connection, first_id, last_id):
+            self.double(connection, first_id, last_id)
+            if first_id > 1:
+                raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            backfill(self.engine, 'double', 't', fail, chunk_size=4)
+        # the failed chunk is rolled back
+        self.assertEquals(self.values(), [2, 4, 6, 8] + list(range(5, 11)))
+
+        # rows inserted after the backfill started are left alone
+        self.engine.execute('INSERT INTO t VALUES (11, 11)')
+
+        self.chunks = []
+        self.assertEquals(backfill(self.engine, 'double', 't', self.double,
+                                   chunk_size=4), 6)
+        self.assertEquals(self.chunks, [(5, 8), (9, 10)])
+        self.assertEquals(self.values(),
+                          [id * 2 for id in range(1, 11)] + [11])
+        self.assertEquals(self.engine.execute(
+            progress.select()).fetchall(), [('double', 10, 10)])
+
+    def test_empty(self):
+        self.engine.execute('DELETE FROM t')
+        self.assertEquals(backfill(self.engine, 'double', 't', self.double),
+                          0)
@@ -0,0 +1,98 @@
+import time
+import unittest
+
+from datetime import date
+
+from james.cache import BalanceCache, Cache, make_cache, MemoryBackend
+
+
+class TestMemoryBackend(unittest.TestCase):
+
+    def test_lru(self):
+        backend = MemoryBackend(2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        self.assertEquals(backend.get('a'), 1)
+
+        backend.set('c', 3)
+        self.assertEquals(len(backend), 2)
+        self.assertIsNone(backend.get('b'))
+        self.assertEquals(backend.get('a'), 1)
+        self.assertEquals(backend.get('c'), 3)
+
+        backend.delete('a')
+        self.assertIsNone(backend.get('a'))
+
+        backend.clear()
+        self.assertEquals(len(backend), 0)
+
+    def test_ttl(self):
+        backend = MemoryBackend(2, ttl=0.01)
+        backend.set('a', 1)
+        self.assertEquals(backend.get('a'), 1)
+
+        time.sleep(0.02)
+        self.assertIsNone(backend.get('a'))
+        self.assertEquals(len(backend), 0)
+
+
+class TestCache(unittest.TestCase):
+
+    def test_stats(self):
+        cache = Cache(MemoryBackend(10))
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', {'id': 1})
+        self.assertEquals(cache.get('a'), {'id': 1})
+        self.assertEquals(cache.get('a'), {'id': 1})
+
+        self.assertEquals(cache.stats(), {'hits': 2, 'misses': 1, 'size': 1})
+
+    def test_make_cache(self):
+        cache = make_cache({'test.max_size': '5', 'test.ttl': '0'}, 'test.')
+        self.assertIsInstance(cache.backend, MemoryBackend)
+        self.assertEquals(cache.backend.max_size, 5)
+        self.assertIsNone(cache.backend.ttl)
+
+        cache = make_cache(
+            {'test.backend': 'james.cache.MemoryBackend'}, 'test.')
+        self.assertEquals(cache.backend.max_size, 10000)
+        self.assertEquals(cache.backend.ttl, 3600)
+
+        self.assertIsNone(make_cache({'test.enabled': 'false'}, 'test.'))
+        self.assertIsNone(make_cache({}, 'test.', enabled=False))
+        self.assertIsInstance(make_cache({}, 'test.', BalanceCache),
+                              BalanceCache)
+
+
+class TestBalanceCache(unittest.TestCase):
+
+    def test_invalidate(self):
+        cache = BalanceCache(MemoryBackend(10))
+        self.assertIsNone(cache.get_balance('a', date(2017, 1, 1)))
+
+        a, b = cache.generation('a'), cache.generation('b')
+        cache.set_balance('a', date(2017, 1, 1), 100.0, a)
+        cache.set_balance('a', date(2017, 2, 1), 0.0, a)
+        cache.set_balance('b', date(2017, 1, 1), 50.0, b)
+
+        self.assertEquals(cache.get_balance('a', date(2017, 1, 1)), 100.0)
+        self.assertEquals(cache.get_balance('a', date(2017, 2, 1)), 0.0)
+        self.assertIsNone(cache.get_balance('a', date(2017, 3, 1)))
+
+        cache.invalidate('a')
+
+        self.assertIsNone(cache.get_balance('a', date(2017, 1, 1)))
+        self.assertIsNone(cache.get_balance('a', date(2017, 2, 1)))
+        self.assertEquals(cache.get_balance('b', date(2017, 1, 1)), 50.0)
+        self.assertEquals(cache.stats()['hits'], 3)
+        self.assertEquals(cache.stats()['misses'], 4)
+
+    def test_invalidated_while_computing(self):
+        cache = BalanceCache(MemoryBackend(10))
+        generation = cache.generation('a')
+
+        # a payment commits while the balance is computed
+        cache.invalidate('a')
+        cache.set_balance('a', date(2017, 1, 1), 100.0, generation)
+
+        self.assertIsNone(cache.get_balance('a', date(2017, 1, 1)))
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from sqlalchemy.pool import QueuePool
+
+from james.models.engine import WriteLock, create_engine
+
+
+class TestCreateEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.url = 'sqlite:///{}'.format(
+            os.path.join(self.directory, 'james.sqlite'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def pragma(self, engine, name):
+        return engine.execute('PRAGMA {}'.format(name)).scalar()
+
+    def test_sqlite(self):
+        engine = create_engine({'sqlalchemy.url': self.url})
+
+        self.assertEquals(self.pragma(engine, 'journal_mode'), 'wal')
+        self.assertEquals(self.pragma(engine, 'synchronous'), 1)
+        self.assertEquals(self.pragma(engine, 'busy_timeout'), 30000)
+        self.assertIsInstance(engine.pool, QueuePool)
+        self.assertIsInstance(engine.write_lock, WriteLock)
+
+    def test_sqlite_settings(self):
+        engine = create_engine({
+            'sqlalchemy.url': self.url,
+            'engine.sqlite.synchronous': 'full',
+            'engine.sqlite.single_writer': 'false',
+            'engine.sqlite.pragmas': 'cache_size = -4000\nforeign_keys = on',
+        })
+
+        self.assertEquals(self.pragma(engine, 'synchronous'), 2)
+        self.assertEquals(self.pragma(engine, 'cache_size'), -4000)
+        self.assertEquals(self.pragma(engine, 'foreign_keys'), 1)
+        self.assertFalse(hasattr(engine, 'write_lock'))
+
+    def test_environment(self):
+        os.environ['ENGINE_SQLITE_BUSY_TIMEOUT'] = '1000'
+        try:
+            engine = create_engine({'sqlalchemy.url': self.url})
+        finally:
+            del os.environ['ENGINE_SQLITE_BUSY_TIMEOUT']
+
+        self.assertEquals(self.pragma(engine, 'busy_timeout'), 1000)
+
+    def test_none(self):
+        engine = create_engine({'sqlalchemy.url': self.url,
+                                'engine.profile': 'none'})
+
+        self.assertEquals(self.pragma(engine, 'journal_mode'), 'delete')
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            create_engine({'sqlalchemy.url': self.url,
+                           'engine.profile': 'unknown'})
+
+    def test_write_lock(self):
+        engine = create_engine({'sqlalchemy.url': self.url})
+        engine.execute('CREATE TABLE t (x INTEGER)')
+
+        connection = engine.connect()
+        transaction = connection.begin()
+        connection.execute('INSERT INTO t VALUES (1)')
+        connection.execute('INSERT INTO t VALUES (2)')
+        self.assertEquals(engine.write_lock.count, 1)
+
+        transaction.commit()
+        connection.close()
+        self.assertIsNone(engine.write_lock.owner)
+
+        # autocommitted statements give the lock back right away
+        engine.execute('INSERT INTO t VALUES (3)')
+        self.assertIsNone(engine.write_lock.owner)
+
+    def test_after_fork(self):
+        engine = create_engine({'sqlalchemy.url': self.url})
+        connection = engine.connect()
+        parent = connection.connection.connection
+        connection.close()
+
+        read, write = os.pipe()
+        pid = os.fork()
+        if not pid:
+            # the child opens its own connection instead of the parent's
+            connection = engine.connect()
+            child = connection.connection.connection
+            connection.execute('SELECT 1')
+            os.write(write, b'1' if child is not parent else b'0')
+            os._exit(0)
+
+        os.waitpid(pid, 0)
+        self.assertEquals(os.read(read, 1), b'1')
+        with engine.connect() as connection:
+            self.assertIs(connection.connection.connection, parent)
+            self.assertEquals(connection.execute('SELECT 1').scalar(), 1)
+
+
+class TestWriteLock(unittest.TestCase):
+
+    def test_threads(self):
+        lock = WriteLock()
+        events = []
+
+        def write():
+            lock.acquire()
+            events.append('acquired')
+            lock.release()
+
+        lock.acquire()
+        lock.acquire()
+        thread = threading.Thread(target=write)
+        thread.start()
+        lock.release()
+        time.sleep(0.05)
+        self.assertEquals(events, [])
+
+        lock.release()
+        thread.join()
+        self.assertEquals(events, ['acquired'])
@@ -0,0 +1,9 @@
+import unittest
+
+
+class TestImportPayments(unittest.TestCase):
+
+    def test_usage(self):
+        from ..scripts.importpayments import main
+        with self.assertRaises(SystemExit):
+            main(argv=['foo', 'development.ini'])
@@ -1,5 +1,10 @@
 import os
+import shutil
+import tempfile
 import unittest
+import uuid
+
+from alembic import command
 
 
 class TestInitializeDB(unittest.TestCase):
@@ -14,3 +19,72 @@ class TestInitializeDB(unittest.TestCase):
         main(argv=['foo', 'development.ini'])
         self.assertTrue(os.path.exists('james.sqlite'))
         os.remove('james.sqlite')
+
+    def test_initialize(self):
+        from alembic.migration import MigrationContext
+        from sqlalchemy import create_engine
+        from ..scripts.initializedb import alembic_config, initialize
+
+        directory = tempfile.mkdtemp()
+        try:
+            url = 'sqlite:///{}'.format(os.path.join(directory,
+                                                     'james.sqlite'))
+            engine = create_engine(url)
+            config = alembic_config('development.ini',
+                                    {'sqlalchemy.url': url})
+
+            initialize(engine, config)
+            engine.execute("INSERT INTO loan (loan_id, amount, term, rate, "
+                           "date, installment, paid_installments) VALUES "
+                           "(x'00', 100000, 12, 0.05, '2017-08-05', 8560, 0)")
+            # an existing database is migrated, never dropped
+            initialize(engine, config)
+
+            self.assertEquals(
+                engine.execute('SELECT count(*) FROM loan').scalar(), 1)
+            with engine.connect() as connection:
+                self.assertEquals(
+                    MigrationContext.configure(connection).get_current_heads(),
+                    ('8cb8d58952a8',))
+            engine.dispose()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_initialize_before_migrations(self):
+        from sqlalchemy import create_engine
+        from ..scripts.initializedb import alembic_config, initialize
+
+        directory = tempfile.mkdtemp()
+        try:
+            url = 'sqlite:///{}'.format(os.path.join(directory,
+                                                     'james.sqlite'))
+            engine = create_engine(url)
+            config = alembic_config('development.ini',
+                                    {'sqlalchemy.url': url})
+
+            # the original schema, without alembic_version
+            command.upgrade(config, 'd3a66b81fef7')
+            engine.execute('DROP TABLE alembic_version')
+            engine.execute("INSERT INTO loan (loan_id, amount, term, rate, "
+                           "date, installment) VALUES ('{}', 1000, 12, 0.05, "
+                           "'2017-08-05', 85.6)".format(uuid.uuid4().hex))
+
+            initialize(engine, config)
+
+            self.assertEquals(engine.execute(
+                'SELECT amount, paid_installments FROM loan').first(),
+                (100000, 0))
+            self.assertEquals(self.heads(engine), ('8cb8d58952a8',))
+
+            # and one created by create_all, up to date
+            engine.execute('DROP TABLE alembic_version')
+            initialize(engine, config)
+            self.assertEquals(self.heads(engine), ('8cb8d58952a8',))
+            engine.dispose()
+        finally:
+            shutil.rmtree(directory)
+
+    def heads(self, engine):
+        from alembic.migration import MigrationContext
+        with engine.connect() as connection:
+            return MigrationContext.configure(connection).get_current_heads()
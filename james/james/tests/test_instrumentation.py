@@ -0,0 +1,133 @@
+import threading
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+
+from james import prometheus
+from james.cache import Cache, MemoryBackend
+from james.instrumentation import (
+    current,
+    Histogram,
+    instrument_engine,
+    Metrics,
+    Timings,
+    )
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_observe(self):
+        histogram = Histogram((1, 5, float('inf')))
+        for value in (0.5, 1, 3, 7, 100):
+            histogram.observe(value)
+
+        self.assertEquals(histogram.as_dict(), {
+            'buckets': {'1': 2, '5': 3, '+Inf': 5},
+            'count': 5,
+            'sum': 111.5,
+        })
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_observe(self):
+        metrics = Metrics()
+        timings = Timings()
+        timings.queries = 2
+        timings.db_time = 1.5
+
+        metrics.observe('balance', 4.0, timings)
+        metrics.observe('balance', 6.0, Timings())
+
+        result = metrics.as_dict()
+        self.assertEquals(list(result), ['balance'])
+        self.assertEquals(result['balance']['count'], 2)
+        self.assertEquals(result['balance']['request_time_ms']['sum'], 10.0)
+        self.assertEquals(result['balance']['db_time_ms']['sum'], 1.5)
+        self.assertEquals(result['balance']['queries']['buckets']['0'], 1)
+        self.assertEquals(result['balance']['queries']['buckets']['2'], 2)
+
+    def test_errors(self):
+        metrics = Metrics()
+        metrics.observe('add_payment', 1.0, Timings(), 201)
+        metrics.observe('add_payment', 1.0, Timings(), 409,
+                        'duplicated_payment')
+        metrics.observe('add_payment', 1.0, Timings(), 409,
+                        'duplicated_payment')
+
+        result = metrics.as_dict()['add_payment']
+        self.assertEquals(result['responses'], {'201': 1, '409': 2})
+        self.assertEquals(result['errors'],
+                          {'409': {'duplicated_payment': 2}})
+
+    def test_threads(self):
+        metrics = Metrics()
+
+        def observe():
+            for i in range(100):
+                metrics.observe('balance', 1.0, Timings())
+
+        threads = [threading.Thread(target=observe) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(len(metrics.shards), 4)
+        self.assertEquals(metrics.as_dict()['balance']['count'], 400)
+
+
+class TestInstrumentEngine(unittest.TestCase):
+
+    def test_failed_statement(self):
+        engine = create_engine('sqlite://')
+        instrument_engine(engine)
+        current.timings = timings = Timings()
+        try:
+            with engine.connect() as connection:
+                with self.assertRaises(OperationalError):
+                    connection.execute('SELECT * FROM missing')
+                connection.execute('SELECT 1')
+
+                self.assertNotIn('query_start', connection.info)
+        finally:
+            del current.timings
+
+        self.assertEquals(timings.queries, 1)
+        self.assertGreaterEqual(timings.db_time, 0)
+
+
+class TestPrometheus(unittest.TestCase):
+
+    def test_render(self):
+        metrics = Metrics()
+        metrics.observe('balance', 4.0, Timings(), 404, 'loan_not_found')
+        cache = Cache(MemoryBackend(10))
+        cache.get('a')
+        cache.set('a', {'id': 1})
+        cache.get('a')
+        registry = {'metrics': metrics, 'loan_cache': cache}
+
+        text = prometheus.render(registry)
+
+        self.assertIn('james_http_requests_total{route="balance",status="404"}'
+                      ' 1\n', text)
+        self.assertIn('james_http_errors_total{route="balance",status="404",'
+                      'reason="loan_not_found"} 1\n', text)
+        self.assertIn('james_http_request_duration_seconds_bucket{'
+                      'route="balance",le="0.005"} 1\n', text)
+        self.assertIn('james_http_request_duration_seconds_sum{'
+                      'route="balance"} 0.004\n', text)
+        self.assertIn('james_cache_hit_ratio{cache="loans"} 0.5\n', text)
+        self.assertNotIn('cache="balances"', text)
+
+    def test_pool(self):
+        engine = create_engine('sqlite://', poolclass=QueuePool)
+        exposition = prometheus.Exposition()
+
+        prometheus.pool_metrics(exposition, engine.pool)
+
+        self.assertIn('james_db_pool_size 5', exposition.lines)
+        self.assertIn('james_db_pool_checkedout 0', exposition.lines)
@@ -0,0 +1,125 @@
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import uuid
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from james.models import Loan, Payment
+from james.models.meta import Base
+
+INITIAL = 'd3a66b81fef7'
+
+
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        url = 'sqlite:///{}'.format(os.path.join(self.directory,
+                                                 'james.sqlite'))
+        self.engine = create_engine(url)
+        self.config = Config()
+        self.config.set_main_option('script_location', 'james:alembic')
+        self.config.attributes['settings'] = {'sqlalchemy.url': url}
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def differences(self):
+        with self.engine.connect() as connection:
+            differences = compare_metadata(
+                MigrationContext.configure(connection), Base.metadata)
+        return [difference for difference in differences
+                if difference[:1] != ('remove_table',) or
+                difference[1].name != 'backfill']
+
+    def test_head_matches_models(self):
+        command.upgrade(self.config, 'head')
+        self.assertEquals(self.differences(), [])
+
+    def test_upgrade_existing_rows(self):
+        command.upgrade(self.config, INITIAL)
+        loan_ids = [uuid.UUID(int=id).hex for id in (1, 2)]
+        for id, loan_id in enumerate(loan_ids, 1):
+            self.engine.execute(
+                "INSERT INTO loan (id, loan_id, amount, term, rate, date, "
+                "installment) VALUES (?, ?, 1000.5, 12, 0.05, "
+                "'2017-08-05 02:18:00.000000', 85.64)", id, loan_id)
+        for month, payment in ((9, 'made'), (10, 'missed'), (11, 'made')):
+            self.engine.execute(
+                "INSERT INTO payment (loan_id, payment, date, amount) VALUES "
+                "(1, ?, '2017-{:02d}-05 02:18:00.000000', 85.64)".format(
+                    month), payment)
+
+        command.upgrade(self.config, 'head')
+
+        self.assertEquals(self.engine.execute(
+            'SELECT amount, installment FROM loan WHERE id = 1').first(),
+            (100050, 8564))
+        session = sessionmaker(bind=self.engine)()
+        loan = session.query(Loan).filter_by(loan_id=loan_ids[0]).one()
+        self.assertEquals((loan.amount, loan.installment), (1000.5, 85.64))
+        self.assertEquals(loan.paid_installments, 2)
+        self.assertEquals(loan.last_payment_date, datetime(2017, 11, 5, 2, 18))
+        self.assertEquals(
+            [month for month, in session.query(Payment.month_index).order_by(
+                Payment.id)], [1, 2, 3])
+        self.assertEquals(loan.calculate_balance(datetime(2017, 10, 1).date()),
+                          round(11 * 85.64, 2))
+        self.assertEquals(session.query(Loan).filter_by(
+            loan_id=loan_ids[1]).one().paid_installments, 0)
+        session.close()
+
+        command.downgrade(self.config, INITIAL)
+
+        self.assertEquals(self.engine.execute(
+            'SELECT loan_id, amount, installment FROM loan WHERE id = 1'
+        ).first(), (loan_ids[0], 1000.5, 85.64))
+
+        # and up again
+        command.upgrade(self.config, 'head')
+        self.assertEquals(self.engine.execute(
+            'SELECT amount FROM payment ORDER BY id').fetchall(),
+            [(8564,)] * 3)
+        self.assertEquals(self.differences(), [])
+
+    def test_duplicated_loan_ids(self):
+        command.upgrade(self.config, INITIAL)
+        # the original default gave every loan of a process the same id
+        loan_id = uuid.uuid4().hex
+        for id in (1, 2, 3):
+            self.engine.execute(
+                "INSERT INTO loan (id, loan_id, amount, term, rate, date, "
+                "installment) VALUES (?, ?, 1000, 12, 0.05, "
+                "'2017-08-05 02:18:00.000000', 85.6)", id, loan_id)
+
+        command.upgrade(self.config, 'head')
+
+        session = sessionmaker(bind=self.engine)()
+        loan_ids = [loan.loan_id for loan in session.query(Loan).order_by(
+            Loan.id)]
+        session.close()
+        self.assertEquals(loan_ids[0], loan_id)
+        self.assertEquals(len(set(loan_ids)), 3)
+
+    def test_large_amounts(self):
+        command.upgrade(self.config, INITIAL)
+        # more cents than a 32-bit integer holds
+        self.engine.execute(
+            "INSERT INTO loan (id, loan_id, amount, term, rate, date, "
+            "installment) VALUES (1, ?, 50000000.25, 360, 0.05, "
+            "'2017-08-05 02:18:00.000000', 268410.87)", uuid.uuid4().hex)
+
+        command.upgrade(self.config, 'head')
+
+        self.assertEquals(self.engine.execute(
+            'SELECT amount, installment FROM loan WHERE id = 1').first(),
+            (5000000025, 26841087))
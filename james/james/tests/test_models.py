@@ -1,12 +1,16 @@
 from datetime import datetime
+from decimal import Decimal
+import json
 import unittest
 import transaction
 
 from pyramid import testing
+from sqlalchemy import event
 from sqlalchemy.exc import IntegrityError
 
 from james.models import Loan, Payment
-from james.models.loan import InvalidDate
+from james.models.loan import InvalidDate, end_of
+from james.models.types import Money
 
 
 class BaseTest(unittest.TestCase):
@@ -53,6 +57,67 @@ class TestLoan(BaseTest):
 
         self.assertIsNotNone(loan.loan_id)
         self.assertEquals(loan.installment, 85.6)
+
+    def test_immutable_attributes(self):
+        for date in (datetime(2017, 8, 5, 2, 18), datetime(2017, 8, 5, 2, 18,
+                                                         0, 1500)):
+            loan = Loan(amount=1000, term=12, rate=0.05, date=date)
+            loan.set_installment_value()
+            self.session.add(loan)
+            self.session.flush()
+
+            attributes = loan.immutable_attributes()
+            self.assertEquals(json.loads(json.dumps(attributes)), attributes)
+
+            self.session.expunge(loan)
+            cached = Loan.from_immutable_attributes(self.session, attributes)
+            self.assertEquals(cached.date, date)
+            self.assertEquals(cached.installment, 85.6)
+
+    def test_compact_loan_id(self):
+        loans = [Loan(amount=1000.0, term=12, rate=0.05, date=datetime.now(),
+                      installment=85.6) for i in range(2)]
+        self.session.add_all(loans)
+        self.session.flush()
+
+        self.assertNotEquals(loans[0].loan_id, loans[1].loan_id)
+        self.assertEquals(len(loans[0].loan_id), 32)
+        self.assertEquals(self.session.execute(
+            'SELECT typeof(loan_id), length(loan_id) FROM loan WHERE id = :id',
+            {'id': loans[0].id}).fetchall(), [('blob', 16)])
+
+        self.session.expire_all()
+        self.assertEquals(self.session.query(Loan.id).filter_by(
+            loan_id=loans[1].loan_id).scalar(), loans[1].id)
+        self.assertIsNone(self.session.query(Loan.id).filter_by(
+            loan_id='unknown').scalar())
+
+    def test_money_in_cents(self):
+        loan = Loan(amount=0.3, term=3, rate=0.05, date=datetime.now(),
+                    installment=0.1)
+        self.session.add(loan)
+        self.session.flush()
+
+        self.assertEquals(self.session.execute(
+            'SELECT amount, installment FROM loan WHERE id = :id',
+            {'id': loan.id}).first(), (30, 10))
+        # 0.1 * 3 is 0.30000000000000004 in floats
+        self.assertEquals(loan.balance_after(0), 0.3)
+
+    def test_money_sum_as_decimal(self):
+        # PostgreSQL sums BIGINT columns as NUMERIC
+        self.assertEquals(Money().process_result_value(
+            Decimal('2147483648'), None), 21474836.48)
+
+    def test_duplicated_loan_id(self):
+        loan_id = 'a' * 32
+        for i in range(2):
+            self.session.add(Loan(loan_id=loan_id, amount=1000.0, term=12,
+                                  rate=0.05, date=datetime.now(),
+                                  installment=85.6))
+        with self.assertRaises(IntegrityError):
+            self.session.flush()
+        self.session.rollback()
     
     def test_missing_fields(self):
         with self.assertRaises(IntegrityError):
@@ -126,6 +191,169 @@ class TestLoan(BaseTest):
         with self.assertRaises(InvalidDate):
             loan.calculate_balance(datetime(1979, 9, 4).date())
 
+    def test_balance_end_of_day(self):
+        loan = Loan(amount=100.10, term=12, rate=0.87, date=datetime(2017, 1, 1),
+                    installment=78.90)
+        self.session.add_all([
+            loan,
+            Payment(loan=loan, payment='made',
+                    date=datetime(2017, 1, 31, 23, 59, 59, 999999),
+                    amount=78.90),
+            Payment(loan=loan, payment='made', date=datetime(2017, 2, 28, 12),
+                    amount=78.90),
+        ])
+        self.session.flush()
+
+        self.assertEquals(loan.calculate_balance(datetime(2017, 1, 30).date()),
+                          round(12 * 78.9, 2))
+        self.assertEquals(loan.calculate_balance(datetime(2017, 1, 31).date()),
+                          round(11 * 78.9, 2))
+        self.assertEquals(dict(Loan.balances_query(
+            self.session, datetime(2017, 1, 31).date()))[loan.id],
+            round(11 * 78.9, 2))
+
+    def test_balance_uses_index(self):
+        loan = Loan(amount=100.10, term=12, rate=0.87, date=datetime(2017, 1, 1),
+                    installment=78.90)
+        self.session.add(loan)
+        self.session.flush()
+
+        query = loan.payments.filter(
+            Payment.payment == 'made',
+            Payment.date < end_of(datetime(2017, 1, 31).date()))
+        statement = query.with_entities(Payment.id).statement.compile(
+            compile_kwargs={'literal_binds': True})
+        plan = ' '.join(str(row[-1]) for row in self.session.execute(
+            'EXPLAIN QUERY PLAN {}'.format(statement)))
+
+        self.assertIn('COVERING INDEX ix_payment_loan_id_payment_date', plan)
+
+    def test_balance_one_query(self):
+        loan = Loan(amount=100.10, term=12, rate=0.87, date=datetime(2017, 1, 1),
+                    installment=78.90)
+        self.session.add(loan)
+        self.session.add(Payment(loan=loan, payment='made',
+                                 date=datetime(2017, 2, 1), amount=78.90,
+                                 month_index=1))
+        self.session.flush()
+
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = self.session.get_bind()
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            balance = loan.calculate_balance(datetime(2017, 1, 15).date())
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+
+        self.assertEquals(balance, round(12 * 78.9, 2))
+        self.assertEquals(len(statements), 1)
+
+    def test_balance_series(self):
+        loan = Loan(amount=100.10, term=12, rate=0.87, date=datetime(2017, 1, 1),
+                    installment=78.90)
+        self.session.add_all([
+            loan,
+            Payment(loan=loan, payment='made', date=datetime(2017, 1, 10),
+                    amount=78.90),
+            Payment(loan=loan, payment='missed', date=datetime(2017, 2, 10),
+                    amount=78.90),
+            Payment(loan=loan, payment='made', date=datetime(2017, 3, 10),
+                    amount=78.90),
+        ])
+        self.session.flush()
+
+        dates = [datetime(2017, month, 1).date() for month in range(1, 6)] + \
+            [datetime(2017, 3, 10).date()]
+        dates.sort()
+
+        self.assertEquals(loan.balance_series(dates),
+                          [loan.calculate_balance(date) for date in dates])
+        self.assertEquals(loan.balance_series([]), [])
+
+        with self.assertRaises(InvalidDate):
+            loan.balance_series([datetime(2016, 12, 31).date()])
+
+    def test_payment_counters(self):
+        loan = Loan(amount=100.10, term=12, rate=0.87, date=datetime(2017, 1, 1),
+                    installment=78.90)
+        self.session.add_all([
+            loan,
+            Payment(loan=loan, payment='made', date=datetime(2017, 2, 1),
+                    amount=78.90),
+            Payment(loan=loan, payment='made', date=datetime(2017, 1, 1),
+                    amount=78.90),
+        ])
+        self.session.flush()
+
+        self.assertEquals(loan.paid_installments, 2)
+        self.assertEquals(loan.last_payment_date, datetime(2017, 2, 1))
+
+        self.session.add_all([
+            Payment(loan=loan, payment='missed', date=datetime(2017, 4, 1),
+                    amount=78.90),
+            Payment(loan_id=loan.id, payment='made', date=datetime(2017, 3, 1),
+                    amount=78.90),
+        ])
+        self.session.flush()
+
+        self.assertEquals(loan.paid_installments, 3)
+        self.assertEquals(loan.last_payment_date, datetime(2017, 3, 1))
+        self.assertEquals(loan.calculate_balance(datetime(2017, 4, 1).date()),
+                          round(9 * 78.9, 2))
+
+        loan.paid_installments = 0
+        loan.last_payment_date = None
+        self.session.flush()
+
+        self.assertEquals(Loan.reconcile_counters(self.session), 1)
+        self.session.expire(loan)
+        self.assertEquals(loan.paid_installments, 3)
+        self.assertEquals(loan.last_payment_date, datetime(2017, 3, 1))
+
+    def test_outstanding_debt(self):
+        self.assertEquals(
+            Loan.outstanding_debt(self.session, datetime(2017, 1, 1).date()),
+            (0, 0))
+
+        loan_1 = Loan(amount=100.10, term=12, rate=0.87,
+                      date=datetime(2017, 1, 1), installment=78.90)
+        loan_2 = Loan(amount=1000.0, term=2, rate=0.05,
+                      date=datetime(2017, 1, 15), installment=512.5)
+        loan_3 = Loan(amount=1000.0, term=12, rate=0.05,
+                      date=datetime(2017, 6, 1), installment=85.6)
+        self.session.add_all([loan_1, loan_2, loan_3])
+        self.session.add_all([
+            Payment(loan=loan_1, payment='made', date=datetime(2017, 1, 1),
+                    amount=78.90),
+            Payment(loan=loan_1, payment='missed', date=datetime(2017, 2, 1),
+                    amount=78.90),
+            Payment(loan=loan_2, payment='made', date=datetime(2017, 1, 20),
+                    amount=512.5),
+            Payment(loan=loan_2, payment='made', date=datetime(2017, 2, 20),
+                    amount=512.5),
+        ])
+        self.session.flush()
+
+        self.assertEquals(
+            Loan.outstanding_debt(self.session, datetime(2017, 1, 15).date()),
+            (round(11 * 78.9 + 2 * 512.5, 2), 2))
+        self.assertEquals(
+            Loan.outstanding_debt(self.session, datetime(2017, 3, 1).date()),
+            (round(11 * 78.9, 2), 1))
+        self.assertEquals(
+            Loan.outstanding_debt(self.session, datetime(2017, 6, 1).date()),
+            (round(11 * 78.9 + 12 * 85.6, 2), 2))
+
+        balances = dict(Loan.balances_query(self.session,
+                                            datetime(2017, 6, 1).date()))
+        for loan in [loan_1, loan_2, loan_3]:
+            self.assertEquals(balances[loan.id],
+                loan.calculate_balance(datetime(2017, 6, 1).date()))
+
 
 class TestPayment(BaseTest):
 
@@ -138,6 +366,38 @@ class TestPayment(BaseTest):
         self.session.flush()
 
         self.assertEquals(loan.id, payment.loan_id)
+        self.assertEquals(payment.month_index, 0)
+
+    def test_month_index(self):
+        loan = Loan(amount=100.10, term=12, rate=0.87,
+                    date=datetime(2017, 11, 20), installment=78.90)
+        self.session.add(loan)
+        self.session.flush()
+
+        self.assertEquals(loan.month_index(datetime(2017, 11, 30)), 0)
+        self.assertEquals(loan.month_index(datetime(2017, 12, 1)), 1)
+        self.assertEquals(loan.month_index(datetime(2018, 2, 1)), 3)
+
+        payment = Payment(loan_id=loan.id, payment='made',
+                          date=datetime(2018, 1, 5), amount=78.90)
+        self.session.add(payment)
+        self.session.flush()
+
+        self.assertEquals(payment.month_index, 2)
+
+    def test_duplicated_month(self):
+        loan = Loan(amount=100.10, term=12, rate=0.87,
+                    date=datetime(2017, 1, 1), installment=78.90)
+        self.session.add(loan)
+        self.session.add(Payment(loan=loan, payment='made',
+                                 date=datetime(2017, 1, 1), amount=78.90))
+        self.session.flush()
+
+        with self.assertRaises(IntegrityError):
+            self.session.add(Payment(loan=loan, payment='missed',
+                                     date=datetime(2017, 1, 31), amount=78.90))
+            self.session.flush()
+        self.session.rollback()
     
     def test_missing_fields(self):
         loan = Loan(amount=100.10, term=12, rate=0.87, date=datetime.now(),
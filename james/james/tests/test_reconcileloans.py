@@ -0,0 +1,9 @@
+import unittest
+
+
+class TestReconcileLoans(unittest.TestCase):
+
+    def test_usage(self):
+        from ..scripts.reconcileloans import main
+        with self.assertRaises(SystemExit):
+            main(argv=['foo'])
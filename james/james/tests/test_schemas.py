@@ -0,0 +1,58 @@
+from datetime import datetime
+import unittest
+
+from james.views.schemas import (
+    create_loan_schema,
+    create_payment_schema,
+    validate,
+    validate_many,
+    )
+
+
+class TestValidate(unittest.TestCase):
+
+    def test_validate(self):
+        items, errors = validate(create_loan_schema, {
+            'amount': 1000, 'term': 12, 'rate': 0.05,
+            'date': '2017-08-05 02:18Z'})
+
+        self.assertIsNone(errors)
+        self.assertEquals(items['term'], 12)
+        self.assertEquals(items['date'].replace(tzinfo=None),
+                          datetime(2017, 8, 5, 2, 18))
+
+        items, errors = validate(create_loan_schema, {
+            'amount': 'text', 'term': -1, 'rate': 0.05})
+
+        self.assertIsNone(items)
+        self.assertEquals(errors, {'amount': '"text" is not a number',
+                                   'term': 'Value must be greater than zero',
+                                   'date': 'Required'})
+
+    def test_whole_cents(self):
+        payment = {'payment': 'made', 'date': '2017-08-05 02:18Z'}
+
+        for amount in (85.6, 85.61, 0.07, 1e9 + 0.01):
+            items, errors = validate(create_payment_schema,
+                                     dict(payment, amount=amount))
+            self.assertIsNone(errors)
+            self.assertEquals(items['amount'], amount)
+
+        for amount in (85.604, 85.6000001, 0.001):
+            items, errors = validate(create_payment_schema,
+                                     dict(payment, amount=amount))
+            self.assertEquals(errors, {
+                'amount': 'Value must be a whole number of cents'})
+
+    def test_validate_many(self):
+        results = validate_many(create_loan_schema, [
+            {'amount': 1000, 'term': 12, 'rate': 0.05,
+             'date': '2017-08-05 02:18Z'},
+            None,
+            {}])
+
+        self.assertEquals(len(results), 3)
+        self.assertIsNone(results[0][1])
+        self.assertEquals(results[1], (None, 'Invalid JSON.'))
+        self.assertEquals(sorted(results[2][1]),
+                          ['amount', 'date', 'rate', 'term'])
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyramid import testing
+
+from james.security import ApiKeyAuthenticationPolicy, parse_keys
+
+
+class TestParseKeys(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEquals(
+            parse_keys(['reports = abc', '', '# comment', 'reports=a=b ',
+                        'billing = xyz']),
+            [('reports', 'abc'), ('reports', 'a=b'), ('billing', 'xyz')])
+
+
+class TestApiKeyAuthenticationPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = ApiKeyAuthenticationPolicy(
+            'seekrit', keys=[('reports', 'old'), ('reports', 'new'),
+                             ('billing', 'key')], hashalg='sha512')
+
+    def request(self, key=None, **kwargs):
+        request = testing.DummyRequest(**kwargs)
+        if key is not None:
+            request.headers['authorization'] = hashlib.sha256(key).hexdigest()
+        return request
+
+    def test_keys(self):
+        for key, name in [('old', 'reports'), ('new', 'reports'),
+                          ('key', 'billing')]:
+            request = self.request(key)
+            self.assertEquals(self.policy.unauthenticated_userid(request),
+                              'API')
+            self.assertEquals(request.environ['james.api_key'], name)
+
+        self.assertIsNone(
+            self.policy.unauthenticated_userid(self.request('unknown')))
+        self.assertIsNone(self.policy.unauthenticated_userid(self.request()))
+
+    def test_header_skips_auth_ticket(self):
+        request = self.request()
+        request.headers['authorization'] = 'invalid'
+        request.cookies['auth_tkt'] = 'any'
+
+        self.policy.cookie.identify = lambda request: self.fail(
+            'auth ticket was parsed')
+        self.assertIsNone(self.policy.unauthenticated_userid(request))
+
+    def test_rotate(self):
+        self.policy.rotate('reports', 'newer')
+
+        self.assertIsNone(
+            self.policy.unauthenticated_userid(self.request('old')))
+        self.assertEquals(
+            self.policy.unauthenticated_userid(self.request('newer')), 'API')
+
+        self.policy.rotate('billing')
+
+        self.assertIsNone(
+            self.policy.unauthenticated_userid(self.request('key')))
+
+    def test_keys_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        keys_file = os.path.join(directory, 'keys')
+
+        with open(keys_file, 'w') as f:
+            f.write('partner = first\n')
+
+        policy = ApiKeyAuthenticationPolicy('seekrit', keys_file=keys_file,
+                                            check_interval=0,
+                                            hashalg='sha512')
+
+        self.assertEquals(
+            policy.unauthenticated_userid(self.request('first')), 'API')
+
+        with open(keys_file, 'w') as f:
+            f.write('partner = second\n')
+        os.utime(keys_file, (0, 0))
+
+        self.assertIsNone(policy.unauthenticated_userid(self.request('first')))
+        self.assertEquals(
+            policy.unauthenticated_userid(self.request('second')), 'API')
+
+        os.remove(keys_file)
+
+        self.assertIsNone(
+            policy.unauthenticated_userid(self.request('second')))
@@ -0,0 +1,94 @@
+import os
+import signal
+import socket
+import time
+import unittest
+
+from james.scripts.serve import Arbiter, bind, private_balance_cache
+
+
+class TestBind(unittest.TestCase):
+
+    def test_bind(self):
+        sockets = bind('127.0.0.1:0')
+        try:
+            host, port = sockets[0].getsockname()[:2]
+            self.assertEquals(host, '127.0.0.1')
+            socket.create_connection((host, port), 1).close()
+        finally:
+            for sock in sockets:
+                sock.close()
+
+
+class TestPrivateBalanceCache(unittest.TestCase):
+
+    def test_disabled(self):
+        self.assertFalse(private_balance_cache({}))
+        self.assertFalse(private_balance_cache(
+            {'balances.cache.enabled': 'false'}))
+
+    def test_memory_backend(self):
+        self.assertTrue(private_balance_cache(
+            {'balances.cache.enabled': 'true'}))
+        self.assertTrue(private_balance_cache(
+            {'balances.cache.enabled': 'true',
+             'balances.cache.backend': 'james.cache.MemoryBackend'}))
+
+    def test_shared_backend(self):
+        self.assertFalse(private_balance_cache(
+            {'balances.cache.enabled': 'true',
+             'balances.cache.backend': 'myapp.cache.RedisBackend'}))
+
+
+class TestArbiter(unittest.TestCase):
+
+    def setUp(self):
+        self.handlers = [(signum, signal.getsignal(signum))
+                         for signum in (signal.SIGINT, signal.SIGTERM)]
+
+    def tearDown(self):
+        for signum, handler in self.handlers:
+            signal.signal(signum, handler)
+
+    def test_respawn(self):
+        read, write = os.pipe()
+
+        def target():
+            os.write(write, b'.')
+
+        arbiter = Arbiter(target, 2, backoff=0)
+        original = arbiter.spawn
+
+        def spawn():
+            # stop once the workers were replaced twice
+            if len(started) == 4:
+                return arbiter.stop()
+            started.append(original())
+
+        started = []
+        arbiter.spawn = spawn
+        arbiter.run()
+        time.sleep(0.01)
+
+        self.assertEquals(len(started), 4)
+        self.assertEquals(len(os.read(read, 10)), 4)
+
+    def test_give_up(self):
+        started = time.time()
+
+        arbiter = Arbiter(lambda: None, 1, backoff=0.05, max_failures=3)
+
+        self.assertEquals(arbiter.run(), 1)
+        self.assertEquals(arbiter.failures, 3)
+        # replaced after 0.05 then 0.1 seconds
+        self.assertGreaterEqual(time.time() - started, 0.15)
+
+    def test_backoff(self):
+        arbiter = Arbiter(None, 1, min_uptime=5, backoff=1, max_backoff=3,
+                          max_failures=10)
+        now = time.time()
+
+        self.assertEquals([arbiter.exited(now) for _ in range(4)],
+                          [1, 2, 3, 3])
+        self.assertEquals(arbiter.exited(now - 5), 0)
+        self.assertEquals(arbiter.failures, 0)
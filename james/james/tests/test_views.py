@@ -1,8 +1,13 @@
 from datetime import datetime
 import hashlib
 import math
+import os
+import shutil
 import simplejson as json
+import tempfile
+import threading
 import unittest
+import uuid
 import transaction
 import webtest
 
@@ -14,6 +19,9 @@ from james.models import Loan, Payment
 
 class BaseTest(unittest.TestCase):
 
+    # application settings of the test case, over the ones below
+    extra_settings = {}
+
     @classmethod
     def setUpClass(cls):
         from james import main
@@ -23,8 +31,10 @@ class BaseTest(unittest.TestCase):
         settings = {
             'sqlalchemy.url': 'sqlite:///:memory:',
             'auth.secret': 'seekrit',
-            'api.key': 'key'
+            'api.key': 'key',
+            'balances.cache.enabled': 'true'
         }
+        settings.update(cls.extra_settings)
         app = main({}, **settings)
         cls.testapp = webtest.TestApp(app)
 
@@ -110,6 +120,65 @@ class TestAddLoan(BaseTest):
                           'Value must be greater than zero')
 
 
+class TestAddLoans(BaseTest):
+
+    def test_success(self):
+        data = [{'amount': 1000, 'term': 12, 'rate': 0.05,
+                 'date': '2017-08-05 02:18Z'},
+                {'amount': 'text', 'term': 12, 'rate': 0.05},
+                {'amount': 2000, 'term': 24, 'rate': 0.1,
+                 'date': '2017-09-05 02:18Z'}]
+
+        res = self.testapp.post('/loans/batch', json.dumps(data),
+                                headers=self.headers)
+        results = res.json_body['results']
+
+        self.assertEquals(len(results), 3)
+        self.assertEquals(results[0]['installment'], 85.6)
+        self.assertEquals(results[1]['error'],
+                          {'amount': '"text" is not a number',
+                           'date': 'Required'})
+        self.assertNotEquals(results[0]['loan_id'], results[2]['loan_id'])
+
+        loan = self.session.query(Loan).filter_by(
+            loan_id=results[2]['loan_id']).one()
+
+        self.assertEquals(loan.amount, 2000)
+        self.assertEquals(loan.term, 24)
+        self.assertEquals(loan.rate, 0.1)
+        self.assertEquals(loan.date, datetime(2017, 9, 5, 2, 18))
+        self.assertEquals(loan.installment, results[2]['installment'])
+
+    def test_ndjson(self):
+        body = '\n'.join([
+            json.dumps({'amount': 1000, 'term': 12, 'rate': 0.05,
+                        'date': '2017-08-05 02:18Z'}),
+            '{"amount": ',
+            json.dumps({'amount': -1, 'term': 12, 'rate': 0.05,
+                        'date': '2017-08-05 02:18Z'}),
+        ])
+
+        res = self.testapp.post('/loans/batch', body, headers=self.headers)
+        results = res.json_body['results']
+
+        self.assertEquals(len(results), 3)
+        self.assertEquals(results[0]['installment'], 85.6)
+        self.assertEquals(results[1]['error'], 'Invalid JSON.')
+        self.assertEquals(results[2]['error'],
+                          {'amount': 'Value must be greater than zero'})
+        self.assertEquals(self.session.query(Loan).filter_by(
+            loan_id=results[0]['loan_id']).count(), 1)
+
+    def test_unauthorized(self):
+        self.testapp.post('/loans/batch', json.dumps([]), status=403)
+
+    def test_missing_json(self):
+        res = self.testapp.post('/loans/batch', headers=self.headers,
+                                status=400)
+
+        self.assertEquals(res.json_body['error'], 'Invalid JSON.')
+
+
 class TestAddPayment(BaseTest):
     
     def setUp(self):
@@ -219,6 +288,19 @@ class TestAddPayment(BaseTest):
         self.assertEquals(res.json_body['error'],
                           'Invalid amount, must be $85.6.')
     
+    def test_fraction_of_cent(self):
+        # 85.604 is not 85.6 rounded, it is not an amount
+        data = {'payment': 'made', 'date': '2017-08-05 03:29Z',
+                'amount': 85.604}
+        
+        res = self.testapp.post('/loans/{}/payments'.format(self.loan.loan_id),
+                                json.dumps(data), headers=self.headers,
+                                status=400)
+        
+        self.assertEquals(res.json_body['amount'],
+                          'Value must be a whole number of cents')
+        self.assertEquals(self.loan.payments.count(), 0)
+    
     def test_duplicated_payment(self):
         data = {'payment': 'made', 'date': '2017-08-05 02:18Z', 'amount': 85.6}
         
@@ -249,6 +331,186 @@ class TestAddPayment(BaseTest):
         self.assertEquals(res.json_body['error'], 'Duplicated payment.')
 
 
+class TestWriteQueue(BaseTest):
+
+    @classmethod
+    def setUpClass(cls):
+        # the writer thread needs a database shared by every connection
+        cls.directory = tempfile.mkdtemp()
+        cls.extra_settings = {
+            'sqlalchemy.url': 'sqlite:///{}'.format(
+                os.path.join(cls.directory, 'james.sqlite')),
+            'writes.queue.enabled': 'true',
+        }
+        super(TestWriteQueue, cls).setUpClass()
+        cls.queue = cls.testapp.app.registry['write_queue']
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.queue.close()
+        super(TestWriteQueue, cls).tearDownClass()
+        shutil.rmtree(cls.directory)
+
+    def add_loan(self):
+        data = {'amount': 1000, 'term': 12, 'rate': 0.05,
+                'date': '2017-08-05 02:18Z'}
+        return self.testapp.post('/loans', json.dumps(data),
+                                 headers=self.headers).json_body
+
+    def post_concurrently(self, url, payloads):
+        responses = [None] * len(payloads)
+
+        def post(i):
+            responses[i] = self.testapp.post(
+                url, json.dumps(payloads[i]), headers=self.headers,
+                expect_errors=True)
+
+        threads = [threading.Thread(target=post, args=(i,))
+                   for i in range(len(payloads))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_add_loan(self):
+        result = self.add_loan()
+
+        self.assertEquals(result['installment'], 85.6)
+        loan = self.session.query(Loan).filter_by(
+            loan_id=result['loan_id']).one()
+        self.assertEquals(loan.amount, 1000)
+
+    def test_add_payments(self):
+        loan_id = self.add_loan()['loan_id']
+        payloads = [{'payment': 'made', 'amount': 85.6,
+                     'date': '2017-{:02}-05 02:18Z'.format(month)}
+                    for month in range(8, 13)]
+
+        responses = self.post_concurrently(
+            '/loans/{}/payments'.format(loan_id), payloads)
+
+        self.assertEquals([res.status_int for res in responses], [200] * 5)
+        loan = self.session.query(Loan).filter_by(loan_id=loan_id).one()
+        self.assertEquals(loan.paid_installments, 5)
+        self.assertEquals(loan.payments.count(), 5)
+
+    def test_duplicated_payment(self):
+        loan_id = self.add_loan()['loan_id']
+        payloads = [{'payment': 'made', 'amount': 85.6,
+                     'date': '2017-08-{:02} 02:18Z'.format(day)}
+                    for day in range(5, 10)]
+
+        responses = self.post_concurrently(
+            '/loans/{}/payments'.format(loan_id), payloads)
+
+        self.assertEquals(sorted(res.status_int for res in responses),
+                          [200, 409, 409, 409, 409])
+        self.assertEquals(
+            [res.json_body for res in responses if res.status_int == 409],
+            [{'error': 'Duplicated payment.'}] * 4)
+
+    def test_timeout(self):
+        # a writer that never commits
+        self.queue.write = lambda group: None
+        self.queue.timeout, timeout = 0.1, self.queue.timeout
+        try:
+            data = {'amount': 1000, 'term': 12, 'rate': 0.05,
+                    'date': '2017-08-05 02:18Z'}
+            res = self.testapp.post('/loans', json.dumps(data),
+                                    headers=self.headers, status=503)
+        finally:
+            del self.queue.write
+            self.queue.timeout = timeout
+
+        self.assertIn('timed out', res.json_body['error'])
+
+
+class TestAddPayments(BaseTest):
+
+    def setUp(self):
+        self.headers = {'authorization': hashlib.sha256('key').hexdigest()}
+
+        data = [{'amount': 1000, 'term': 12, 'rate': 0.05,
+                 'date': '2017-08-05 02:18Z'},
+                {'amount': 2000, 'term': 12, 'rate': 0.05,
+                 'date': '2017-08-05 02:18Z'}]
+
+        res = self.testapp.post('/loans/batch', json.dumps(data),
+                                headers=self.headers)
+
+        self.loan_ids = [r['loan_id'] for r in res.json_body['results']]
+
+    def tearDown(self):
+        self.session.query(Payment).delete()
+        self.session.query(Loan).delete()
+        self.session.flush()
+
+    def test_success(self):
+        data = {'payment': 'made', 'date': '2017-08-05 02:18Z', 'amount': 85.6}
+        self.testapp.post('/loans/{}/payments'.format(self.loan_ids[0]),
+                          json.dumps(data), headers=self.headers)
+
+        data = [
+            {'loan_id': self.loan_ids[0], 'payment': 'made',
+             'date': '2017-09-05 02:18Z', 'amount': 85.6},
+            {'loan_id': self.loan_ids[0], 'payment': 'made',
+             'date': '2017-08-20 02:18Z', 'amount': 85.6},
+            {'loan_id': self.loan_ids[1], 'payment': 'missed',
+             'date': '2017-08-05 02:18Z', 'amount': 171.21},
+            {'loan_id': self.loan_ids[1], 'payment': 'made',
+             'date': '2017-08-25 02:18Z', 'amount': 171.21},
+            {'loan_id': 'unknown', 'payment': 'made',
+             'date': '2017-08-05 02:18Z', 'amount': 85.6},
+            {'loan_id': self.loan_ids[0], 'payment': 'made',
+             'date': '2017-07-05 02:18Z', 'amount': 85.6},
+            {'loan_id': self.loan_ids[0], 'payment': 'made',
+             'date': '2017-10-05 02:18Z', 'amount': 90},
+            {'loan_id': self.loan_ids[0], 'payment': 'paid'},
+            {'loan_id': self.loan_ids[0], 'payment': 'made',
+             'date': '2017-10-05 02:18Z', 'amount': 85.604},
+        ]
+
+        res = self.testapp.post('/payments/batch', json.dumps(data),
+                                headers=self.headers)
+
+        self.assertEquals(res.json_body['results'], [
+            {'success': 'Payment added.'},
+            {'error': 'Duplicated payment.'},
+            {'success': 'Payment added.'},
+            {'error': 'Duplicated payment.'},
+            {'error': 'Loan not found.'},
+            {'error': 'Invalid payment date, must be later than or equal to '
+                      '2017-08-05.'},
+            {'error': 'Invalid amount, must be $85.6.'},
+            {'error': {'payment': '"paid" is not one of made, missed',
+                       'date': 'Required', 'amount': 'Required'}},
+            {'error': {'amount': 'Value must be a whole number of cents'}},
+        ])
+
+        loan_1 = self.session.query(Loan).filter_by(
+            loan_id=self.loan_ids[0]).one()
+        loan_2 = self.session.query(Loan).filter_by(
+            loan_id=self.loan_ids[1]).one()
+
+        self.assertEquals(loan_1.payments.count(), 2)
+        self.assertEquals(loan_1.paid_installments, 2)
+        self.assertEquals(loan_1.last_payment_date, datetime(2017, 9, 5, 2, 18))
+        self.assertEquals(loan_2.paid_installments, 0)
+        self.assertEquals(loan_2.payments.one().payment, 'missed')
+        self.assertEquals(loan_1.calculate_balance(datetime(2017, 9, 5).date()),
+                          round(10 * 85.6, 2))
+
+    def test_unauthorized(self):
+        self.testapp.post('/payments/batch', json.dumps([]), status=403)
+
+    def test_missing_json(self):
+        res = self.testapp.post('/payments/batch', headers=self.headers,
+                                status=400)
+
+        self.assertEquals(res.json_body['error'], 'Invalid JSON.')
+
+
 class TestBalance(BaseTest):
     
     def setUp(self):
@@ -315,6 +577,121 @@ class TestBalance(BaseTest):
         
         res = self.testapp.post('/loans/unknown/balance', json.dumps(data),
                                 headers=self.headers, status=404)
+
+    def test_loan_cache(self):
+        cache = self.testapp.app.registry['loan_cache']
+        cache.clear()
+        hits, misses = cache.hits, cache.misses
+
+        data = {'date': '2017-08-05 02:18Z'}
+        for i in range(3):
+            res = self.testapp.post(
+                '/loans/{}/balance'.format(self.loan.loan_id),
+                json.dumps(data), headers=self.headers)
+            self.assertEquals(res.json_body['balance'], round(12 * 85.6, 2))
+
+        payment_data = {'payment': 'made', 'date': '2017-08-05 02:18Z',
+                        'amount': 85.6}
+        self.testapp.post('/loans/{}/payments'.format(self.loan.loan_id),
+                          json.dumps(payment_data), headers=self.headers)
+        res = self.testapp.post('/loans/{}/balance'.format(self.loan.loan_id),
+                                json.dumps(data), headers=self.headers)
+        self.assertEquals(res.json_body['balance'], round(11 * 85.6, 2))
+
+        self.assertEquals(cache.misses - misses, 1)
+        self.assertEquals(cache.hits - hits, 4)
+
+    def test_balance_cache(self):
+        cache = self.testapp.app.registry['balance_cache']
+        url = '/loans/{}/balance'.format(self.loan.loan_id)
+        data = {'date': '2017-09-05 02:18Z'}
+
+        res = self.testapp.post(url, json.dumps(data), headers=self.headers)
+        self.assertEquals(res.json_body['balance'], round(12 * 85.6, 2))
+
+        hits = cache.hits
+        res = self.testapp.post(url, json.dumps(data), headers=self.headers)
+        self.assertEquals(res.json_body['balance'], round(12 * 85.6, 2))
+        self.assertEquals(cache.hits - hits, 1)
+
+        payment_data = {'payment': 'made', 'date': '2017-08-05 02:18Z',
+                        'amount': 85.6}
+        self.testapp.post('/loans/{}/payments'.format(self.loan.loan_id),
+                          json.dumps(payment_data), headers=self.headers)
+
+        res = self.testapp.post(url, json.dumps(data), headers=self.headers)
+        self.assertEquals(res.json_body['balance'], round(11 * 85.6, 2))
+
+        payment_data = [{'loan_id': self.loan.loan_id, 'payment': 'made',
+                         'date': '2017-09-05 02:18Z', 'amount': 85.6}]
+        self.testapp.post('/payments/batch', json.dumps(payment_data),
+                          headers=self.headers)
+
+        res = self.testapp.post(url, json.dumps(data), headers=self.headers)
+        self.assertEquals(res.json_body['balance'], round(10 * 85.6, 2))
+
+        # a loan id in another form than the stored one invalidates it too
+        data = {'date': '2017-10-05 02:18Z'}
+        res = self.testapp.post(url, json.dumps(data), headers=self.headers)
+        self.assertEquals(res.json_body['balance'], round(10 * 85.6, 2))
+
+        loan_id = str(uuid.UUID(hex=self.loan.loan_id)).upper()
+        payment_data = [{'loan_id': loan_id, 'payment': 'made',
+                         'date': '2017-10-05 02:18Z', 'amount': 85.6}]
+        res = self.testapp.post('/payments/batch', json.dumps(payment_data),
+                                headers=self.headers)
+        self.assertIn('success', res.json_body['results'][0])
+
+        res = self.testapp.post(url, json.dumps(data), headers=self.headers)
+        self.assertEquals(res.json_body['balance'], round(9 * 85.6, 2))
+
+    def test_series(self):
+        for payment_data in [{'payment': 'made', 'date': '2017-08-05 02:18Z',
+                              'amount': 85.6},
+                             {'payment': 'made', 'date': '2017-10-01 23:09Z',
+                              'amount': 85.6}]:
+            self.testapp.post('/loans/{}/payments'.format(self.loan.loan_id),
+                              json.dumps(payment_data), headers=self.headers)
+
+        res = self.testapp.get(
+            '/loans/{}/balance/series'.format(self.loan.loan_id),
+            {'from': '2017-08-05', 'to': '2017-11-05'}, headers=self.headers)
+
+        self.assertEquals(res.json_body['series'], [
+            {'date': '2017-08-05', 'balance': round(11 * 85.6, 2)},
+            {'date': '2017-09-05', 'balance': round(11 * 85.6, 2)},
+            {'date': '2017-10-05', 'balance': round(10 * 85.6, 2)},
+            {'date': '2017-11-05', 'balance': round(10 * 85.6, 2)},
+        ])
+
+        res = self.testapp.get(
+            '/loans/{}/balance/series'.format(self.loan.loan_id),
+            {'to': '2017-08-20', 'step': 'week'}, headers=self.headers)
+
+        self.assertEquals([d['date'] for d in res.json_body['series']],
+                          ['2017-08-05', '2017-08-12', '2017-08-19'])
+
+    def test_series_invalid(self):
+        url = '/loans/{}/balance/series'.format(self.loan.loan_id)
+
+        res = self.testapp.get(url, {'from': '2017-07-05'},
+                               headers=self.headers, status=400)
+        self.assertEquals(res.json_body['error'],
+            'Invalid date, must be later than or equal to 2017-08-05.')
+
+        res = self.testapp.get(url, {'step': 'year', 'to': 'xxx'},
+                               headers=self.headers, status=400)
+        self.assertEquals(res.json_body['step'],
+                          '"year" is not one of day, week, month')
+        self.assertEquals(res.json_body['to'], 'Invalid date')
+
+        res = self.testapp.get(url, {'to': '2047-08-05', 'step': 'day'},
+                               headers=self.headers, status=400)
+        self.assertEquals(res.json_body['error'],
+                          'Too many dates, must be at most 1000.')
+
+        self.testapp.get('/loans/unknown/balance/series',
+                         headers=self.headers, status=404)
         
     def test_unauthorized(self):
         data = {'date': '2017-08-05 02:18Z'}
@@ -362,3 +739,368 @@ class TestBalance(BaseTest):
                                 status=400)
         
         self.assertEquals(res.json_body['date'], 'Invalid date')
+
+
+class TestSchedule(BaseTest):
+
+    def setUp(self):
+        self.headers = {'authorization': hashlib.sha256('key').hexdigest()}
+
+        data = {'amount': 1000, 'term': 12, 'rate': 0.05,
+                'date': '2017-08-05 02:18Z'}
+
+        res = self.testapp.post('/loans', json.dumps(data),
+                                headers=self.headers)
+
+        self.loan_id = res.json_body['loan_id']
+
+    def tearDown(self):
+        self.session.query(Loan).delete()
+        self.session.flush()
+
+    def test_success(self):
+        res = self.testapp.get('/loans/{}/schedule'.format(self.loan_id),
+                               headers=self.headers)
+
+        self.assertEquals(res.json_body['installment'], 85.6)
+        self.assertEquals(len(res.json_body['schedule']), 12)
+        self.assertEquals(res.json_body['schedule'][0],
+                          {'period': 1, 'payment': 85.6, 'interest': 4.17,
+                           'principal': 81.43, 'balance': 918.57})
+        self.assertEquals(res.json_body['schedule'][-1]['balance'], 0)
+
+    def test_loan_not_found(self):
+        self.testapp.get('/loans/unknown/schedule', headers=self.headers,
+                         status=404)
+
+    def test_unauthorized(self):
+        self.testapp.get('/loans/{}/schedule'.format(self.loan_id),
+                         status=403)
+
+
+class TestQuotes(BaseTest):
+
+    def test_success(self):
+        data = {'amount': [1000, 2000], 'term': 12, 'rate': [0.05, 0.1]}
+
+        res = self.testapp.post('/quotes', json.dumps(data),
+                                headers=self.headers)
+
+        self.assertEquals(len(res.json_body['quotes']), 2)
+        self.assertEquals(res.json_body['quotes'][0],
+                          {'amount': 1000, 'term': 12, 'rate': 0.05,
+                           'installment': 85.6})
+
+    def test_grid(self):
+        data = {'amount': [1000, 2000], 'term': [12, 24, 36],
+                'rate': [0.05, 0.1], 'grid': True}
+
+        res = self.testapp.post('/quotes', json.dumps(data),
+                                headers=self.headers)
+
+        self.assertEquals(len(res.json_body['quotes']), 12)
+        self.assertEquals(res.json_body['quotes'][0]['installment'], 85.6)
+
+    def test_many_zipped(self):
+        # 47 quotes, although 47 ** 3 combinations exceed the limit
+        data = {'amount': [1000 + i for i in range(47)],
+                'term': [12 + i for i in range(47)],
+                'rate': [0.05] * 47}
+
+        res = self.testapp.post('/quotes', json.dumps(data),
+                                headers=self.headers)
+
+        self.assertEquals(len(res.json_body['quotes']), 47)
+
+    def test_too_many(self):
+        data = {'amount': [1000 + i for i in range(47)],
+                'term': [12 + i for i in range(47)],
+                'rate': [0.05 + i / 1000.0 for i in range(47)], 'grid': True}
+
+        res = self.testapp.post('/quotes', json.dumps(data),
+                                headers=self.headers, status=400)
+
+        self.assertEquals(res.json_body['error'],
+                          'Too many quotes, must be at most 100000.')
+
+    def test_unauthorized(self):
+        data = {'amount': 1000, 'term': 12, 'rate': 0.05}
+
+        self.testapp.post('/quotes', json.dumps(data), status=403)
+
+    def test_missing_json(self):
+        res = self.testapp.post('/quotes', headers=self.headers, status=400)
+
+        self.assertEquals(res.json_body['error'], 'Invalid JSON.')
+
+    def test_incorrect_values(self):
+        data = {'amount': [1000, -1], 'term': 'text', 'rate': []}
+
+        res = self.testapp.post('/quotes', json.dumps(data),
+                                headers=self.headers, status=400)
+
+        self.assertEquals(res.json_body['amount.1'],
+                          'Value must be greater than zero')
+        self.assertEquals(res.json_body['term.0'], '"text" is not a number')
+        self.assertEquals(res.json_body['rate'], 'Shorter than minimum length 1')
+
+        data = {'amount': [1000, 2000], 'term': [12, 24, 36], 'rate': 0.05}
+
+        res = self.testapp.post('/quotes', json.dumps(data),
+                                headers=self.headers, status=400)
+
+        self.assertEquals(res.json_body['error'],
+                          'Amount, term and rate must have the same length.')
+
+
+class TestPortfolioBalance(BaseTest):
+
+    def setUp(self):
+        self.headers = {'authorization': hashlib.sha256('key').hexdigest()}
+
+        self.session.query(Payment).delete()
+        self.session.query(Loan).delete()
+        self.session.flush()
+
+        for data in [{'amount': 1000, 'term': 12, 'rate': 0.05,
+                      'date': '2017-08-05 02:18Z'},
+                     {'amount': 1000, 'term': 12, 'rate': 0.05,
+                      'date': '2017-09-05 02:18Z'}]:
+            self.testapp.post('/loans', json.dumps(data),
+                              headers=self.headers)
+
+    def tearDown(self):
+        self.session.query(Payment).delete()
+        self.session.query(Loan).delete()
+        self.session.flush()
+
+    def test_success(self):
+        res = self.testapp.get('/portfolio/balance', {'date': '2017-08-31'},
+                               headers=self.headers)
+        self.assertEquals(res.json_body, {'date': '2017-08-31',
+                                          'value': round(12 * 85.6, 2),
+                                          'volume': 1})
+
+        res = self.testapp.get('/portfolio/balance', {'date': '2017-09-30'},
+                               headers=self.headers)
+        self.assertEquals(res.json_body['value'], round(24 * 85.6, 2))
+        self.assertEquals(res.json_body['volume'], 2)
+
+        loan = self.session.query(Loan).order_by(Loan.date).first()
+        payment_data = {'payment': 'made', 'date': '2017-09-10 02:18Z',
+                        'amount': 85.6}
+        self.testapp.post('/loans/{}/payments'.format(loan.loan_id),
+                          json.dumps(payment_data), headers=self.headers)
+
+        res = self.testapp.get('/portfolio/balance', {'date': '2017-09-30'},
+                               headers=self.headers)
+        self.assertEquals(res.json_body['value'], round(23 * 85.6, 2))
+        self.assertEquals(res.json_body['volume'], 2)
+
+    def test_unauthorized(self):
+        self.testapp.get('/portfolio/balance', {'date': '2017-09-30'},
+                         status=403)
+
+    def test_missing_required_fields(self):
+        res = self.testapp.get('/portfolio/balance', headers=self.headers,
+                               status=400)
+
+        self.assertEquals(res.json_body['date'], 'Required')
+
+    def test_invalid_date(self):
+        res = self.testapp.get('/portfolio/balance', {'date': 'xxx'},
+                               headers=self.headers, status=400)
+
+        self.assertEquals(res.json_body['date'], 'Invalid date')
+
+
+class TestListLoans(BaseTest):
+
+    def setUp(self):
+        self.headers = {'authorization': hashlib.sha256('key').hexdigest()}
+
+        self.session.query(Payment).delete()
+        self.session.query(Loan).delete()
+        self.session.flush()
+
+        self.loan_ids = []
+        for month, term in [(8, 12), (8, 24), (9, 12), (10, 12), (11, 24)]:
+            data = {'amount': 1000, 'term': term, 'rate': 0.05,
+                    'date': '2017-{:02}-05 02:18Z'.format(month)}
+            res = self.testapp.post('/loans', json.dumps(data),
+                                    headers=self.headers)
+            self.loan_ids.append(res.json_body['loan_id'])
+
+    def tearDown(self):
+        self.session.query(Payment).delete()
+        self.session.query(Loan).delete()
+        self.session.flush()
+
+    def test_success(self):
+        res = self.testapp.get('/loans', headers=self.headers)
+
+        self.assertEquals([loan['loan_id'] for loan in res.json_body['loans']],
+                          self.loan_ids)
+        self.assertEquals(res.json_body['loans'][0], {
+            'loan_id': self.loan_ids[0], 'amount': 1000, 'term': 12,
+            'rate': 0.05, 'date': '2017-08-05T02:18:00', 'installment': 85.6})
+        self.assertIsNone(res.json_body['next'])
+
+    def test_pages(self):
+        loan_ids = []
+        params = {'limit': 2}
+
+        while True:
+            res = self.testapp.get('/loans', params, headers=self.headers)
+            self.assertLessEqual(len(res.json_body['loans']), 2)
+            loan_ids.extend(loan['loan_id'] for loan in res.json_body['loans'])
+            if not res.json_body['next']:
+                break
+            params['cursor'] = res.json_body['next']
+
+        self.assertEquals(loan_ids, self.loan_ids)
+
+    def test_filters(self):
+        res = self.testapp.get('/loans', {'from': '2017-08-06',
+                                          'to': '2017-10-05', 'term': 12},
+                               headers=self.headers)
+
+        self.assertEquals([loan['loan_id'] for loan in res.json_body['loans']],
+                          self.loan_ids[2:4])
+
+        res = self.testapp.get('/loans', {'rate': 0.06}, headers=self.headers)
+
+        self.assertEquals(res.json_body['loans'], [])
+
+    def test_unauthorized(self):
+        self.testapp.get('/loans', status=403)
+
+    def test_invalid_fields(self):
+        res = self.testapp.get('/loans', {'limit': 0, 'term': 'x'},
+                               headers=self.headers, status=400)
+
+        self.assertIn('limit', res.json_body)
+        self.assertIn('term', res.json_body)
+
+        res = self.testapp.get('/loans', {'cursor': 'xxx'},
+                               headers=self.headers, status=400)
+
+        self.assertEquals(res.json_body, {'cursor': 'Invalid cursor'})
+
+
+class TestExportLoans(BaseTest):
+
+    def setUp(self):
+        self.headers = {'authorization': hashlib.sha256('key').hexdigest()}
+
+        self.session.query(Payment).delete()
+        self.session.query(Loan).delete()
+        self.session.flush()
+
+        self.loan_ids = []
+        for data in [{'amount': 1000, 'term': 12, 'rate': 0.05,
+                      'date': '2017-08-05 02:18Z'},
+                     {'amount': 2000, 'term': 12, 'rate': 0.05,
+                      'date': '2017-09-05 02:18Z'}]:
+            res = self.testapp.post('/loans', json.dumps(data),
+                                    headers=self.headers)
+            self.loan_ids.append(res.json_body['loan_id'])
+
+        self.testapp.post('/loans/{}/payments'.format(self.loan_ids[0]),
+                          json.dumps({'payment': 'made', 'amount': 85.6,
+                                      'date': '2017-09-10 02:18Z'}),
+                          headers=self.headers)
+
+    def tearDown(self):
+        self.session.query(Payment).delete()
+        self.session.query(Loan).delete()
+        self.session.flush()
+
+    def test_ndjson(self):
+        res = self.testapp.get('/loans/export', {'date': '2017-09-30'},
+                               headers=self.headers)
+
+        self.assertEquals(res.content_type, 'application/x-ndjson')
+        rows = [json.loads(line) for line in res.text.splitlines()]
+        self.assertEquals(rows, [
+            {'loan_id': self.loan_ids[0], 'amount': 1000, 'term': 12,
+             'rate': 0.05, 'date': '2017-08-05T02:18:00',
+             'installment': 85.6, 'balance': round(11 * 85.6, 2)},
+            {'loan_id': self.loan_ids[1], 'amount': 2000, 'term': 12,
+             'rate': 0.05, 'date': '2017-09-05T02:18:00',
+             'installment': 171.21, 'balance': round(12 * 171.21, 2)},
+        ])
+
+    def test_csv(self):
+        res = self.testapp.get('/loans/export',
+                               {'date': '2017-08-31', 'format': 'csv'},
+                               headers=self.headers)
+
+        self.assertEquals(res.content_type, 'text/csv')
+        self.assertEquals(res.headers['Content-Disposition'],
+                          'attachment; filename=loans-2017-08-31.csv')
+        self.assertEquals(res.text.splitlines(), [
+            'loan_id,amount,term,rate,date,installment,balance',
+            '{},1000.0,12,0.05,2017-08-05T02:18:00,85.6,1027.2'.format(
+                self.loan_ids[0]),
+        ])
+
+    def test_unauthorized(self):
+        self.testapp.get('/loans/export', status=403)
+
+    def test_invalid_format(self):
+        res = self.testapp.get('/loans/export', {'format': 'xml'},
+                               headers=self.headers, status=400)
+
+        self.assertIn('format', res.json_body)
+
+
+class TestRequestMetrics(BaseTest):
+
+    def test_server_timing(self):
+        data = {'amount': 1000, 'term': 12, 'rate': 0.05,
+                'date': '2017-08-05 02:18Z'}
+
+        res = self.testapp.post('/loans', json.dumps(data),
+                                headers=self.headers)
+
+        self.assertRegexpMatches(
+            res.headers['Server-Timing'],
+            r'^db;desc="1 queries";dur=[0-9.]+, total;dur=[0-9.]+$')
+
+        res = self.testapp.get('/loans/unknown/schedule',
+                               headers=self.headers, status=404)
+
+        self.assertIn('Server-Timing', res.headers)
+
+    def test_metrics(self):
+        data = {'amount': 1000, 'term': 12, 'rate': 0.05,
+                'date': '2017-08-05 02:18Z'}
+        self.testapp.post('/loans', json.dumps(data), headers=self.headers)
+
+        res = self.testapp.get('/metrics/requests', headers=self.headers)
+        add_loan = res.json_body['routes']['add_loan']
+
+        self.assertGreaterEqual(add_loan['count'], 1)
+        self.assertEquals(add_loan['queries']['buckets']['+Inf'],
+                          add_loan['count'])
+        self.assertIn('request_time_ms', add_loan)
+        self.assertIn('db_time_ms', add_loan)
+
+    def test_prometheus(self):
+        self.testapp.post('/loans', 'not json', headers=self.headers,
+                          status=400)
+        self.testapp.get('/loans/unknown/schedule', headers=self.headers,
+                         status=404)
+
+        res = self.testapp.get('/metrics', headers=self.headers)
+
+        self.assertEquals(res.content_type, 'text/plain')
+        self.assertIn('james_http_errors_total{route="add_loan",status="400",'
+                      'reason="invalid_json"} 1', res.text)
+        self.assertIn('james_http_errors_total{route="schedule",status="404",'
+                      'reason="loan_not_found"} 1', res.text)
+        self.assertIn('james_cache_hits_total{cache="loans"}', res.text)
+
+    def test_unauthorized(self):
+        self.testapp.get('/metrics/requests', status=403)
@@ -0,0 +1,97 @@
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from james.models import Loan, get_engine, get_session_factory
+from james.models.meta import Base
+from james.writes import Write, WriteError, WriteQueue
+
+
+class TestWriteQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        engine = get_engine({'sqlalchemy.url': 'sqlite:///{}'.format(
+            os.path.join(self.directory, 'james.sqlite'))})
+        Base.metadata.create_all(engine)
+        self.session_factory = get_session_factory(engine)
+        self.queue = WriteQueue(self.session_factory, timeout=1)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.directory)
+
+    def loan(self, amount):
+        return Write('loan', {'amount': amount, 'term': 12, 'rate': 0.05,
+                              'date': datetime(2017, 8, 5)})
+
+    def test_group(self):
+        group = [self.loan(1000), self.loan(2000)]
+
+        self.queue.write(group)
+
+        self.assertEquals([write.wait()['installment'] for write in group],
+                          [85.6, 171.21])
+        self.assertEquals(self.session_factory().query(Loan).count(), 2)
+
+    def test_failed_group(self):
+        # a loan without amount fails the group, and then on its own
+        group = [self.loan(1000), self.loan(None), self.loan(2000)]
+
+        self.queue.write(group)
+
+        self.assertEquals(group[0].wait()['installment'], 85.6)
+        self.assertEquals(group[2].wait()['installment'], 171.21)
+        with self.assertRaises(TypeError):
+            group[1].wait()
+        self.assertEquals(self.session_factory().query(Loan).count(), 2)
+
+    def kill(self):
+        """ Make the writer thread exit on the next group it takes. """
+        def write(group):
+            raise SystemExit
+        self.queue.write = write
+
+    def test_timeout(self):
+        self.queue.timeout = 0.1
+        self.queue.write = lambda group: None
+
+        with self.assertRaises(WriteError):
+            self.queue.add_loan(self.loan(1000).items)
+
+    def test_skip_failed(self):
+        write = self.loan(1000)
+        write.fail(WriteError('Write timed out.'))
+
+        self.assertFalse(write.claim())
+        with self.assertRaises(WriteError):
+            write.wait()
+
+    def test_dead_writer(self):
+        self.kill()
+        killed = self.loan(1000)
+        self.queue.queue.put(killed)
+        self.queue.thread.join()
+
+        # left in the queue of the dead writer
+        pending = self.loan(2000)
+        self.queue.queue.put(pending)
+        del self.queue.write
+
+        result = self.queue.add_loan(self.loan(3000).items)
+
+        self.assertEquals(result['installment'], 256.82)
+        self.assertTrue(self.queue.thread.is_alive())
+        with self.assertRaises(WriteError):
+            killed.wait(0)
+        with self.assertRaises(WriteError):
+            pending.wait(0)
+        self.assertEquals(self.session_factory().query(Loan).count(), 1)
+
+    def test_closed(self):
+        self.queue.close()
+
+        with self.assertRaises(WriteError):
+            self.queue.add_loan(self.loan(1000).items)
@@ -0,0 +1,31 @@
+from pyramid.view import view_config
+
+from james.batch import create_loans, create_payments, parse_records
+from james.views.default import invalidate_balances, set_error
+
+
+@view_config(route_name='add_loans', request_method='POST', renderer='json',
+             permission='edit')
+def add_loans(request):
+    try:
+        records = parse_records(request.body)
+    except ValueError:
+        set_error(request, 400, 'invalid_json')
+        return {'error': 'Invalid JSON.'}
+
+    return {'results': create_loans(request.dbsession, records)}
+
+
+@view_config(route_name='add_payments', request_method='POST',
+             renderer='json', permission='edit')
+def add_payments(request):
+    try:
+        records = parse_records(request.body)
+    except ValueError:
+        set_error(request, 400, 'invalid_json')
+        return {'error': 'Invalid JSON.'}
+
+    results, loan_ids = create_payments(request.dbsession, records)
+    invalidate_balances(request, loan_ids)
+
+    return {'results': results}
@@ -1,50 +1,203 @@
-import ast
+import base64
+import binascii
+import calendar
+from datetime import datetime, timedelta
 
 import colander
 from pyramid.httpexceptions import HTTPNotFound
 from pyramid.response import Response
 from pyramid.view import view_config
-from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError
 
+from james import amortization
+from james.money import to_cents
 from james.models import Loan, Payment
 from james.models.loan import InvalidDate
-from james.views.validators import NumberGreaterThanZero
+from james.views.schemas import (
+    balance_schema,
+    balance_series_schema,
+    create_loan_schema,
+    create_payment_schema,
+    list_loans_schema,
+    quote_schema,
+    )
+from james.writes import WriteError
 
 
-class CreateLoanSchema(colander.MappingSchema):
-    amount = colander.SchemaNode(colander.Float(),
-        validator=NumberGreaterThanZero(), type='float')
-    term = colander.SchemaNode(colander.Integer(),
-        validator=NumberGreaterThanZero(), type='int')
-    rate = colander.SchemaNode(colander.Float(),
-        validator=NumberGreaterThanZero(), type='float')
-    date = colander.SchemaNode(colander.DateTime(), type='datetime')
+# Upper bound of the number of installments quoted in one request.
+MAX_QUOTES = 100000
 
+# Upper bound of the number of dates of a balance series.
+MAX_SERIES_DATES = 1000
 
-class CreatePaymentSchema(colander.MappingSchema):
-    payment = colander.SchemaNode(colander.String(), type='str',
-        validator=colander.OneOf(['made', 'missed']))
-    date = colander.SchemaNode(colander.DateTime(), type='datetime')
-    amount = colander.SchemaNode(colander.Float(),
-        validator=NumberGreaterThanZero(), type='float')
+CURSOR_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
 
 
-class BalanceSchema(colander.MappingSchema):
-    date = colander.SchemaNode(colander.DateTime(), type='datetime')
+def set_error(request, status, reason):
+    """
+    Set the status of the response to ``status`` and record ``reason`` for
+    the request's error counter.
+
+    """
+    request.response.status = status
+    request.environ['james.error'] = reason
+
+
+def get_loan(request, loan_id):
+    """
+    Return the loan ``loan_id`` or raise ``HTTPNotFound``.
+
+    Its immutable attributes are served from the ``loan_cache`` when
+    possible, sparing the lookup by ``loan_id`` and the hydration of the row.
+
+    """
+    cache = request.registry.get('loan_cache')
+    attributes = cache.get(loan_id) if cache is not None else None
+
+    if attributes is not None:
+        return Loan.from_immutable_attributes(request.dbsession, attributes)
+
+    loan = request.dbsession.query(Loan).filter_by(loan_id=loan_id).first()
+
+    if not loan:
+        request.environ['james.error'] = 'loan_not_found'
+        raise HTTPNotFound('Loan not found')
+
+    if cache is not None:
+        cache.set(loan_id, loan.immutable_attributes())
+
+    return loan
+
+
+def invalidate_balances(request, loan_ids):
+    """
+    Drop the cached balances of ``loan_ids`` now and again once the request's
+    transaction commits, so that a balance computed by a concurrent request
+    before the commit is not left behind.
+
+    """
+    cache = request.registry.get('balance_cache')
+    if cache is None or not loan_ids:
+        return
+
+    def invalidate(success=True):
+        for loan_id in loan_ids:
+            cache.invalidate(loan_id)
+
+    invalidate()
+    request.tm.get().addAfterCommitHook(invalidate)
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    year = day.year + month // 12
+    month = month % 12 + 1
+    return day.replace(year=year, month=month,
+                       day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def series_dates(start, end, step):
+    """
+    Return the dates from ``start`` to ``end``, both included, every ``step``
+    (``day``, ``week`` or ``month``), or ``None`` if there would be more than
+    ``MAX_SERIES_DATES`` of them.
+
+    """
+    dates = []
+    day = start
+    while day <= end:
+        if len(dates) == MAX_SERIES_DATES:
+            return None
+        dates.append(day)
+        if step == 'month':
+            day = add_months(start, len(dates))
+        else:
+            day = start + timedelta(days=len(dates) *
+                                    (7 if step == 'week' else 1))
+    return dates
+
+
+def encode_cursor(date, id):
+    """ Return the opaque cursor of the page after the loan ``(date, id)``. """
+    value = '{}|{}'.format(date.strftime(CURSOR_DATE_FORMAT), id)
+    return base64.urlsafe_b64encode(value.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Return the ``(date, id)`` of an ``encode_cursor`` cursor, or raise
+    ``ValueError``.
+
+    """
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode('ascii'))
+    except (TypeError, binascii.Error):
+        raise ValueError(cursor)
+    date, _, id = value.decode('ascii').partition('|')
+    return datetime.strptime(date, CURSOR_DATE_FORMAT), int(id)
+
+
+@view_config(route_name='list_loans', request_method='GET', renderer='json',
+             permission='view')
+def list_loans(request):
+    try:
+        items = list_loans_schema.deserialize(request.GET)
+    except colander.Invalid as e:
+        set_error(request, 400, 'invalid_fields')
+        return e.asdict()
+
+    after = None
+    if items['cursor']:
+        try:
+            after = decode_cursor(items['cursor'])
+        except (ValueError, UnicodeError):
+            set_error(request, 400, 'invalid_fields')
+            return {'cursor': 'Invalid cursor'}
+
+    start = end = None
+    if items['from']:
+        start = datetime.combine(items['from'], datetime.min.time())
+    if items['to']:
+        end = datetime.combine(items['to'] + timedelta(days=1),
+                               datetime.min.time())
+
+    rows = Loan.page_query(request.dbsession, after, start, end,
+                           items['term'], items['rate']
+                           ).limit(items['limit'] + 1).all()
+
+    next_cursor = None
+    if len(rows) > items['limit']:
+        rows = rows[:items['limit']]
+        next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+
+    return {
+        'loans': [{'loan_id': row.loan_id, 'amount': row.amount,
+                   'term': row.term, 'rate': row.rate,
+                   'date': row.date.isoformat(),
+                   'installment': row.installment} for row in rows],
+        'next': next_cursor,
+    }
 
 
 @view_config(route_name='add_loan', request_method='POST', renderer='json',
              permission='edit')
 def add_loan(request):
     try:
-        items = CreateLoanSchema().deserialize(request.json_body)
+        items = create_loan_schema.deserialize(request.json_body)
     except ValueError:
-        request.response.status = 400
+        set_error(request, 400, 'invalid_json')
         return {'error': 'Invalid JSON.'}
     except colander.Invalid as e:
-        request.response.status = 400
-        return ast.literal_eval(e.__str__())
+        set_error(request, 400, 'invalid_fields')
+        return e.asdict()
+    
+    queue = request.registry.get('write_queue')
+    if queue is not None:
+        try:
+            return queue.add_loan(items)
+        except WriteError as e:
+            set_error(request, 503, 'write_failed')
+            return {'error': str(e)}
     
     loan = Loan(amount=items['amount'], term=items['term'], rate=items['rate'],
                 date=items['date'])
@@ -59,44 +212,60 @@ def add_loan(request):
 @view_config(route_name='add_payment', request_method='POST', renderer='json',
              permission='edit')
 def add_payment(request):
-    loan_id = request.matchdict['loan_id']
-    
-    loan = request.dbsession.query(Loan).filter_by(loan_id=loan_id).first()
-    
-    if not loan:
-        raise HTTPNotFound('Loan not found')
+    loan = get_loan(request, request.matchdict['loan_id'])
     
     try:
-        items = CreatePaymentSchema().deserialize(request.json_body)
+        items = create_payment_schema.deserialize(request.json_body)
     except ValueError:
-        request.response.status = 400
+        set_error(request, 400, 'invalid_json')
         return {'error': 'Invalid JSON.'}
     except colander.Invalid as e:
-        request.response.status = 400
-        return ast.literal_eval(e.__str__())
+        set_error(request, 400, 'invalid_fields')
+        return e.asdict()
 
     if items['date'].date() < loan.date.date():
-        request.response.status = 400
+        set_error(request, 400, 'invalid_payment_date')
         return {'error': 'Invalid payment date, must be later than or equal to' +
             ' {}.'.format(loan.date.date())}
     
-    if items['amount'] != loan.installment:
-        request.response.status = 400
+    if to_cents(items['amount']) != to_cents(loan.installment):
+        set_error(request, 400, 'invalid_amount')
         return {'error': 'Invalid amount, must be ${}.'.format(loan.installment)}
     
-    if request.dbsession.query(Payment).filter(
-        Payment.loan == loan,
-        func.extract('year', Payment.date) == items['date'].year,
-        func.extract('month', Payment.date) == items['date'].month
-        ).first():
-        request.response.status = 409
+    queue = request.registry.get('write_queue')
+    if queue is not None:
+        # the writer checks for a payment in the same month itself
+        try:
+            result = queue.add_payment(dict(items, loan_id=loan.loan_id))
+        except WriteError as e:
+            set_error(request, 503, 'write_failed')
+            return {'error': str(e)}
+        if 'error' in result:
+            set_error(request, 409, 'duplicated_payment')
+            return result
+        invalidate_balances(request, [loan.loan_id])
+        return result
+    
+    month_index = loan.month_index(items['date'])
+    
+    if request.dbsession.query(Payment.id).filter_by(
+        loan_id=loan.id, month_index=month_index).first():
+        set_error(request, 409, 'duplicated_payment')
         return {'error': 'Duplicated payment.'}
     
     payment = Payment(loan=loan, payment=items['payment'], date=items['date'],
-                      amount=items['amount'])
+                      amount=items['amount'], month_index=month_index)
     
     request.dbsession.add(payment)
-    request.dbsession.flush()
+    try:
+        request.dbsession.flush()
+    except IntegrityError:
+        # a concurrent request added a payment for the same month
+        request.tm.doom()
+        set_error(request, 409, 'duplicated_payment')
+        return {'error': 'Duplicated payment.'}
+    
+    invalidate_balances(request, [loan.loan_id])
     
     return {'success': 'Payment added.'}
 
@@ -104,25 +273,135 @@ def add_payment(request):
 @view_config(route_name='balance', request_method='POST', renderer='json',
              permission='edit')
 def balance(request):
-    loan_id = request.matchdict['loan_id']
-    
-    loan = request.dbsession.query(Loan).filter_by(loan_id=loan_id).first()
-    
-    if not loan:
-        raise HTTPNotFound('Loan not found')
+    loan = get_loan(request, request.matchdict['loan_id'])
     
     try:
-        items = BalanceSchema().deserialize(request.json_body)
+        items = balance_schema.deserialize(request.json_body)
     except ValueError:
-        request.response.status = 400
+        set_error(request, 400, 'invalid_json')
         return {'error': 'Invalid JSON.'}
     except colander.Invalid as e:
-        request.response.status = 400
-        return ast.literal_eval(e.__str__())
+        set_error(request, 400, 'invalid_fields')
+        return e.asdict()
+
+    date = items['date'].date()
+    cache = request.registry.get('balance_cache')
+
+    if cache is not None:
+        balance = cache.get_balance(loan.loan_id, date)
+        if balance is not None:
+            return {'balance': balance}
+        # read before the balance, so that a payment committed meanwhile
+        # keeps it from being stored
+        generation = cache.generation(loan.loan_id)
+
+    try:
+        balance = loan.calculate_balance(date)
+    except InvalidDate:
+        set_error(request, 400, 'invalid_date')
+        return {'error': 'Invalid date, must be later than or equal to {}.'. \
+            format(loan.date.date())}
+
+    if cache is not None:
+        cache.set_balance(loan.loan_id, date, balance, generation)
+
+    return {'balance': balance}
+
+
+@view_config(route_name='balance_series', request_method='GET',
+             renderer='json', permission='view')
+def balance_series(request):
+    loan = get_loan(request, request.matchdict['loan_id'])
+    
+    try:
+        items = balance_series_schema.deserialize(request.GET)
+    except colander.Invalid as e:
+        set_error(request, 400, 'invalid_fields')
+        return e.asdict()
+
+    start = items['from'] or loan.date.date()
+    end = items['to'] or datetime.now().date()
+    dates = series_dates(start, end, items['step'])
+
+    if dates is None:
+        set_error(request, 400, 'too_many_dates')
+        return {'error': 'Too many dates, must be at most {}.'.format(
+            MAX_SERIES_DATES)}
 
     try:
-        return {'balance': loan.calculate_balance(items['date'].date())}
+        balances = loan.balance_series(dates)
     except InvalidDate:
-        request.response.status = 400
+        set_error(request, 400, 'invalid_date')
         return {'error': 'Invalid date, must be later than or equal to {}.'. \
             format(loan.date.date())}
+
+    return {'series': [{'date': day.isoformat(), 'balance': balance}
+                       for day, balance in zip(dates, balances)]}
+
+
+@view_config(route_name='schedule', request_method='GET', renderer='json',
+             permission='view')
+def schedule(request):
+    loan = get_loan(request, request.matchdict['loan_id'])
+    
+    return {'installment': loan.installment,
+            'schedule': amortization.schedule(loan.amount, loan.term,
+                                              loan.rate, loan.installment)}
+
+
+@view_config(route_name='quotes', request_method='POST', renderer='json',
+             permission='view')
+def quotes(request):
+    try:
+        items = quote_schema.deserialize(request.json_body)
+    except ValueError:
+        set_error(request, 400, 'invalid_json')
+        return {'error': 'Invalid JSON.'}
+    except colander.Invalid as e:
+        set_error(request, 400, 'invalid_fields')
+        return e.asdict()
+
+    lengths = [len(items[name]) for name in ('amount', 'term', 'rate')]
+    if items['grid']:
+        count = lengths[0] * lengths[1] * lengths[2]
+    else:
+        # the parameters are zipped, repeating those given once
+        count = max(lengths)
+        if any(length not in (1, count) for length in lengths):
+            set_error(request, 400, 'mismatched_lengths')
+            return {'error': 'Amount, term and rate must have the same '
+                    'length.'}
+
+    if count > MAX_QUOTES:
+        set_error(request, 400, 'too_many_quotes')
+        return {'error': 'Too many quotes, must be at most {}.'.format(
+            MAX_QUOTES)}
+
+    try:
+        amounts, terms, rates, installments = amortization.quotes(
+            items['amount'], items['term'], items['rate'], items['grid'])
+    except ValueError:
+        set_error(request, 400, 'mismatched_lengths')
+        return {'error': 'Amount, term and rate must have the same length.'}
+
+    return {'quotes': [
+        {'amount': amount, 'term': term, 'rate': rate,
+         'installment': installment}
+        for amount, term, rate, installment in zip(
+            amounts.tolist(), terms.tolist(), rates.tolist(),
+            installments.tolist())]}
+
+
+@view_config(route_name='portfolio_balance', request_method='GET',
+             renderer='json', permission='view')
+def portfolio_balance(request):
+    try:
+        items = balance_schema.deserialize(request.GET)
+    except colander.Invalid as e:
+        set_error(request, 400, 'invalid_fields')
+        return e.asdict()
+
+    date = items['date'].date()
+    value, volume = Loan.outstanding_debt(request.dbsession, date)
+
+    return {'date': date.isoformat(), 'value': value, 'volume': volume}
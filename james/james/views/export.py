@@ -0,0 +1,85 @@
+from datetime import date as Date
+import json
+
+import colander
+from pyramid.response import Response
+from pyramid.view import view_config
+
+from james.models import Loan
+from james.views.default import set_error
+from james.views.schemas import export_schema
+
+# Rows fetched from the database cursor, and written to the response, at a
+# time.
+YIELD_PER = 1000
+
+COLUMNS = ('loan_id', 'amount', 'term', 'rate', 'date', 'installment',
+           'balance')
+
+CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def format_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict((column, format_value(getattr(row, column)))
+                              for column in COLUMNS)) + '\n'
+
+
+def csv_lines(rows):
+    # loan ids, numbers and dates never need quoting
+    yield ','.join(COLUMNS) + '\n'
+    for row in rows:
+        yield ','.join(str(format_value(getattr(row, column)))
+                       for column in COLUMNS) + '\n'
+
+
+def export_rows(session_factory, date):
+    """
+    Yield the rows of ``Loan.export_query`` from a cursor of a session of
+    its own, since the request's is closed by then, ``YIELD_PER`` at a time.
+
+    """
+    dbsession = session_factory()
+    try:
+        query = Loan.export_query(dbsession, date).execution_options(
+            stream_results=True).yield_per(YIELD_PER)
+        for row in query:
+            yield row
+    finally:
+        dbsession.close()
+
+
+def chunked(lines, size=YIELD_PER):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == size:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+    if chunk:
+        yield ''.join(chunk).encode('utf-8')
+
+
+@view_config(route_name='export_loans', request_method='GET',
+             renderer='json', permission='view')
+def export_loans(request):
+    try:
+        items = export_schema.deserialize(request.GET)
+    except colander.Invalid as e:
+        set_error(request, 400, 'invalid_fields')
+        return e.asdict()
+
+    date = items['date'] or Date.today()
+    lines = ndjson_lines if items['format'] == 'ndjson' else csv_lines
+    rows = export_rows(request.registry['dbsession_factory'], date)
+
+    response = Response(
+        app_iter=chunked(lines(rows)),
+        content_type=CONTENT_TYPES[items['format']])
+    response.content_disposition = 'attachment; filename=loans-{}.{}'.format(
+        date.isoformat(), items['format'])
+    return response
@@ -4,10 +4,12 @@ from pyramid.view import forbidden_view_config, notfound_view_config
 @notfound_view_config(renderer='json')
 def notfound_view(request):
     request.response.status = 404
+    request.environ.setdefault('james.error', 'not_found')
     return {}
 
 
 @forbidden_view_config(renderer='json')
 def forbidden_view(request):
     request.response.status = 403
+    request.environ.setdefault('james.error', 'forbidden')
     return {}
@@ -0,0 +1,16 @@
+from pyramid.response import Response
+from pyramid.view import view_config
+
+from james import prometheus
+
+
+@view_config(route_name='metrics', request_method='GET', permission='view')
+def metrics(request):
+    return Response(prometheus.render(request.registry).encode('utf-8'),
+                    content_type=prometheus.CONTENT_TYPE)
+
+
+@view_config(route_name='request_metrics', request_method='GET',
+             renderer='json', permission='view')
+def request_metrics(request):
+    return {'routes': request.registry['metrics'].as_dict()}
@@ -0,0 +1,106 @@
+import colander
+
+from james.views.validators import NumberGreaterThanZero, WholeCents
+
+
+class CreateLoanSchema(colander.MappingSchema):
+    amount = colander.SchemaNode(colander.Float(),
+        validator=NumberGreaterThanZero(), type='float')
+    term = colander.SchemaNode(colander.Integer(),
+        validator=NumberGreaterThanZero(), type='int')
+    rate = colander.SchemaNode(colander.Float(),
+        validator=NumberGreaterThanZero(), type='float')
+    date = colander.SchemaNode(colander.DateTime(), type='datetime')
+
+
+class CreatePaymentSchema(colander.MappingSchema):
+    payment = colander.SchemaNode(colander.String(), type='str',
+        validator=colander.OneOf(['made', 'missed']))
+    date = colander.SchemaNode(colander.DateTime(), type='datetime')
+    amount = colander.SchemaNode(colander.Float(),
+        validator=colander.All(NumberGreaterThanZero(), WholeCents()),
+        type='float')
+
+
+class BalanceSchema(colander.MappingSchema):
+    date = colander.SchemaNode(colander.DateTime(), type='datetime')
+
+
+class BalanceSeriesSchema(colander.MappingSchema):
+    from_ = colander.SchemaNode(colander.Date(), name='from', missing=None)
+    to = colander.SchemaNode(colander.Date(), missing=None)
+    step = colander.SchemaNode(colander.String(), missing='month',
+        validator=colander.OneOf(['day', 'week', 'month']))
+
+
+class ListLoansSchema(colander.MappingSchema):
+    from_ = colander.SchemaNode(colander.Date(), name='from', missing=None)
+    to = colander.SchemaNode(colander.Date(), missing=None)
+    term = colander.SchemaNode(colander.Integer(), missing=None,
+        validator=NumberGreaterThanZero())
+    rate = colander.SchemaNode(colander.Float(), missing=None,
+        validator=NumberGreaterThanZero())
+    limit = colander.SchemaNode(colander.Integer(), missing=100,
+        validator=colander.Range(min=1, max=1000))
+    cursor = colander.SchemaNode(colander.String(), missing=None)
+
+
+class ExportSchema(colander.MappingSchema):
+    date = colander.SchemaNode(colander.Date(), missing=None)
+    format = colander.SchemaNode(colander.String(), missing='ndjson',
+        validator=colander.OneOf(['ndjson', 'csv']))
+
+
+class QuoteSchema(colander.MappingSchema):
+    amount = colander.SchemaNode(colander.Sequence(accept_scalar=True),
+        colander.SchemaNode(colander.Float(),
+                            validator=NumberGreaterThanZero()),
+        validator=colander.Length(min=1))
+    term = colander.SchemaNode(colander.Sequence(accept_scalar=True),
+        colander.SchemaNode(colander.Integer(),
+                            validator=NumberGreaterThanZero()),
+        validator=colander.Length(min=1))
+    rate = colander.SchemaNode(colander.Sequence(accept_scalar=True),
+        colander.SchemaNode(colander.Float(),
+                            validator=NumberGreaterThanZero()),
+        validator=colander.Length(min=1))
+    grid = colander.SchemaNode(colander.Boolean(), missing=False)
+
+
+class CreatePaymentsSchema(CreatePaymentSchema):
+    loan_id = colander.SchemaNode(colander.String(), type='str')
+
+
+# Schemas hold no state once built, so they are built once, here, and shared
+# by every request.
+create_loan_schema = CreateLoanSchema()
+create_payment_schema = CreatePaymentSchema()
+create_payments_schema = CreatePaymentsSchema()
+balance_schema = BalanceSchema()
+balance_series_schema = BalanceSeriesSchema()
+export_schema = ExportSchema()
+list_loans_schema = ListLoansSchema()
+quote_schema = QuoteSchema()
+
+
+def validate(schema, data):
+    """
+    Deserialize ``data`` with ``schema``, returning ``(items, None)`` or, if
+    it is invalid, ``(None, errors)`` with a dict of the error of each field.
+
+    """
+    try:
+        return schema.deserialize(data), None
+    except colander.Invalid as e:
+        return None, e.asdict()
+
+
+def validate_many(schema, records):
+    """
+    Validate every one of ``records`` with ``schema``, returning a list of
+    ``(items, errors)`` pairs in the same order. ``None`` records, the lines
+    of a batch that are not valid JSON, are reported as such.
+
+    """
+    return [validate(schema, record) if record is not None
+            else (None, 'Invalid JSON.') for record in records]
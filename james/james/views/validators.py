@@ -5,3 +5,11 @@ class NumberGreaterThanZero(object):
     def __call__(self, node, value):
         if value <= 0:
             raise colander.Invalid(node, "Value must be greater than zero")
+
+
+class WholeCents(object):
+    def __call__(self, node, value):
+        # the shortest decimal form of value has at most two decimals
+        if round(value, 2) != value:
+            raise colander.Invalid(node,
+                                   "Value must be a whole number of cents")
@@ -0,0 +1,271 @@
+"""
+Optional write pipeline, enabled by the ``writes.queue.enabled`` setting.
+
+Instead of committing their own transaction, ``add_loan`` and
+``add_payment`` hand their validated inserts to a single writer thread,
+which commits the writes of many requests together: whenever
+``writes.queue.max_rows`` writes are waiting or ``writes.queue.max_delay``
+milliseconds after the first of them. On SQLite this turns one fsync per
+request into one per group, and leaves a single connection writing.
+
+A request waits ``writes.queue.timeout`` seconds at most for its write, then
+gets a ``WriteError``, and so does every write left in the queue by a writer
+thread that died, which is started again by the next write.
+
+"""
+import atexit
+import logging
+import threading
+import time
+
+try:
+    from Queue import Empty, Queue
+except ImportError:  # Python 3
+    from queue import Empty, Queue
+
+from pyramid.settings import asbool
+from sqlalchemy.exc import IntegrityError
+import transaction
+
+from james import get_from_env_or_settings
+from james.batch import insert_loans, insert_payments
+from james.models import get_tm_session
+
+log = logging.getLogger(__name__)
+
+DUPLICATED_PAYMENT = {'error': 'Duplicated payment.'}
+
+
+class WriteError(Exception):
+    """ A write that the writer thread did not commit, or not in time. """
+
+
+class Write(object):
+    """ A write waiting in the queue for its result. """
+
+    def __init__(self, kind, items):
+        self.kind = kind
+        self.items = items
+        self.result = None
+        self.error = None
+        self.claimed = False
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def set(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done.set()
+
+    def claim(self):
+        """ Take the write for the writer thread, unless it already failed. """
+        with self.lock:
+            if self.done.is_set():
+                return False
+            self.claimed = True
+            return True
+
+    def fail(self, error):
+        """ Fail the write with ``error``, unless the writer took it. """
+        with self.lock:
+            if self.claimed or self.done.is_set():
+                return False
+            self.set(error=error)
+            return True
+
+    def wait(self, timeout=None):
+        """
+        Return the result of the write or raise its error, or a
+        ``WriteError`` after ``timeout`` seconds: the writer then skips the
+        write, unless it is already committing it.
+
+        """
+        if not self.done.wait(timeout):
+            if not self.fail(WriteError('Write timed out.')):
+                with self.lock:
+                    if not self.done.is_set():
+                        raise WriteError('Write timed out while committing.')
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class WriteQueue(object):
+    """
+    Queue of loans and payments to insert, committed in groups of at most
+    ``max_rows`` writes by a writer thread with sessions of
+    ``session_factory``.
+
+    Every write gets the result it would have got on its own: if committing
+    a group fails, its writes are committed again one at a time, and only
+    those that fail get the error, a duplicated payment as such. Writes that
+    are not committed within ``timeout`` seconds fail with a ``WriteError``.
+
+    """
+
+    def __init__(self, session_factory, max_rows=100, max_delay=0.005,
+                 timeout=10):
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.queue = Queue()
+        self.manager = transaction.TransactionManager(explicit=True)
+        self.lock = threading.Lock()
+        self.closed = False
+        self.group = []
+        self.start()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='james-writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add_loan(self, items):
+        """ Insert the validated loan ``items``, see ``insert_loans``. """
+        return self.submit(Write('loan', items))
+
+    def add_payment(self, items):
+        """
+        Insert the validated payment ``items``, which include the
+        ``loan_id`` of its loan, see ``insert_payments``.
+
+        """
+        return self.submit(Write('payment', items))
+
+    def submit(self, write):
+        self.check()
+        self.queue.put(write)
+        try:
+            return write.wait(self.timeout)
+        except WriteError:
+            self.check()
+            raise
+
+    def check(self):
+        """
+        Start the writer thread again if it died, failing the writes it left
+        in the queue.
+
+        """
+        with self.lock:
+            if self.closed:
+                raise WriteError('The write queue is closed.')
+            if self.thread.is_alive():
+                return
+            log.error('The writer thread died, starting it again.')
+            error = WriteError('The writer thread died.')
+            while True:
+                try:
+                    write = self.queue.get_nowait()
+                except Empty:
+                    break
+                if write is not None:
+                    write.fail(error)
+            self.start()
+
+    def close(self):
+        """ Commit the writes already queued and stop the writer thread. """
+        with self.lock:
+            self.closed = True
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def run(self):
+        try:
+            self.serve()
+        except BaseException:
+            log.exception('The writer thread failed.')
+            error = WriteError('The writer thread died.')
+            for write in self.group:
+                if not write.done.is_set():
+                    write.set(error=error)
+            raise
+
+    def serve(self):
+        """ Commit the queued writes by group until ``None`` is queued. """
+        while True:
+            group = [self.queue.get()]
+            deadline = time.time() + self.max_delay
+
+            while group[-1] is not None and len(group) < self.max_rows:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    group.append(self.queue.get(timeout=timeout))
+                except Empty:
+                    break
+
+            closed = group[-1] is None
+            if closed:
+                group.pop()
+            # the writes that timed out are left out
+            self.group = [write for write in group if write.claim()]
+            if self.group:
+                self.write(self.group)
+            if closed:
+                return
+
+    def write(self, group):
+        try:
+            results = self.commit(group)
+        except Exception:
+            for write in group:
+                try:
+                    write.set(self.commit([write])[0])
+                except IntegrityError as e:
+                    if write.kind == 'payment':
+                        # a payment for the same month was committed since
+                        write.set(DUPLICATED_PAYMENT)
+                    else:
+                        write.set(error=e)
+                except Exception as e:
+                    write.set(error=e)
+        else:
+            for write, result in zip(group, results):
+                write.set(result)
+
+    def commit(self, group):
+        """
+        Insert the writes of ``group`` in one transaction, returning their
+        results in order.
+
+        """
+        loans = [write for write in group if write.kind == 'loan']
+        payments = [write for write in group if write.kind == 'payment']
+
+        with self.manager:
+            dbsession = get_tm_session(self.session_factory, self.manager)
+            results = dict(zip(loans, insert_loans(
+                dbsession, [write.items for write in loans])))
+            results.update(zip(payments, insert_payments(
+                dbsession, [write.items for write in payments])[0]))
+
+        return [results[write] for write in group]
+
+
+def includeme(config):
+    """
+    Set up the ``write_queue`` of the registry if ``writes.queue.enabled``,
+    with the ``writes.queue.max_rows``, ``writes.queue.max_delay`` (in
+    milliseconds) and ``writes.queue.timeout`` (in seconds) settings.
+
+    """
+    settings = config.get_settings()
+
+    def setting(name, default):
+        value = get_from_env_or_settings('writes.queue.' + name, settings)
+        return default if value is None else value
+
+    if not asbool(setting('enabled', False)):
+        config.registry['write_queue'] = None
+        return
+
+    queue = WriteQueue(config.registry['dbsession_factory'],
+                       max_rows=int(setting('max_rows', 100)),
+                       max_delay=float(setting('max_delay', 5)) / 1000,
+                       timeout=float(setting('timeout', 10)))
+    atexit.register(queue.close)
+    config.registry['write_queue'] = queue
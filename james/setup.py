@@ -9,7 +9,9 @@ with open(os.path.join(here, 'CHANGES.txt')) as f:
     CHANGES = f.read()
 
 requires = [
+    'alembic',
     'colander',
+    'numpy',
     'plaster_pastedeploy',
     'pyramid >= 1.9a',
     'pyramid_debugtoolbar',
@@ -23,6 +25,13 @@ requires = [
     'waitress',
 ]
 
+# serving through james.asgi, on Python 3.6+
+asgi_require = [
+    'SQLAlchemy >= 1.4',
+    'aiosqlite',
+    'uvicorn',
+]
+
 tests_require = [
     'WebTest >= 1.3.1',  # py3 compat
     'pytest',
@@ -44,11 +53,12 @@ setup(
     author_email='',
     url='',
     keywords='web pyramid pylons',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     include_package_data=True,
     zip_safe=False,
     extras_require={
         'testing': tests_require,
+        'asgi': asgi_require,
     },
     install_requires=requires,
     entry_points={
@@ -57,6 +67,9 @@ setup(
         ],
         'console_scripts': [
             'initialize_james_db = james.scripts.initializedb:main',
+            'import_james_payments = james.scripts.importpayments:main',
+            'reconcile_james_loans = james.scripts.reconcileloans:main',
+            'serve_james = james.scripts.serve:main',
         ],
     },
 )